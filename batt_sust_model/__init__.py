@@ -0,0 +1,24 @@
+import importlib
+
+_submodules = [
+    "battery_cost",
+    "battery_design",
+    "battery_emissions",
+    "cost_projection",
+    "cost_uncertainty",
+    "data_cache",
+    "import_benchmark",
+    "scaling_solver",
+    "sparse_tensor",
+]
+
+
+def __getattr__(name):
+    """Submodules are imported on first use (e.g. batt_sust_model.battery_cost)"""
+    if name in _submodules:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + _submodules)
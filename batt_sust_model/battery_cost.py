@@ -1,34 +1,18 @@
 from pathlib import Path
+import pickle
 import pandas as pd
 import re
+import ast
+import functools
+import threading
+from types import MappingProxyType
 import numpy as np
-from tqdm import tqdm
 import time
 
-# Load default cost data
-rel_path = "data/default_manufacturing_cost_parameters.xlsx"
-parent = Path(__file__).parents[0]
-workbook = pd.ExcelFile(parent / rel_path)
-p_values_material = pd.read_excel(workbook, sheet_name="p_values_materials", index_col=0)["p_value"]
-p_values_process = pd.read_excel(workbook, sheet_name="p_values_process", index_col=0).T
-manuf_rate_base = pd.read_excel(workbook, sheet_name="default_manufacturing_rates", index_col=0).iloc[:, 0].to_dict()
-base_factors = pd.read_excel(workbook, sheet_name="baseline_factors", index_col=0).T.drop("unit", axis=1)
-volume_ratio_mapping = pd.read_excel(workbook, sheet_name="volume_ratio_mapping", index_col=0).iloc[:, 0].to_dict()
-process_mapping = (
-    pd.read_excel(workbook, sheet_name="process_mapping", index_col=0).loc[:, "foreground process"].to_dict()
-)
-cost_rates = pd.read_excel(workbook, sheet_name="cost_rates", index_col=0).loc[:, "value"].to_dict()
-variable_overhead_labor = cost_rates["variable_overhead_labor"]
-GSA_labour = cost_rates["GSA_labour"]
-pack_profit = cost_rates["pack_profit"]
-launch_cost_labor = cost_rates["launch_cost_labor"]
-launch_cost_material = cost_rates["launch_cost_material"]
-working_capital = cost_rates["working_capital"]
-battery_warranty_costs = cost_rates["battery_warranty_costs"]
-variable_overhead_depreciation = cost_rates["variable_overhead_depreciation"]
-GSA_depreciation = cost_rates["GSA_depreciation"]
-r_and_d = cost_rates["r_and_d"]
-lifetime_capital_equipment = cost_rates["lifetime_capital_equipment"]
+from . import data_cache
+
+
+default_parameter_file = Path(__file__).parents[0] / "data/default_manufacturing_cost_parameters.xlsx"
 
 
 def calculate_depreciation(lifetime_capital_equipment):
@@ -58,171 +42,29 @@ def parameter_to_brightway_name(parameter_name):
     return new_name.lower()
 
 
-def material_to_process_mapping(material, technology_matrix):
-    """Returns battery production location of material input"""
-    return_dict = {}
-    for m in material:
-        for process in technology_matrix.columns:
-            if technology_matrix.loc[m, process] < 0:
-                return_dict[m] = process
-    return return_dict
-
-
-def material_cost_matrix(
-    technology_matrix,
-    price_material_mass,
-    price_material_unit,
-    system_design_parameters,
-    run_multiple=False,
-    process_columns=None,
-    material_rows=None,
-    disable_tqdm=False,
-    unit_material_to_process_mapping=None,
-    overhead_multiplier=None,
-):
-    """Calculates the unit and mass cost of externally sourced materials for battery production
-
-    Parameters
-    ----------
-    technology_matrix : df
-        Technology matrix
-    price_material_mass : df
-        Mass prices of materials/energy
-    price_material_unit : dict
-        Unit prices of materials
-    system_design_parameters : dict
-        Battery design parameters, including process design
-    run_multiple : bool, optional
-        To calculate several designs, by default False
-    process_columns : _type_, optional
-        Process column order , by default None
-    material_rows : _type_, optional
-        Material/energy index order, by default None
-    disable_tqdm : bool, optional
-        Hides tqdm, by default False
-    unit_material_to_process_mapping : _type_, optional
-        To increase speed up when calculating several design, by default None
-    overhead_multiplier : float, optional
-        Changes the material overhead multiplier, by default None
-
-    Returns
-    -------
-    DataFrame/NP array
-        process cost matrix of externally sourced materials
+class _DesignArrays:
+    """Design parameters of several designs, returns the array of a parameter value over all designs"""
 
-    Raises
-    ------
-    ValueError
-        _description_
-    """
-    # import default parameters:
-    if run_multiple == False:
-        sd_param = {}
-        sd_param[0] = system_design_parameters
-        disable_tqdm = True
-        unit_material_to_process_mapping = material_to_process_mapping(price_material_unit.keys(), technology_matrix)
-    if run_multiple == True:
-        if process_columns == None or material_rows == None:
-            raise ValueError("The process_columns and material_rows parameters are not defined!")
-        sd_param = system_design_parameters
-        nested_C_matrix = np.zeros((len(sd_param.keys()), technology_matrix.shape[1], technology_matrix.shape[2]))
-        if disable_tqdm != False:
-            disable_tqdm = True
-        # if unit_material_to_process_mapping == None:
-        unit_material_to_process_mapping = material_to_process_mapping(
-            price_material_unit.keys(), pd.DataFrame(technology_matrix[0], material_rows, process_columns)
-        )
-    if overhead_multiplier == None:
-        overhead_multiplier = material_overhead_multiplier()
-    internal_processes = list(set(process_mapping.values()))
+    def __init__(self, designs):
+        self.designs = list(designs)
+        self._arrays = {}
 
-    for idx, design in tqdm(enumerate(sd_param.values()), total=len(sd_param), disable=disable_tqdm):
-        if run_multiple == True:
-            technology_matrix_temp = pd.DataFrame(technology_matrix[idx], columns=process_columns, index=material_rows)
-        if run_multiple == False:
-            technology_matrix_temp = technology_matrix
+    def __getitem__(self, parameter):
+        if parameter not in self._arrays:
+            self._arrays[parameter] = np.array([design[parameter] for design in self.designs], dtype=float)
+        return self._arrays[parameter]
 
-        unit_cost_dict = battery_material_cost_unit(price_material_unit, design)
-        monetary_matrix = battery_material_cost_mass(technology_matrix_temp, price_material_mass)
+    def __len__(self):
+        return len(self.designs)
 
-        # Set all internal process to zero
 
-        monetary_matrix[internal_processes] = 0
-        # set price of battery jacket production to zero :
-        monetary_matrix.loc[:, "battery jacket production"] = 0
-        # Material unit costs are attributed to the receiving battery production process:
-        materials = unit_material_to_process_mapping.keys()
-        processes = list(set(unit_material_to_process_mapping.values()))
-
-        monetary_matrix.loc[materials, processes] = (
-            (abs(technology_matrix_temp.loc[materials, processes])).T * (pd.Series(unit_cost_dict))
-        ).T
-
-        # Append unit cost with P values (for scale of unit cost) to monetary A matrix:
-        process_rate = modelled_process_rates(design)
-
-        cell_materials = [
-            "cell terminal anode",
-            "cell terminal cathode",
-            "cell container",
-        ]
-        module_materials = [
-            "cell group interconnect",
-            "module polymer panels",
-            "module terminal",
-            "module container",
-            "gas release",
-        ]
-        pack_materials = [
-            "cooling connectors",
-            "cooling mains Fe",
-            "pack terminals",
-        ]
-        monetary_matrix.loc[cell_materials, internal_processes] *= (
-            manuf_rate_base["baseline_total_cell"] / process_rate["total_cell"]
-        ) ** (1 - p_values_material["material_exponent"])
-
-        monetary_matrix.loc[module_materials, internal_processes] *= (
-            manuf_rate_base["baseline_total_modules"] / process_rate["total_modules"]
-        ) ** (1 - p_values_material["material_exponent"])
-
-        monetary_matrix.loc[pack_materials, internal_processes] *= (
-            manuf_rate_base["baseline_total_packs"] / process_rate["total_packs"]
-        ) ** (1 - p_values_material["material_exponent"])
-
-        monetary_matrix.loc[["battery jacket Al", "battery jacket Fe"], :] *= (
-            manuf_rate_base["baseline_total_packs"] / process_rate["total_packs"]
-        ) ** (1 - p_values_material["material_exponent"])
-
-        monetary_matrix.loc["module thermal conductor", internal_processes] *= (
-            manuf_rate_base["baseline_required_cell"] / process_rate["required_cell"]
-        ) ** (1 - p_values_material["material_exponent"])
-
-        monetary_matrix.loc["cell group interconnect", internal_processes] *= (
-            manuf_rate_base["baseline_modules_cell_interconnects"] / process_rate["modules_cell_interconnects"]
-        ) ** (1 - p_values_material["material_exponent"])
-
-        monetary_matrix.loc["module interconnects", internal_processes] *= (
-            manuf_rate_base["baseline_total_modules"] / process_rate["total_modules"]
-        ) ** (1 - p_values_material["material_exponent"])
-
-        monetary_matrix.loc["module row rack", internal_processes] *= (
-            process_rate["total_row_racks"] / manuf_rate_base["baseline_row_racks"]
-        ) ** (1 - p_values_material["material_exponent"]) * design["rows_of_modules"]
-
-        monetary_matrix.loc["cooling panels", internal_processes] *= (
-            process_rate["total_row_racks"] / manuf_rate_base["baseline_row_racks"]
-        ) ** (1 - p_values_material["material_exponent"])
-
-        #  Multiplier for basic cost to overhead:
-        monetary_matrix *= overhead_multiplier
-
-        if run_multiple == False:
-            return monetary_matrix
-        else:
-            nested_C_matrix[idx] = monetary_matrix
-
-    return nested_C_matrix
+def material_to_process_mapping(material, technology_matrix):
+    """Returns battery production location of material input (last process with a negative technology matrix entry)"""
+    material = list(material)
+    inputs = technology_matrix.loc[material].values < 0
+    last_input = inputs.shape[1] - 1 - np.argmax(inputs[:, ::-1], axis=1)
+    columns = technology_matrix.columns
+    return {m: columns[idx] for m, idx, found in zip(material, last_input, inputs.any(axis=1)) if found}
 
 
 def battery_material_cost_mass(technology_matrix, price_material_mass):
@@ -283,6 +125,136 @@ def battery_material_cost_unit(price_material_unit, design_parameters):
     return unit_cost_dict
 
 
+def compile_unit_prices(price_material_unit, materials=None):
+    """Dense unit price table (material*design parameter) of the unit prices, to calculate the unit costs of all designs
+    at once with battery_material_cost_unit_array
+
+    The module electronics unit cost is multiplied by the modules per pack after each additional parameter, as in
+    battery_material_cost_unit, this is the modules per pack exponent of each price.
+
+    Parameters
+    ----------
+    price_material_unit : dict
+        cost of materials per unit
+    materials : list, optional
+        Materials (rows) of the table, by default all materials of price_material_unit
+
+    Returns
+    -------
+    dict
+        materials, design parameters, prices (material*parameter), modules per pack exponents (material*parameter) and
+        the material weight parameters
+    """
+    if materials is None:
+        materials = list(price_material_unit.keys())
+    parameters = list(dict.fromkeys(parameter for m in materials for parameter in price_material_unit.get(m, {})))
+    column = {parameter: idx for idx, parameter in enumerate(parameters)}
+    prices = np.zeros((len(materials), len(parameters)))
+    modules_exponent = np.zeros((len(materials), len(parameters)))
+    for idx, material in enumerate(materials):
+        unit_prices = price_material_unit.get(material, {})
+        for position, (parameter, value) in enumerate(unit_prices.items()):
+            prices[idx, column[parameter]] = value
+            if material == "module electronics":
+                modules_exponent[idx, column[parameter]] = len(unit_prices) - max(position, 1)
+    return {
+        "materials": materials,
+        "parameters": parameters,
+        "prices": prices,
+        "modules_exponent": modules_exponent,
+        "weight_parameters": [parameter_to_brightway_name(material) for material in materials],
+    }
+
+
+def _unit_price_terms(unit_prices, designs):
+    """Design parameter values (design*parameter), material weights (design*material) and modules per pack of the
+    unit cost"""
+    values = np.zeros((len(designs), len(unit_prices["parameters"])))
+    for idx, parameter in enumerate(unit_prices["parameters"]):
+        values[:, idx] = designs[parameter]
+    weights = np.zeros((len(designs), len(unit_prices["materials"])))
+    for idx, parameter in enumerate(unit_prices["weight_parameters"]):
+        weights[:, idx] = designs[parameter]
+    modules = designs["modules_per_pack"] if unit_prices["modules_exponent"].any() else None
+    return values, weights, modules
+
+
+def battery_material_cost_unit_array(unit_prices, designs):
+    """Unit cost of battery materials per kg material of all designs, as battery_material_cost_unit
+
+    Parameters
+    ----------
+    unit_prices : dict
+        Unit price table of compile_unit_prices
+    designs : list
+        battery design parameters of each design
+
+    Returns
+    -------
+    Numpy array
+        unit cost (design*material), NaN if the material weight of a design is zero
+    """
+    if not isinstance(designs, _DesignArrays):
+        designs = _DesignArrays(designs)
+    values, weights, modules = _unit_price_terms(unit_prices, designs)
+    prices = unit_prices["prices"]
+    modules_exponent = unit_prices["modules_exponent"]
+    unit_cost = np.zeros(weights.shape)
+    for exponent in np.unique(modules_exponent):
+        cost = values @ np.where(modules_exponent == exponent, prices, 0).T
+        if exponent:
+            cost *= modules[:, None] ** exponent
+        unit_cost += cost
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(weights > 0, unit_cost / weights, np.nan)
+
+
+def unit_cost_coefficients(price_material_unit, designs, materials):
+    """Unit cost of the materials per unit price entry, the unit cost is linear in the unit prices
+
+    Parameters
+    ----------
+    price_material_unit : dict
+        Unit prices of materials, only the materials and parameters are used
+    designs : list
+        Battery design parameters of each design
+    materials : list
+        Unit cost materials
+
+    Returns
+    -------
+    list, Numpy array
+        Unit price entries (material, parameter) and the unit cost per unit price (design*material*entry)
+    """
+    if not isinstance(designs, _DesignArrays):
+        designs = _DesignArrays(designs)
+    entries = [(material, parameter) for material, v in price_material_unit.items() for parameter in v]
+    unit_prices = compile_unit_prices(price_material_unit, materials)
+    values, weights, modules = _unit_price_terms(unit_prices, designs)
+    row = {material: idx for idx, material in enumerate(materials)}
+    column = {parameter: idx for idx, parameter in enumerate(unit_prices["parameters"])}
+    coefficients = np.zeros((len(designs), len(materials), len(entries)))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for idx, (material, parameter) in enumerate(entries):
+            if material not in row:
+                continue
+            m, q = row[material], column[parameter]
+            coefficient = values[:, q] / weights[:, m]
+            if unit_prices["modules_exponent"][m, q]:
+                coefficient = coefficient * modules ** unit_prices["modules_exponent"][m, q]
+            coefficients[:, m, idx] = np.where(weights[:, m] > 0, coefficient, 0)
+    return entries, coefficients
+
+
+def _capacity_ratio(capacities, capacity):
+    """Manufacturing capacities (design*capacity) relative to the design capacity, capacities of all designs or per
+    design"""
+    capacities = np.asarray(capacities, dtype=float)
+    if capacities.ndim == 1:
+        capacities = capacities[None, :]
+    return capacities / capacity[:, None]
+
+
 def modelled_process_rates(design_param):
     """Annual modelled processing rate of battery production used to calculate the P values
 
@@ -323,198 +295,2057 @@ def modelled_process_rates(design_param):
     return modelled_processing_rate_dict
 
 
-def labour_overhead_multiplier():
-    """The factor cost overhead multiplier for direct labour. Function and parameters are based on BatPaC V5."""
-    a = (
+def overhead_multipliers(cost_rates):
+    """Overhead multipliers of the factor costs (labour, capital, land) and materials as function of the cost rates.
+    Function and parameters are based on BatPaC V5.
+
+    Parameters
+    ----------
+    cost_rates : dict
+        Overhead cost rates (e.g. pack_profit, working_capital, lifetime_capital_equipment)
+
+    Returns
+    -------
+    dict
+        Overhead multiplier of labour, capital, land and material
+    """
+    variable_overhead_labor = cost_rates["variable_overhead_labor"]
+    GSA_labour = cost_rates["GSA_labour"]
+    pack_profit = cost_rates["pack_profit"]
+    launch_cost_labor = cost_rates["launch_cost_labor"]
+    launch_cost_material = cost_rates["launch_cost_material"]
+    working_capital = cost_rates["working_capital"]
+    battery_warranty_costs = cost_rates["battery_warranty_costs"]
+    variable_overhead_depreciation = cost_rates["variable_overhead_depreciation"]
+    GSA_depreciation = cost_rates["GSA_depreciation"]
+    r_and_d = cost_rates["r_and_d"]
+    depreciation_capital_equipment, deprecation_building_investment = calculate_depreciation(
+        cost_rates["lifetime_capital_equipment"]
+    )
+
+    labour = (
         1
         + variable_overhead_labor
         + GSA_labour * (1 + variable_overhead_labor)
         + pack_profit
         * (launch_cost_labor * (1 + variable_overhead_labor) + working_capital * (1 + variable_overhead_labor))
     )
-    return a * (1 + battery_warranty_costs)
-
-
-def capital_overhead_multiplier():
-    """The factor cost overhead multiplier for capital equipment. Function and parameters are based on BatPaC V5."""
-    depreciation_capital_equipment = calculate_depreciation(cost_rates["lifetime_capital_equipment"])[0]
-
     a = variable_overhead_depreciation + GSA_depreciation + GSA_labour * variable_overhead_depreciation + r_and_d + 1
-    b = 1 + variable_overhead_depreciation * (launch_cost_labor + working_capital) * depreciation_capital_equipment
-    return (a * depreciation_capital_equipment + b * pack_profit) * (1 + battery_warranty_costs)
+    launch_working_capital = variable_overhead_depreciation * (launch_cost_labor + working_capital)
+    b_capital = 1 + launch_working_capital * depreciation_capital_equipment
+    b_land = 1 + launch_working_capital * deprecation_building_investment
+    return {
+        "labour": labour * (1 + battery_warranty_costs),
+        "capital": (a * depreciation_capital_equipment + b_capital * pack_profit) * (1 + battery_warranty_costs),
+        "land": (a * deprecation_building_investment + b_land * pack_profit) * (1 + battery_warranty_costs),
+        "material": (1 + pack_profit * (launch_cost_material + working_capital)) * (1 + battery_warranty_costs),
+    }
 
 
-def land_overhead_multiplier():
-    """The factor cost overhead multiplier for capital equipment. Function and parameters are based on BatPaC V5."""
-    deprecation_building_investment = calculate_depreciation(cost_rates["lifetime_capital_equipment"])[1]
-    a = variable_overhead_depreciation + GSA_depreciation + GSA_labour * variable_overhead_depreciation + r_and_d + 1
-    b = 1 + variable_overhead_depreciation * (launch_cost_labor + working_capital) * deprecation_building_investment
-    return (a * deprecation_building_investment + b * pack_profit) * (1 + battery_warranty_costs)
+def production_volume_ratio(volume_ratio_mapping, process_rates, parameter_dict):
+    """Calculate the volume ratio of specific battery design as in BatPaC;
+    volume/baseline number
 
+    Args: volume_ratio_mapping (dict): formula per process as string or compiled with compile_formula
+        process_rates (dict): modelled and baseline process rates, values can be arrays of several designs
+        parameter_dict (dict): design parameters (py_cell_aging)
 
-def factor_overhead_multiplier(return_index=["labour", "capital", "land"]):
-    """Returns the factor cost overhead multiplier"""
-    land_overhead = land_overhead_multiplier()
-    labour_overhead = labour_overhead_multiplier()
-    capital_overhead = capital_overhead_multiplier()
-    multiplier_dict = {}
-    multiplier_dict["labour"] = labour_overhead
-    multiplier_dict["capital"] = capital_overhead
-    multiplier_dict["land"] = land_overhead
-    return_dictionary = {k: multiplier_dict[k] for k in return_index}
-    return return_dictionary
+    Returns: dict: volume ratio per process
+    """
+    rates = {**process_rates, "py_cell_aging": parameter_dict["py_cell_aging"]}
+    return_dict = {}
+    for x, formula in volume_ratio_mapping.items():
+        if isinstance(formula, str):
+            formula = compile_formula(formula)
+        return_dict[x] = evaluate_formula(formula, rates)
+    return return_dict
 
 
-def material_overhead_multiplier():
-    """The factor cost overhead multiplier for capital equipment. Function and parameters are based on BatPaC V5."""
-    a = launch_cost_material + working_capital
-    b = 1 + battery_warranty_costs
-    return (1 + pack_profit * a) * b
+class _Dual:
+    """Value and derivative (forward mode differentiation) used for the closed form cost sensitivities. Supports the
+    arithmetic of the volume ratio formulas and overhead multipliers on floats and arrays."""
+
+    # Numpy arrays defer to the reflected operators instead of creating object arrays of dual numbers:
+    __array_ufunc__ = None
+
+    def __init__(self, value, derivative=0.0):
+        self.value = value
+        self.derivative = derivative
+
+    @staticmethod
+    def split(x):
+        """Value and derivative of a dual number, or of a constant (derivative 0)"""
+        if isinstance(x, _Dual):
+            return x.value, x.derivative
+        return x, 0.0
+
+    def __add__(self, other):
+        value, derivative = _Dual.split(other)
+        return _Dual(self.value + value, self.derivative + derivative)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        value, derivative = _Dual.split(other)
+        return _Dual(self.value - value, self.derivative - derivative)
+
+    def __rsub__(self, other):
+        value, derivative = _Dual.split(other)
+        return _Dual(value - self.value, derivative - self.derivative)
+
+    def __mul__(self, other):
+        value, derivative = _Dual.split(other)
+        return _Dual(self.value * value, self.derivative * value + self.value * derivative)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        value, derivative = _Dual.split(other)
+        return _Dual(self.value / value, (self.derivative * value - self.value * derivative) / value**2)
+
+    def __rtruediv__(self, other):
+        value, derivative = _Dual.split(other)
+        return _Dual(value / self.value, (derivative * self.value - value * self.derivative) / self.value**2)
+
+    def __pow__(self, other):
+        value, derivative = _Dual.split(other)
+        result = self.value**value
+        log_derivative = value * self.derivative / self.value
+        if isinstance(other, _Dual):
+            log_derivative = log_derivative + derivative * np.log(self.value)
+        return _Dual(result, result * log_derivative)
+
+    def __rpow__(self, other):
+        result = other**self.value
+        return _Dual(result, result * np.log(other) * self.derivative)
+
+    def __neg__(self):
+        return _Dual(-self.value, -self.derivative)
+
+    def __pos__(self):
+        return self
+
+
+def _elementwise_select(comparison, a, b):
+    """Element wise maximum (comparison np.greater_equal) or minimum (np.less_equal) of floats, arrays or dual numbers"""
+    if not isinstance(a, _Dual) and not isinstance(b, _Dual):
+        return np.maximum(a, b) if comparison is np.greater_equal else np.minimum(a, b)
+    (value_a, derivative_a), (value_b, derivative_b) = _Dual.split(a), _Dual.split(b)
+    select = comparison(value_a, value_b)
+    return _Dual(np.where(select, value_a, value_b), np.where(select, derivative_a, derivative_b))
+
+
+# Functions allowed in the volume ratio formulas, element wise for arrays of several designs:
+formula_functions = {
+    "max": lambda *args: functools.reduce(functools.partial(_elementwise_select, np.greater_equal), args),
+    "min": lambda *args: functools.reduce(functools.partial(_elementwise_select, np.less_equal), args),
+}
+_formula_nodes = (
+    ast.Expression,
+    ast.BinOp,
+    ast.UnaryOp,
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.Pow,
+    ast.USub,
+    ast.UAdd,
+    ast.Constant,
+    ast.Name,
+    ast.Load,
+    ast.Call,
+)
 
 
-def factors_battery_production(
-    system_design_parameters,
-    run_multiple=False,
-    return_aggregated=True,
-    return_index=["labour", "capital", "land"],
-    return_columns=None,
-):
-    """Calculates the total production factor requirement (matrix F) for all production processes as in BatPaC adjusted
-    for the manufacturing capacity.
+@functools.lru_cache(maxsize=None)
+def compile_formula(formula):
+    """Parses an arithmetic formula of rate names (e.g. volume ratio mapping) once, instead of using eval.
 
-    All calculations are based on BatPaC. Factors in physical terms including including labour (hr/yr), capital
-    (US$/yr) and land (m2/yr). Default baseline parameters all based on BatPaC version 5.
+    Only numbers, rate names, +, -, *, /, ** and the max and min functions are allowed.
 
     Parameters
     ----------
-    system_design_parameters : Dict
-        battery and supply chain design parameters
-    run_multiple : bool, optional
-        to return a nested F matrix of multiple pack designs, by default False
-    return_aggregated : bool, optional
-        If false, process aggregation based on BatPaC; if True process aggregation same as LCA, by default True
+    formula : str
+        Formula, e.g. 'total_cell/baseline_total_cell'
 
     Returns
     -------
-    DataFrame if run_multiple = False, nested Numpy array if run_multiple = True.
-        Factor requirements.
+    tuple
+        Compiled code and the rate names used in the formula
 
     Raises
     ------
     ValueError
-        Error if battery manufacturing capacity is not defined
+        If the formula contains anything else than arithmetic on rate names
     """
-    global process_mapping
-    if run_multiple == False:
-        sd_param = {}
-        sd_param[0] = system_design_parameters
-        disable_tqdm = True
-    if run_multiple == True:
-        sd_param = system_design_parameters
-        if return_aggregated == False:
-            p = process_mapping.keys()
-        else:
-            p = set(process_mapping.values())
-        nested_F_matrix = np.zeros((len(sd_param.keys()), len(p_values_process.index), len(p)))
-        disable_tqdm = False
-    if return_columns != None:
-        if all(process in return_columns for process in process_mapping.values()) == False:
-            false_list = []
-            for process in process_mapping.values():
-                if process not in return_columns:
-                    false_list.append(process)
-            raise ValueError("The following processes are not defined: ", false_list)
-        process_maping_new = {}
-        for process in return_columns:
-            if process not in process_mapping.values():
+    tree = ast.parse(formula.strip(), mode="eval")
+    names = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, _formula_nodes):
+            raise ValueError(f"{type(node).__name__} is not allowed in formula: {formula}")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in formula_functions or node.keywords:
+                raise ValueError(f"Only {list(formula_functions)} functions are allowed in formula: {formula}")
+        elif isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise ValueError(f"Only numbers are allowed as constant in formula: {formula}")
+        elif isinstance(node, ast.Name) and node.id not in formula_functions:
+            names.add(node.id)
+    return compile(tree, "<formula>", "eval"), frozenset(names)
+
+
+def evaluate_formula(formula, rates):
+    """Evaluates a compiled formula for rate values (floats or arrays of several designs)"""
+    code, names = formula
+    missing = [name for name in names if name not in rates]
+    if missing:
+        raise ValueError(f"Rates not defined: {missing}")
+    return eval(code, {"__builtins__": {}, **formula_functions}, {name: rates[name] for name in names})
+
+
+class CostModel:
+    """Battery cost model of one manufacturing cost parameter file (default parameters based on BatPaC version 5).
+
+    The parameter file is loaded once, on first use, and the parameters cannot be changed afterwards. Cost models of
+    different parameter files can be used side by side, also in threads. A pickled cost model includes the loaded
+    parameters, so worker processes do not load the parameter file again.
+
+    Args:
+        parameter_file (str): path to the manufacturing cost parameter Excel file, by default the package file
+    """
+
+    def __init__(self, parameter_file=None):
+        self.parameter_file = default_parameter_file if parameter_file is None else Path(parameter_file)
+        self._parameters = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"parameter_file": self.parameter_file, "data": self._load()["data"]}
+
+    def __setstate__(self, state):
+        self.parameter_file = state["parameter_file"]
+        self._parameters = self._prepare(state["data"])
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"CostModel(parameter_file='{self.parameter_file}')"
+
+    def _load(self):
+        if self._parameters is None:
+            with self._lock:
+                if self._parameters is None:
+                    self._parameters = self._prepare(self._read_parameter_file())
+        return self._parameters
+
+    def _read_parameter_file(self):
+        sheets = data_cache.read_excel(
+            self.parameter_file,
+            sheet_name=[
+                "p_values_materials",
+                "p_values_process",
+                "default_manufacturing_rates",
+                "baseline_factors",
+                "volume_ratio_mapping",
+                "process_mapping",
+                "cost_rates",
+            ],
+            index_col=0,
+        )
+        return {
+            "p_values_material": sheets["p_values_materials"]["p_value"],
+            "p_values_process": sheets["p_values_process"].T,
+            "manuf_rate_base": sheets["default_manufacturing_rates"].iloc[:, 0].to_dict(),
+            "base_factors": sheets["baseline_factors"].T.drop("unit", axis=1).astype(float),
+            "volume_ratio_mapping": sheets["volume_ratio_mapping"].iloc[:, 0].to_dict(),
+            "process_mapping": sheets["process_mapping"].loc[:, "foreground process"].to_dict(),
+            "cost_rates": sheets["cost_rates"].loc[:, "value"].to_dict(),
+        }
+
+    @staticmethod
+    def _prepare(data):
+        """Read-only parameters, compiled volume ratio formulas and overhead multipliers of the loaded data"""
+        parameters = {k: MappingProxyType(v) if isinstance(v, dict) else v for k, v in data.items()}
+        # The volume ratio formulas are parsed and validated once:
+        parameters["volume_ratio_formulas"] = MappingProxyType(
+            {process: compile_formula(formula) for process, formula in data["volume_ratio_mapping"].items()}
+        )
+        parameters["overhead_multipliers"] = MappingProxyType(overhead_multipliers(data["cost_rates"]))
+        parameters["data"] = data
+        return parameters
+
+    @property
+    def p_values_material(self):
+        return self._load()["p_values_material"].copy()
+
+    @property
+    def p_values_process(self):
+        return self._load()["p_values_process"].copy()
+
+    @property
+    def base_factors(self):
+        return self._load()["base_factors"].copy()
+
+    @property
+    def manuf_rate_base(self):
+        return self._load()["manuf_rate_base"]
+
+    @property
+    def volume_ratio_mapping(self):
+        return self._load()["volume_ratio_mapping"]
+
+    @property
+    def process_mapping(self):
+        return self._load()["process_mapping"]
+
+    @property
+    def cost_rates(self):
+        return self._load()["cost_rates"]
+
+    def labour_overhead_multiplier(self):
+        """The factor cost overhead multiplier for direct labour. Function and parameters are based on BatPaC V5."""
+        return self._load()["overhead_multipliers"]["labour"]
+
+    def capital_overhead_multiplier(self):
+        """The factor cost overhead multiplier for capital equipment. Function and parameters are based on BatPaC V5."""
+        return self._load()["overhead_multipliers"]["capital"]
+
+    def land_overhead_multiplier(self):
+        """The factor cost overhead multiplier for land. Function and parameters are based on BatPaC V5."""
+        return self._load()["overhead_multipliers"]["land"]
+
+    def material_overhead_multiplier(self):
+        """The overhead multiplier for materials. Function and parameters are based on BatPaC V5."""
+        return self._load()["overhead_multipliers"]["material"]
+
+    def factor_overhead_multiplier(self, return_index=["labour", "capital", "land"]):
+        """Returns the factor cost overhead multiplier"""
+        multiplier_dict = self._load()["overhead_multipliers"]
+        return {k: multiplier_dict[k] for k in return_index}
+
+    def material_cost_matrix(
+        self,
+        technology_matrix,
+        price_material_mass,
+        price_material_unit,
+        system_design_parameters,
+        run_multiple=False,
+        process_columns=None,
+        material_rows=None,
+        disable_tqdm=False,
+        unit_material_to_process_mapping=None,
+        overhead_multiplier=None,
+    ):
+        """Calculates the unit and mass cost of externally sourced materials for battery production
+
+        Parameters
+        ----------
+        technology_matrix : df
+            Technology matrix, or nested technology matrix (design*material*process) as Numpy array or
+            SharedSparsityTensor if run_multiple is True
+        price_material_mass : df
+            Mass prices of materials/energy
+        price_material_unit : dict
+            Unit prices of materials
+        system_design_parameters : dict
+            Battery design parameters, including process design
+        run_multiple : bool, optional
+            To calculate several designs, by default False
+        process_columns : _type_, optional
+            Process column order , by default None
+        material_rows : _type_, optional
+            Material/energy index order, by default None
+        disable_tqdm : bool, optional
+            Not used, the unit costs of all designs are calculated at once
+        unit_material_to_process_mapping : dict, optional
+            Receiving process of the unit cost materials, by default None and based on the (first) technology matrix
+        overhead_multiplier : float, optional
+            Changes the material overhead multiplier, by default None
+
+        Returns
+        -------
+        DataFrame/NP array/SharedSparsityTensor
+            process cost matrix of externally sourced materials, all designs are calculated at once as
+            (design*material*process) array if run_multiple is True. A SharedSparsityTensor technology matrix gives a
+            SharedSparsityTensor cost matrix with the same sparsity pattern
+
+        Raises
+        ------
+        ValueError
+            If process_columns or material_rows are not defined when run_multiple is True
+        """
+        from .sparse_tensor import SharedSparsityTensor
+
+        if run_multiple == False:
+            sd_param = {}
+            sd_param[0] = system_design_parameters
+            process_columns = technology_matrix.columns.to_list()
+            material_rows = technology_matrix.index.to_list()
+            technology_array = technology_matrix.values[None, :, :].astype(float)
+        if run_multiple == True:
+            if process_columns == None or material_rows == None:
+                raise ValueError("The process_columns and material_rows parameters are not defined!")
+            sd_param = system_design_parameters
+            if isinstance(technology_matrix, SharedSparsityTensor):
+                technology_array = technology_matrix
+            else:
+                technology_array = np.asarray(technology_matrix, dtype=float)
+        if unit_material_to_process_mapping == None:
+            first_matrix = technology_array[0]
+            if isinstance(technology_array, SharedSparsityTensor):
+                first_matrix = first_matrix.toarray()
+            unit_material_to_process_mapping = material_to_process_mapping(
+                price_material_unit.keys(), pd.DataFrame(first_matrix, material_rows, process_columns)
+            )
+        if overhead_multiplier == None:
+            overhead_multiplier = self.material_overhead_multiplier()
+        designs = _DesignArrays(sd_param.values())
+        price_mass = price_material_mass.reindex(material_rows).fillna(0).values.astype(float)
+        terms = self._material_cost_terms(
+            technology_array,
+            price_material_unit,
+            designs,
+            material_rows,
+            process_columns,
+            unit_material_to_process_mapping,
+        )
+        #  Multiplier for basic cost to overhead:
+        if isinstance(technology_array, SharedSparsityTensor):
+            return self._nested_material_cost_tensor(technology_array, price_mass, terms) * overhead_multiplier
+        nested_C_matrix = self._nested_material_cost(technology_array, price_mass, terms) * overhead_multiplier
+
+        if run_multiple == False:
+            return pd.DataFrame(nested_C_matrix[0], index=technology_matrix.index, columns=technology_matrix.columns)
+        return nested_C_matrix
+
+    def factors_battery_production(
+        self,
+        system_design_parameters,
+        run_multiple=False,
+        return_aggregated=True,
+        return_index=["labour", "capital", "land"],
+        return_columns=None,
+    ):
+        """Calculates the total production factor requirement (matrix F) for all production processes as in BatPaC adjusted
+        for the manufacturing capacity.
+
+        All calculations are based on BatPaC. Factors in physical terms including including labour (hr/yr), capital
+        (US$/yr) and land (m2/yr). Default baseline parameters all based on BatPaC version 5.
+
+        Parameters
+        ----------
+        system_design_parameters : Dict
+            battery and supply chain design parameters
+        run_multiple : bool, optional
+            to return a nested F matrix of multiple pack designs, by default False
+        return_aggregated : bool, optional
+            If false, process aggregation based on BatPaC; if True process aggregation same as LCA, by default True
+        return_index : list, optional
+            Factors (rows) returned, by default labour, capital and land
+        return_columns : list, optional
+            LCA processes, only the processes mapped to these processes are returned, by default None
+
+        Returns
+        -------
+        DataFrame if run_multiple = False, nested Numpy array (design*factor*process) if run_multiple = True.
+            Factor requirements.
+
+        Raises
+        ------
+        ValueError
+            Error if battery manufacturing capacity is not defined
+        """
+        if run_multiple == False:
+            sd_param = {}
+            sd_param[0] = system_design_parameters
+        if run_multiple == True:
+            sd_param = system_design_parameters
+        factor_requirement, processes = self._factor_output(sd_param, return_aggregated, return_index, return_columns)
+        if run_multiple == False:
+            return pd.DataFrame(factor_requirement[0], index=return_index, columns=processes)
+        return factor_requirement
+
+    def factors_capacity_sweep(
+        self,
+        system_design_parameters,
+        capacities,
+        return_aggregated=True,
+        return_index=["labour", "capital", "land"],
+        return_columns=None,
+    ):
+        """Factor requirement (matrix F) of all designs for a range of manufacturing capacities.
+
+        The capacity only changes the volume ratios, so the design dependent parts of F (modelled process rates,
+        exceptions) are calculated once and all capacities are evaluated in one batched operation.
+
+        Parameters
+        ----------
+        system_design_parameters : Dict
+            battery and supply chain design parameters of all designs
+        capacities : list or Numpy array
+            Manufacturing capacities (packs per year, as battery_manufacturing_capacity) of all designs, or
+            (design*capacity)
+        return_aggregated : bool, optional
+            If false, process aggregation based on BatPaC; if True process aggregation same as LCA, by default True
+        return_index : list, optional
+            Factors returned, by default labour, capital and land
+        return_columns : list, optional
+            LCA processes, only the processes mapped to these processes are returned, by default None
+
+        Returns
+        -------
+        Numpy array
+            Factor requirements (design*capacity*factor*process), same process order as factors_battery_production
+
+        Raises
+        ------
+        ValueError
+            Error if battery manufacturing capacity is not defined
+        """
+        factor_requirement, _ = self._factor_output(
+            system_design_parameters, return_aggregated, return_index, return_columns, capacities=capacities
+        )
+        return factor_requirement
+
+    def _factor_output(self, sd_param, return_aggregated, return_index, return_columns, capacities=None):
+        """Factor requirement of the returned factors and (aggregated) processes, and the process order"""
+        process_mapping = self._load()["process_mapping"]
+        if return_columns != None:
+            false_list = [process for process in process_mapping.values() if process not in return_columns]
+            if false_list:
+                raise ValueError("The following processes are not defined: ", false_list)
+        for design in sd_param.values():
+            if "battery_manufacturing_capacity" not in design.keys():
+                raise ValueError("battery_manufacturing_capacity not in parameter dictionary")
+        designs = _DesignArrays(sd_param.values())
+        terms = self._factor_requirement(designs, capacities=capacities)
+        factor_requirement = terms["factor_requirement"]
+        processes = terms["processes"]
+        factor = {f: idx for idx, f in enumerate(terms["factors"])}
+        column = {process: idx for idx, process in enumerate(processes)}
+
+        if return_aggregated is True:
+            if return_columns != None:
+                processes = list(set(process_mapping.values()))
+            else:
+                processes = sorted(set(process_mapping.get(process, process) for process in column))
+            factor_requirement = factor_requirement @ self.process_aggregation_matrix(list(column), processes)
+        factor_requirement = factor_requirement[..., [factor[f] for f in return_index], :]
+        return factor_requirement, processes
+
+    def material_cost_capacity_sweep(
+        self,
+        technology_matrix,
+        price_material_mass,
+        price_material_unit,
+        system_design_parameters,
+        capacities,
+        process_columns,
+        material_rows,
+        scaling_vectors=None,
+        return_nested=False,
+        disable_tqdm=True,
+        unit_material_to_process_mapping=None,
+        overhead_multiplier=None,
+    ):
+        """Material cost of all designs for a range of manufacturing capacities.
+
+        The manufacturing capacity only enters the material cost through the power law scale of the unit cost
+        materials, so the cost matrix is calculated once at the design capacity and rescaled for all capacities.
+
+        Parameters
+        ----------
+        technology_matrix : Numpy array
+            Nested technology matrix (design*material*process)
+        price_material_mass : df
+            Mass prices of materials/energy
+        price_material_unit : dict
+            Unit prices of materials
+        system_design_parameters : dict
+            Battery design parameters of all designs, including the manufacturing capacity
+        capacities : list or Numpy array
+            Manufacturing capacities (packs per year, as battery_manufacturing_capacity) of all designs, or
+            (design*capacity)
+        process_columns : list
+            Process column order
+        material_rows : list
+            Material/energy index order
+        scaling_vectors : Numpy array, optional
+            Scaling vector (design*process) to return the material cost of one pack per process, by default None
+        return_nested : bool, optional
+            Returns the full cost matrix (design*capacity*material*process), by default False
+        disable_tqdm : bool, optional
+            Not used, the unit costs of all designs are calculated at once
+        unit_material_to_process_mapping : dict, optional
+            Receiving process of the unit cost materials, by default None and based on the first technology matrix
+        overhead_multiplier : float, optional
+            Changes the material overhead multiplier, by default None
+
+        Returns
+        -------
+        Numpy array
+            Material cost per process (design*capacity*process), the sum of the cost matrix rows multiplied with the
+            scaling vector if defined. The nested cost matrix (design*capacity*material*process) if return_nested is
+            True
+        """
+        for design in system_design_parameters.values():
+            if "battery_manufacturing_capacity" not in design.keys():
+                raise ValueError("battery_manufacturing_capacity not in parameter dictionary")
+        technology_array = np.asarray(technology_matrix, dtype=float)
+        if unit_material_to_process_mapping is None:
+            unit_material_to_process_mapping = material_to_process_mapping(
+                price_material_unit.keys(), pd.DataFrame(technology_array[0], material_rows, process_columns)
+            )
+        if overhead_multiplier is None:
+            overhead_multiplier = self.material_overhead_multiplier()
+        designs = _DesignArrays(system_design_parameters.values())
+        price_mass = price_material_mass.reindex(material_rows).fillna(0).values.astype(float)
+        terms = self._material_cost_terms(
+            technology_array,
+            price_material_unit,
+            designs,
+            material_rows,
+            process_columns,
+            unit_material_to_process_mapping,
+        )
+        nested_C_matrix = self._nested_material_cost(technology_array, price_mass, terms) * overhead_multiplier
+        internal_idx = terms["internal_idx"]
+
+        # Scale of each material (design*capacity*material) relative to the design capacity:
+        log_capacity_ratio = np.log(_capacity_ratio(capacities, designs["battery_manufacturing_capacity"]))
+        scale_all = np.exp(log_capacity_ratio[:, :, None] * terms["capacity_all"][:, None, :])
+        scale_internal = scale_all * np.exp(log_capacity_ratio[:, :, None] * terms["capacity_internal"][:, None, :])
+        if return_nested:
+            nested_sweep = nested_C_matrix[:, None] * scale_all[..., None]
+            nested_sweep[..., internal_idx] = nested_C_matrix[:, None, :, internal_idx] * scale_internal[..., None]
+            return nested_sweep
+        if scaling_vectors is not None:
+            nested_C_matrix = nested_C_matrix * np.asarray(scaling_vectors, dtype=float)[:, None, :]
+        material_cost = np.einsum("dgp, dkg -> dkp", nested_C_matrix, scale_all)
+        material_cost[..., internal_idx] = np.einsum(
+            "dgp, dkg -> dkp", nested_C_matrix[..., internal_idx], scale_internal
+        )
+        return material_cost
+
+    def cost_sensitivities(
+        self,
+        technology_matrix,
+        price_material_mass,
+        price_material_unit,
+        system_design_parameters,
+        scaling_vectors,
+        factor_prices,
+        parameters,
+        process_columns,
+        material_rows,
+        unit_material_to_process_mapping=None,
+        disable_tqdm=True,
+    ):
+        """Pack cost of all designs with the gradient and elasticity to a set of cost parameters, in closed form.
+
+        The pack cost is the material cost (nested C matrix multiplied by the scaling vector) and the factor cost per
+        pack (F matrix multiplied by the factor price and overhead, divided by the packs per year). Both are built from
+        power laws and linear price terms, so the derivatives are calculated in the same vectorised pass as the cost
+        instead of by running the model with perturbed parameters.
+
+        Parameters
+        ----------
+        technology_matrix : Numpy array
+            Nested technology matrix (design*material*process)
+        price_material_mass : Series
+            Mass prices of materials/energy
+        price_material_unit : dict
+            Unit prices of materials
+        system_design_parameters : dict
+            Battery design parameters of all designs, including the manufacturing capacity
+        scaling_vectors : Numpy array
+            Scaling vector (design*process) of one battery pack per design
+        factor_prices : dict or Series
+            Price of labour, capital and land
+        parameters : list
+            Parameters of the gradient: 'battery_manufacturing_capacity', 'material_exponent', 'p_value:<process>'
+            (all p values of a BatPaC process), 'price:<material>' (mass price), 'factor_price:<factor>' or the name of
+            a cost rate (e.g. 'pack_profit')
+        process_columns : list
+            Process column order
+        material_rows : list
+            Material/energy index order
+        unit_material_to_process_mapping : dict, optional
+            Receiving process of the unit cost materials, by default None and based on the first technology matrix
+        disable_tqdm : bool, optional
+            Not used, the unit costs of all designs are calculated at once
+
+        Returns
+        -------
+        dict
+            'cost' DataFrame with the material, factor and total cost per design. 'gradient' and 'elasticity'
+            DataFrames (design*parameter). The elasticity of a p value is to a proportional change of all p values of
+            the process, the gradient to an equal shift of the p values. The gradient to the manufacturing capacity is
+            per pack per year.
+
+        Raises
+        ------
+        ValueError
+            If a parameter is not defined
+        """
+        model_parameters = self._load()
+        overhead = model_parameters["overhead_multipliers"]
+        cost_rates = model_parameters["cost_rates"]
+        designs = _DesignArrays(system_design_parameters.values())
+        technology_array = np.asarray(technology_matrix, dtype=float)
+        scaling_vectors = np.asarray(scaling_vectors, dtype=float)
+        if unit_material_to_process_mapping is None:
+            unit_material_to_process_mapping = material_to_process_mapping(
+                price_material_unit.keys(), pd.DataFrame(technology_array[0], material_rows, process_columns)
+            )
+
+        # Material cost per design and material, of all and of the internal processes:
+        price_mass = price_material_mass.reindex(material_rows).fillna(0).values.astype(float)
+        terms = self._material_cost_terms(
+            technology_array,
+            price_material_unit,
+            designs,
+            material_rows,
+            process_columns,
+            unit_material_to_process_mapping,
+        )
+        nested_C_matrix = self._nested_material_cost(technology_array, price_mass, terms) * overhead["material"]
+        internal_idx = terms["internal_idx"]
+        material_cost_rows = np.einsum("dgp, dp -> dg", nested_C_matrix, scaling_vectors)
+        material_cost_internal = np.einsum(
+            "dgp, dp -> dg", nested_C_matrix[:, :, internal_idx], scaling_vectors[:, internal_idx]
+        )
+        material_cost = material_cost_rows.sum(axis=1)
+
+        # Factor cost per pack (design*factor*BatPaC process):
+        factor_terms = self._factor_requirement(designs, capacity_derivative=True)
+        factors = factor_terms["factors"]
+        processes = factor_terms["processes"]
+        packs_per_year = factor_terms["packs_per_year"]
+        factor_requirement_pack = factor_terms["factor_requirement"] / packs_per_year[:, None, None]
+        factor_weights = np.array([factor_prices[f] * overhead[f] for f in factors])
+        factor_cost_matrix = factor_requirement_pack * factor_weights[None, :, None]
+        factor_cost_factors = factor_cost_matrix.sum(axis=2)
+        cost = material_cost + factor_cost_factors.sum(axis=1)
+
+        gradient = {}
+        elasticity = {}
+        for parameter in parameters:
+            if parameter == "battery_manufacturing_capacity":
+                # The factor requirement per pack scales with capacity ** (p value * volume ratio elasticity - 1):
+                log_derivative = (
+                    np.einsum("dg, dg -> d", material_cost_rows, terms["capacity_all"])
+                    + np.einsum("dg, dg -> d", material_cost_internal, terms["capacity_internal"])
+                    + np.einsum(
+                        "dfq, dfq -> d",
+                        factor_cost_matrix,
+                        factor_terms["p_values"][None] * factor_terms["volume_ratio_capacity"][:, None, :] - 1,
+                    )
+                )
+                gradient[parameter] = log_derivative / designs["battery_manufacturing_capacity"]
+                elasticity[parameter] = log_derivative / cost
+                continue
+            if parameter == "material_exponent":
+                derivative = -(
+                    np.einsum("dg, dg -> d", material_cost_rows, terms["log_ratio_all"])
+                    + np.einsum("dg, dg -> d", material_cost_internal, terms["log_ratio_internal"])
+                )
+                value = model_parameters["p_values_material"]["material_exponent"]
+            elif parameter.startswith("p_value:"):
+                idx = processes.index(parameter.split(":", 1)[1])
+                log_volume_ratio = np.log(factor_terms["volume_ratios"][:, idx])
+                derivative_factors = factor_cost_matrix[:, :, idx] * log_volume_ratio[:, None]
+                gradient[parameter] = derivative_factors.sum(axis=1)
+                elasticity[parameter] = (derivative_factors * factor_terms["p_values"][:, idx]).sum(axis=1) / cost
                 continue
+            elif parameter.startswith("price:"):
+                idx = material_rows.index(parameter.split(":", 1)[1])
+                derivative = (
+                    overhead["material"]
+                    * terms["scale_all"][:, idx]
+                    * np.einsum("dp, p, dp -> d", technology_array[:, idx, :], terms["mass_mask"][idx], scaling_vectors)
+                )
+                value = price_mass[idx]
+            elif parameter.startswith("factor_price:"):
+                idx = factors.index(parameter.split(":", 1)[1])
+                derivative = factor_requirement_pack[:, idx, :].sum(axis=1) * overhead[factors[idx]]
+                value = factor_prices[factors[idx]]
+            elif parameter in cost_rates:
+                dual_rates = {k: _Dual(v, 1.0 if k == parameter else 0.0) for k, v in cost_rates.items()}
+                multipliers = overhead_multipliers(dual_rates)
+                derivative = material_cost * multipliers["material"].derivative / overhead["material"]
+                for idx, f in enumerate(factors):
+                    derivative = derivative + factor_cost_factors[:, idx] * multipliers[f].derivative / overhead[f]
+                value = cost_rates[parameter]
+            else:
+                raise ValueError(f"Parameter {parameter} is not defined")
+            gradient[parameter] = derivative
+            elasticity[parameter] = derivative * value / cost
+
+        index = list(system_design_parameters.keys())
+        return {
+            "cost": pd.DataFrame(
+                {"material": material_cost, "factor": cost - material_cost, "total": cost}, index=index
+            ),
+            "gradient": pd.DataFrame(gradient, index=index)[list(parameters)],
+            "elasticity": pd.DataFrame(elasticity, index=index)[list(parameters)],
+        }
+
+    def material_cost_quantities(
+        self,
+        technology_matrix,
+        price_material_unit,
+        system_design_parameters,
+        process_columns,
+        material_rows,
+        unit_material_to_process_mapping=None,
+        disable_tqdm=True,
+    ):
+        """Price independent quantities of the material cost matrix of all designs, to reprice the C matrix or the
+        process material cost for new prices (e.g. regions, years or scenarios) without recalculating the designs.
+
+        Parameters
+        ----------
+        technology_matrix : Numpy array
+            Nested technology matrix (design*material*process)
+        price_material_unit : dict
+            Unit prices of materials, only the materials and parameters are used
+        system_design_parameters : dict
+            Battery design parameters of all designs, including the manufacturing capacity
+        process_columns : list
+            Process column order
+        material_rows : list
+            Material/energy index order
+        unit_material_to_process_mapping : dict, optional
+            Receiving process of the unit cost materials, by default None and based on the first technology matrix
+        disable_tqdm : bool, optional
+            Not used, the unit costs of all designs are calculated at once
+
+        Returns
+        -------
+        MaterialCostQuantities
+            Mass and unit price quantities of all designs
+        """
+        designs = _DesignArrays(system_design_parameters.values())
+        technology_array = np.asarray(technology_matrix, dtype=float)
+        if unit_material_to_process_mapping is None:
+            unit_material_to_process_mapping = material_to_process_mapping(
+                price_material_unit.keys(), pd.DataFrame(technology_array[0], material_rows, process_columns)
+            )
+        mass, unit, entries, block, terms = self._material_quantities(
+            technology_array,
+            price_material_unit,
+            designs,
+            material_rows,
+            process_columns,
+            unit_material_to_process_mapping,
+        )
+        return MaterialCostQuantities(
+            mass,
+            unit,
+            entries,
+            block[1].ravel(),
+            block[2].ravel(),
+            material_rows,
+            process_columns,
+            list(system_design_parameters.keys()),
+            self.material_overhead_multiplier(),
+            unit_missing=np.isnan(terms["unit_cost"]),
+        )
+
+    def cost_quantities(
+        self,
+        technology_matrix,
+        price_material_unit,
+        system_design_parameters,
+        scaling_vectors,
+        process_columns,
+        material_rows,
+        unit_material_to_process_mapping=None,
+        disable_tqdm=True,
+    ):
+        """Price independent quantities of the pack cost of all designs.
+
+        The pack cost is linear in the material mass prices, unit prices and factor prices:
+        pack cost = material overhead * (material @ mass prices + unit @ unit prices) + sum(factor * factor prices *
+        factor overhead). The quantities include the scaling vector and the scales of the manufacturing capacity, not
+        the overhead multipliers (these depend on the cost rates).
+
+        Parameters
+        ----------
+        technology_matrix : Numpy array
+            Nested technology matrix (design*material*process)
+        price_material_unit : dict
+            Unit prices of materials, only the materials and parameters are used
+        system_design_parameters : dict
+            Battery design parameters of all designs, including the manufacturing capacity
+        scaling_vectors : Numpy array
+            Scaling vector (design*process) of one battery pack per design
+        process_columns : list
+            Process column order
+        material_rows : list
+            Material/energy index order
+        unit_material_to_process_mapping : dict, optional
+            Receiving process of the unit cost materials, by default None and based on the first technology matrix
+        disable_tqdm : bool, optional
+            Not used, the unit costs of all designs are calculated at once
+
+        Returns
+        -------
+        dict
+            'material' (design*material) mass, 'unit' (design*(material, parameter)) unit price and 'factor'
+            (design*factor) factor requirement per pack quantities as DataFrames
+        """
+        quantities = self.material_cost_quantities(
+            technology_matrix,
+            price_material_unit,
+            system_design_parameters,
+            process_columns,
+            material_rows,
+            unit_material_to_process_mapping=unit_material_to_process_mapping,
+            disable_tqdm=disable_tqdm,
+        )
+        scaling_vectors = np.asarray(scaling_vectors, dtype=float)
+        material_quantity = np.einsum("dgp, dp -> dg", quantities.mass, scaling_vectors)
+        unit_quantity = np.einsum("djp, dp -> dj", quantities.unit, scaling_vectors[:, quantities.unit_process_idx])
+
+        designs = _DesignArrays(system_design_parameters.values())
+        factor_terms = self._factor_requirement(designs)
+        factor_quantity = factor_terms["factor_requirement"].sum(axis=2) / factor_terms["packs_per_year"][:, None]
+        index = list(system_design_parameters.keys())
+        return {
+            "material": pd.DataFrame(material_quantity, index=index, columns=material_rows),
+            "unit": pd.DataFrame(unit_quantity, index=index, columns=pd.MultiIndex.from_tuples(quantities.entries)),
+            "factor": pd.DataFrame(factor_quantity, index=index, columns=factor_terms["factors"]),
+        }
+
+    def pack_cost_scenarios(
+        self,
+        technology_matrix,
+        price_material_mass,
+        price_material_unit,
+        factor_prices,
+        scenario_design_parameters,
+        scaling_vectors,
+        process_columns,
+        material_rows,
+        unit_material_to_process_mapping=None,
+    ):
+        """Pack cost of all designs and process yield and energy consumption scenarios in one batched run.
+
+        Parameters
+        ----------
+        technology_matrix : Numpy array
+            Technology matrices (design*yield scenario*energy scenario*material*process), e.g. of
+            battery_emissions.calculate_modular_A_scenarios
+        price_material_mass : Series
+            Mass prices of materials/energy
+        price_material_unit : dict
+            Unit prices of materials
+        factor_prices : dict
+            Price of labour, capital and land
+        scenario_design_parameters : dict
+            Design parameters of each (design, yield scenario, energy scenario) in the order of the technology
+            matrices, e.g. of battery_emissions.scenario_parameter_dictionaries
+        scaling_vectors : Numpy array
+            Scaling vector of one battery pack (design*yield scenario*energy scenario*process)
+        process_columns : list
+            Process column order
+        material_rows : list
+            Material/energy index order
+        unit_material_to_process_mapping : dict, optional
+            Receiving process of the unit cost materials, by default None and based on the first technology matrix
+
+        Returns
+        -------
+        Numpy array
+            Pack cost (design*yield scenario*energy scenario*component), components are the material cost and the
+            factor cost (labour, capital and land)
+        """
+        technology_array = np.asarray(technology_matrix, dtype=float)
+        scenario_shape = technology_array.shape[:-2]
+        if len(scenario_design_parameters) != np.prod(scenario_shape):
+            raise ValueError("The number of design parameter dictionaries and technology matrices are not equal")
+        quantities = self.cost_quantities(
+            technology_array.reshape((-1,) + technology_array.shape[-2:]),
+            price_material_unit,
+            scenario_design_parameters,
+            np.asarray(scaling_vectors, dtype=float).reshape(-1, len(process_columns)),
+            process_columns,
+            material_rows,
+            unit_material_to_process_mapping=unit_material_to_process_mapping,
+        )
+        price_mass = price_material_mass.reindex(material_rows).fillna(0).values.astype(float)
+        price_unit = np.array([price_material_unit[m][parameter] for m, parameter in quantities["unit"].columns])
+        material_cost = quantities["material"].values @ price_mass + quantities["unit"].values @ price_unit
+        factors = quantities["factor"].columns.to_list()
+        factor_overhead = self.factor_overhead_multiplier(factors)
+        factor_cost = quantities["factor"].values * np.array([factor_prices[f] * factor_overhead[f] for f in factors])
+        cost = np.column_stack([material_cost * self.material_overhead_multiplier(), factor_cost])
+        return cost.reshape(scenario_shape + (cost.shape[1],))
+
+    def capacity_cost_quantities(
+        self,
+        technology_matrix,
+        price_material_unit,
+        system_design_parameters,
+        scaling_vectors,
+        capacities,
+        process_columns,
+        material_rows,
+        unit_material_to_process_mapping=None,
+    ):
+        """Price independent quantities of the pack cost (see cost_quantities) of all designs for a range of
+        manufacturing capacities, e.g. the plant scale of each year of a projection.
+
+        The quantities are calculated once at the design capacity and rescaled with the power laws of the P values:
+        the material scales with the capacity ratio and the factor requirement with the volume ratios.
+
+        Parameters
+        ----------
+        technology_matrix : Numpy array
+            Nested technology matrix (design*material*process)
+        price_material_unit : dict
+            Unit prices of materials, only the materials and parameters are used
+        system_design_parameters : dict
+            Battery design parameters of all designs, including the manufacturing capacity
+        scaling_vectors : Numpy array
+            Scaling vector (design*process) of one battery pack per design
+        capacities : list or Numpy array
+            Manufacturing capacities (packs per year, as battery_manufacturing_capacity) of all designs, or
+            (design*capacity)
+        process_columns : list
+            Process column order
+        material_rows : list
+            Material/energy index order
+        unit_material_to_process_mapping : dict, optional
+            Receiving process of the unit cost materials, by default None and based on the first technology matrix
+
+        Returns
+        -------
+        dict
+            'material' (design*capacity*material), 'unit' (design*capacity*unit price entry) and 'factor'
+            (design*capacity*factor) quantities per pack as Numpy arrays, and the 'entries' (material, parameter) and
+            'factors' order
+        """
+        for design in system_design_parameters.values():
+            if "battery_manufacturing_capacity" not in design.keys():
+                raise ValueError("battery_manufacturing_capacity not in parameter dictionary")
+        designs = _DesignArrays(system_design_parameters.values())
+        technology_array = np.asarray(technology_matrix, dtype=float)
+        scaling_vectors = np.asarray(scaling_vectors, dtype=float)
+        if unit_material_to_process_mapping is None:
+            unit_material_to_process_mapping = material_to_process_mapping(
+                price_material_unit.keys(), pd.DataFrame(technology_array[0], material_rows, process_columns)
+            )
+        mass, unit, entries, block, terms = self._material_quantities(
+            technology_array,
+            price_material_unit,
+            designs,
+            material_rows,
+            process_columns,
+            unit_material_to_process_mapping,
+        )
+        internal = np.zeros(len(process_columns), dtype=bool)
+        internal[terms["internal_idx"]] = True
+
+        # Scale of each material (design*capacity*material) relative to the design capacity:
+        log_capacity_ratio = np.log(_capacity_ratio(capacities, designs["battery_manufacturing_capacity"]))
+        scale_all = np.exp(log_capacity_ratio[:, :, None] * terms["capacity_all"][:, None, :])
+        scale_internal = scale_all * np.exp(log_capacity_ratio[:, :, None] * terms["capacity_internal"][:, None, :])
+        mass = mass * scaling_vectors[:, None, :]
+        material_quantity = np.einsum("dg, dkg -> dkg", mass[..., ~internal].sum(axis=2), scale_all)
+        material_quantity += np.einsum("dg, dkg -> dkg", mass[..., internal].sum(axis=2), scale_internal)
+
+        # Unit price entries scale with their material:
+        process_idx = block[2].ravel()
+        unit = unit * scaling_vectors[:, None, process_idx]
+        entry_row = [material_rows.index(m) for m, _ in entries]
+        unit_quantity = unit[..., ~internal[process_idx]].sum(axis=2)[:, None] * scale_all[..., entry_row]
+        unit_quantity += unit[..., internal[process_idx]].sum(axis=2)[:, None] * scale_internal[..., entry_row]
+
+        factor_terms = self._factor_requirement(designs, capacities=capacities)
+        factor_quantity = factor_terms["factor_requirement"].sum(axis=3) / factor_terms["packs_per_year"][..., None]
+        return {
+            "material": material_quantity,
+            "unit": unit_quantity,
+            "factor": factor_quantity,
+            "entries": entries,
+            "factors": factor_terms["factors"],
+        }
+
+    def regional_value_added(
+        self,
+        nested_C_matrix,
+        nested_F_matrix,
+        packs_per_year,
+        factor_prices,
+        energy_prices=None,
+        energy_index=None,
+        technology_matrix=None,
+        return_index=["labour", "capital", "land"],
+        return_components=False,
+    ):
+        """Process value added per pack of all designs in all regions, based on the regional factor and energy prices.
+
+        The factor cost of region r is F * factor price (r) * factor overhead / packs per year. The material cost is the
+        C matrix in which the cost of the energy materials in their supply processes is replaced by the regional energy
+        price times the material overhead. All regions are calculated at once by broadcasting.
+
+        Parameters
+        ----------
+        nested_C_matrix : Numpy array
+            Material cost matrix (design*material*process), e.g. of material_cost_matrix
+        nested_F_matrix : Numpy array
+            Factor requirement (design*factor*process) in the order of return_index
+        packs_per_year : float or Numpy array
+            Annual production (packs) of each design
+        factor_prices : DataFrame
+            Factor prices (factor*region)
+        energy_prices : DataFrame, optional
+            Energy price per unit of energy material (energy material*region), same regions as factor_prices, by
+            default None and the energy costs of the C matrix are used
+        energy_index : dict, optional
+            Energy material and the (material row, process column) index of the energy input in the C matrix
+        technology_matrix : Numpy array, optional
+            Nested technology matrix (design*material*process) of the energy use, by default one unit of energy
+            material per unit of supply process output
+        return_index : list, optional
+            Factor order of nested_F_matrix, by default labour, capital and land
+        return_components : bool, optional
+            Returns the material and factor value added separately, by default False
+
+        Returns
+        -------
+        Numpy array
+            Value added (design*region*process), or the material and factor value added if return_components is True
+        """
+        regions = factor_prices.columns.to_list()
+        factor_weights = factor_prices.loc[return_index].values * np.array(
+            list(self.factor_overhead_multiplier(return_index=return_index).values())
+        )[:, None]
+        packs_per_year = np.broadcast_to(np.asarray(packs_per_year, dtype=float), (len(nested_F_matrix),))
+        factor_value_added = np.einsum("dfp, fr -> drp", nested_F_matrix, factor_weights)
+        factor_value_added /= packs_per_year[:, None, None]
+
+        material_value_added = np.repeat(np.sum(nested_C_matrix, axis=1)[:, None, :], len(regions), axis=1)
+        if energy_prices is not None:
+            overhead = self.material_overhead_multiplier()
+            for material, (row, column) in energy_index.items():
+                if technology_matrix is None:
+                    quantity = np.ones(len(nested_C_matrix))
+                else:
+                    quantity = np.abs(np.asarray(technology_matrix)[:, row, column])
+                regional_cost = quantity[:, None] * energy_prices.loc[material, regions].values.astype(float) * overhead
+                material_value_added[:, :, column] += regional_cost - nested_C_matrix[:, None, row, column]
+        if return_components:
+            return material_value_added, factor_value_added
+        return material_value_added + factor_value_added
+
+    def iter_cost_breakdown(
+        self,
+        nested_C_matrix,
+        nested_F_matrix,
+        scaling_vectors,
+        packs_per_year,
+        factor_prices,
+        process_columns,
+        material_rows,
+        energy_rows=None,
+        pack_energy=None,
+        designs=None,
+        return_index=["labour", "capital", "land"],
+        chunk_size=1000,
+        drop_zero=True,
+        scale_factors=False,
+    ):
+        """Cost breakdown per pack of chunks of designs by process and component, see cost_breakdown
+
+        Yields
+        ------
+        DataFrame
+            Tidy cost breakdown of the designs of a chunk
+        """
+        from .sparse_tensor import SharedSparsityTensor
+
+        n_designs = len(nested_C_matrix)
+        designs = np.arange(n_designs) if designs is None else np.asarray(list(designs), dtype=object)
+        components = ["materials", "energy"] + list(return_index)
+        # Component of each material row (material*component):
+        material_component = np.zeros((len(material_rows), 2))
+        energy = np.isin(material_rows, [] if energy_rows is None else energy_rows)
+        material_component[~energy, 0] = 1
+        material_component[energy, 1] = 1
+        factor_weights = np.array(
+            [factor_prices[f] * m for f, m in self.factor_overhead_multiplier(return_index=return_index).items()]
+        )
+        packs_per_year = np.broadcast_to(np.asarray(packs_per_year, dtype=float), (n_designs,))
+        if pack_energy is not None:
+            pack_energy = np.broadcast_to(np.asarray(pack_energy, dtype=float), (n_designs,))
+
+        for start in range(0, n_designs, chunk_size):
+            chunk = slice(start, min(start + chunk_size, n_designs))
+            s = np.asarray(scaling_vectors[chunk], dtype=float)
+            # Cost (design*process*component) of the materials, energy and factors of one pack:
+            cost = np.empty((len(s), len(process_columns), len(components)))
+            nested_C = nested_C_matrix[chunk]
+            if isinstance(nested_C, SharedSparsityTensor):
+                # Sum of the nonzero entries per process and component:
+                cost[..., :2] = nested_C.einsum("dgp, gc -> dpc", material_component) * s[..., None]
             else:
-                new_mapping = {k: v for k, v in process_mapping.items() if v == process}
-                process_maping_new.update(new_mapping)
-        process_mapping = process_maping_new
-    for idx, design in tqdm(enumerate(sd_param.values()), total=len(sd_param), disable=disable_tqdm):
-        if "battery_manufacturing_capacity" not in design.keys():
-            raise ValueError("battery_manufacturing_capacity not in parameter dictionary")
-        packs_per_year = design["battery_manufacturing_capacity"] * design["total_packs_vehicle"]
-        design_process_rates = modelled_process_rates(design)
-        process_rates = {**manuf_rate_base, **design_process_rates}
-
-        # return base_factors, p_values
-        volume_ratios = production_volume_ratio(volume_ratio_mapping, process_rates, design)
-
-        # Factor requirement is based on baseline production factors, modelled volume ratio and the p values
-        factor_requirement_df = base_factors * volume_ratios**p_values_process
-
-        # EXCEPTIONS:
+                cost[..., :2] = np.swapaxes(material_component.T @ nested_C, 1, 2) * s[..., None]
+            nested_F = nested_F_matrix[chunk]
+            if isinstance(nested_F, SharedSparsityTensor):
+                nested_F = nested_F.todense()
+            cost[..., 2:] = np.swapaxes(nested_F, 1, 2) * factor_weights
+            cost[..., 2:] /= packs_per_year[chunk, None, None]
+            if scale_factors:
+                cost[..., 2:] *= s[..., None]
+
+            design_idx, process_idx, component_idx = np.indices(cost.shape).reshape(3, -1)
+            values = cost.ravel()
+            if drop_zero:
+                nonzero = values != 0
+                design_idx, process_idx, component_idx = (
+                    design_idx[nonzero],
+                    process_idx[nonzero],
+                    component_idx[nonzero],
+                )
+                values = values[nonzero]
+            breakdown = pd.DataFrame(
+                {
+                    "design": designs[chunk][design_idx],
+                    "process": pd.Categorical.from_codes(process_idx, categories=process_columns),
+                    "component": pd.Categorical.from_codes(component_idx, categories=components),
+                    "cost": values,
+                }
+            )
+            if pack_energy is not None:
+                breakdown["cost_per_kWh"] = values / pack_energy[chunk][design_idx]
+            yield breakdown
+
+    def cost_breakdown(
+        self,
+        nested_C_matrix,
+        nested_F_matrix,
+        scaling_vectors,
+        packs_per_year,
+        factor_prices,
+        process_columns,
+        material_rows,
+        energy_rows=None,
+        pack_energy=None,
+        designs=None,
+        return_index=["labour", "capital", "land"],
+        chunk_size=1000,
+        drop_zero=True,
+        scale_factors=False,
+    ):
+        """Cost breakdown per pack of all designs by process and component (materials, energy, labour, capital and
+        land) as tidy DataFrame.
+
+        The material and energy cost are the C matrix rows multiplied with the scaling vector. The factor cost is
+        F * factor price * factor overhead / packs per year, the F matrix is the annual factor requirement of the
+        plant and is not scaled (as in cost_quantities, pack_cost_scenarios and PackCostUncertainty), so the total per
+        design reconciles with the pack cost of these functions. The designs are evaluated in chunks, so only the
+        breakdown and one chunk are kept in memory.
+
+        Parameters
+        ----------
+        nested_C_matrix : Numpy array or SharedSparsityTensor
+            Material cost matrix (design*material*process), e.g. of material_cost_matrix
+        nested_F_matrix : Numpy array or SharedSparsityTensor
+            Factor requirement (design*factor*process) in the order of return_index, same processes as the C matrix
+        scaling_vectors : Numpy array
+            Scaling vector (design*process) of one battery pack per design
+        packs_per_year : float or Numpy array
+            Annual production (packs) of each design
+        factor_prices : dict
+            Price of labour, capital and land
+        process_columns : list
+            Process column order
+        material_rows : list
+            Material/energy index order
+        energy_rows : list, optional
+            Energy materials (e.g. electricity and heat), by default None and all rows are materials
+        pack_energy : float or Numpy array, optional
+            Pack energy (kWh) of each design to return the cost per kWh, by default None
+        designs : list, optional
+            Design names, by default the design positions
+        return_index : list, optional
+            Factor order of nested_F_matrix, by default labour, capital and land
+        chunk_size : int, optional
+            Number of designs per chunk, by default 1000
+        drop_zero : bool, optional
+            Drops zero costs, by default True
+        scale_factors : bool, optional
+            Multiplies the factor cost with the scaling vector too, for F matrices per unit of process output, by
+            default False
+
+        Returns
+        -------
+        DataFrame
+            Cost breakdown with design, process, component, cost (per pack) and cost_per_kWh columns
+        """
+        return pd.concat(
+            self.iter_cost_breakdown(
+                nested_C_matrix,
+                nested_F_matrix,
+                scaling_vectors,
+                packs_per_year,
+                factor_prices,
+                process_columns,
+                material_rows,
+                energy_rows=energy_rows,
+                pack_energy=pack_energy,
+                designs=designs,
+                return_index=return_index,
+                chunk_size=chunk_size,
+                drop_zero=drop_zero,
+                scale_factors=scale_factors,
+            ),
+            ignore_index=True,
+        )
+
+    def _material_cost_terms(
+        self,
+        technology_array,
+        price_material_unit,
+        designs,
+        material_rows,
+        process_columns,
+        unit_material_to_process_mapping,
+    ):
+        """Components of the nested material cost matrix, C = overhead * scale * (A * mass_mask * price + unit cost).
+
+        The scale of material (row) g is scale_all[d, g] for all processes, multiplied by scale_internal[d, g] for the
+        internal processes. Each scale is a power law (ratio ** (1 - material_exponent)), log_ratio is the sum of the
+        logarithm of the ratios and capacity the sum of the elasticities of the ratios to the manufacturing capacity.
+        """
+        parameters = self._load()
+        manuf_rate_base = parameters["manuf_rate_base"]
+        n_designs = len(designs)
+        row = {material: idx for idx, material in enumerate(material_rows)}
+        column = {process: idx for idx, process in enumerate(process_columns)}
+        internal_idx = [column[process] for process in set(parameters["process_mapping"].values()) if process in column]
+
+        # Material unit costs are attributed to the receiving battery production process:
+        materials = list(unit_material_to_process_mapping.keys())
+        processes = list(set(unit_material_to_process_mapping.values()))
+        material_idx = np.array([row[m] for m in materials])
+        process_idx = np.array([column[process] for process in processes])
+        unit_cost = battery_material_cost_unit_array(compile_unit_prices(price_material_unit, materials), designs)
+
+        # Mass based costs, internal processes, battery jacket production and unit cost materials are excluded:
+        mass_mask = np.ones((len(material_rows), len(process_columns)))
+        mass_mask[:, internal_idx] = 0
+        mass_mask[:, column["battery jacket production"]] = 0
+        mass_mask[np.ix_(material_idx, process_idx)] = 0
+
+        # Scale of the unit cost with the P values. All modelled process rates are proportional to the manufacturing
+        # capacity, so the elasticity of a ratio to the capacity is -1 (baseline/rate) or 1 (rate/baseline):
+        process_rate = modelled_process_rates(designs)
+        exponent = 1 - parameters["p_values_material"]["material_exponent"]
+        cell_ratio = manuf_rate_base["baseline_total_cell"] / process_rate["total_cell"]
+        module_ratio = manuf_rate_base["baseline_total_modules"] / process_rate["total_modules"]
+        pack_ratio = manuf_rate_base["baseline_total_packs"] / process_rate["total_packs"]
+        row_rack_ratio = process_rate["total_row_racks"] / manuf_rate_base["baseline_row_racks"]
+        scale_internal = np.ones((n_designs, len(material_rows)))
+        log_ratio_internal = np.zeros((n_designs, len(material_rows)))
+        capacity_internal = np.zeros((n_designs, len(material_rows)))
+        for material_list, ratio, capacity, multiplier in [
+            (["cell terminal anode", "cell terminal cathode", "cell container"], cell_ratio, -1, 1),
+            (
+                ["cell group interconnect", "module polymer panels", "module terminal", "module container", "gas release"],
+                module_ratio,
+                -1,
+                1,
+            ),
+            (["cooling connectors", "cooling mains Fe", "pack terminals"], pack_ratio, -1, 1),
+            (
+                ["module thermal conductor"],
+                manuf_rate_base["baseline_required_cell"] / process_rate["required_cell"],
+                -1,
+                1,
+            ),
+            (
+                ["cell group interconnect"],
+                manuf_rate_base["baseline_modules_cell_interconnects"] / process_rate["modules_cell_interconnects"],
+                -1,
+                1,
+            ),
+            (["module interconnects"], module_ratio, -1, 1),
+            (["module row rack"], row_rack_ratio, 1, designs["rows_of_modules"]),
+            (["cooling panels"], row_rack_ratio, 1, 1),
+        ]:
+            idx = [row[m] for m in material_list]
+            scale_internal[:, idx] *= (ratio**exponent * multiplier)[:, None]
+            log_ratio_internal[:, idx] += np.log(ratio)[:, None]
+            capacity_internal[:, idx] += capacity
+        jacket_idx = [row["battery jacket Al"], row["battery jacket Fe"]]
+        scale_all = np.ones((n_designs, len(material_rows)))
+        scale_all[:, jacket_idx] = (pack_ratio**exponent)[:, None]
+        log_ratio_all = np.zeros((n_designs, len(material_rows)))
+        log_ratio_all[:, jacket_idx] = np.log(pack_ratio)[:, None]
+        capacity_all = np.zeros((n_designs, len(material_rows)))
+        capacity_all[:, jacket_idx] = -1
+        return {
+            "mass_mask": mass_mask,
+            "unit_block": np.ix_(np.arange(n_designs), material_idx, process_idx),
+            "unit_cost": unit_cost,
+            "internal_idx": internal_idx,
+            "scale_all": scale_all,
+            "scale_internal": scale_internal,
+            "log_ratio_all": log_ratio_all,
+            "log_ratio_internal": log_ratio_internal,
+            "capacity_all": capacity_all * exponent,
+            "capacity_internal": capacity_internal * exponent,
+        }
+
+    def _material_quantities(
+        self,
+        technology_array,
+        price_material_unit,
+        designs,
+        material_rows,
+        process_columns,
+        unit_material_to_process_mapping,
+    ):
+        """Mass price quantities (design*material*process), unit price quantities (design*entry*receiving process),
+        unit price entries, unit cost block and material cost terms of all designs"""
+        terms = self._material_cost_terms(
+            technology_array,
+            price_material_unit,
+            designs,
+            material_rows,
+            process_columns,
+            unit_material_to_process_mapping,
+        )
+        # Scale of the technology matrix entries with the manufacturing capacity:
+        scale = np.repeat(terms["scale_all"][:, :, None], len(process_columns), axis=2)
+        scale[:, :, terms["internal_idx"]] *= terms["scale_internal"][:, :, None]
+        mass = technology_array * scale * terms["mass_mask"][None]
+
+        # Unit cost quantity per unit price entry (design*entry*receiving process):
+        block = terms["unit_block"]
+        materials = list(unit_material_to_process_mapping.keys())
+        entries, coefficients = unit_cost_coefficients(
+            {material: price_material_unit[material] for material in materials}, designs, materials
+        )
+        unit = np.einsum("dmp, dmj -> djp", np.abs(technology_array[block]) * scale[block], coefficients)
+        return mass, unit, entries, block, terms
+
+    @staticmethod
+    def _nested_material_cost(technology_array, price_mass, terms):
+        """Nested material cost matrix (design*material*process) of the cost components, without overhead"""
+        nested_C_matrix = technology_array * price_mass[None, :, None] * terms["mass_mask"][None]
+        block = terms["unit_block"]
+        nested_C_matrix[block] = np.abs(technology_array[block]) * terms["unit_cost"][:, :, None]
+        nested_C_matrix *= terms["scale_all"][:, :, None]
+        nested_C_matrix[:, :, terms["internal_idx"]] *= terms["scale_internal"][:, :, None]
+        return nested_C_matrix
+
+    @staticmethod
+    def _nested_material_cost_tensor(technology_tensor, price_mass, terms):
+        """Nested material cost matrix as _nested_material_cost of the nonzero entries of a SharedSparsityTensor"""
+        from .sparse_tensor import SharedSparsityTensor
+
+        rows, columns = technology_tensor.rows, technology_tensor.columns
+        values = technology_tensor.values * (price_mass[rows] * terms["mass_mask"][rows, columns])[None]
+        block = terms["unit_block"]
+        unit_position = np.full(len(price_mass), -1)
+        unit_position[block[1].ravel()] = np.arange(block[1].size)
+        unit = (unit_position[rows] >= 0) & np.isin(columns, block[2].ravel())
+        values[:, unit] = np.abs(technology_tensor.values[:, unit]) * terms["unit_cost"][:, unit_position[rows[unit]]]
+        values *= terms["scale_all"][:, rows]
+        internal = np.isin(columns, terms["internal_idx"])
+        values[:, internal] *= terms["scale_internal"][:, rows[internal]]
+        return SharedSparsityTensor(rows, columns, values, technology_tensor.matrix_shape)
+
+    def _factor_requirement(self, designs, capacity_derivative=False, capacities=None):
+        """Factor requirement (design*factor*BatPaC process) of all designs.
+
+        With capacity_derivative, the elasticity of the volume ratios to the manufacturing capacity is evaluated with
+        the volume ratio formulas (all modelled process rates are proportional to the capacity). With capacities, the
+        factor requirement (design*capacity*factor*BatPaC process) is calculated for each manufacturing capacity; only
+        the volume ratios depend on the capacity.
+        """
+        parameters = self._load()
+        base_factors = parameters["base_factors"]
+        manuf_rate_base = parameters["manuf_rate_base"]
+        factors = base_factors.index.to_list()
+        processes = base_factors.columns.to_list()
+        factor = {f: idx for idx, f in enumerate(factors)}
+        column = {process: idx for idx, process in enumerate(processes)}
+
+        # Volume ratio (design*process or design*capacity*process):
+        design_process_rates = modelled_process_rates(designs)
+        rates = design_process_rates
+        aging = {"py_cell_aging": designs["py_cell_aging"]}
+        packs_per_year = designs["battery_manufacturing_capacity"] * designs["total_packs_vehicle"]
+        sweep_packs_per_year = packs_per_year
+        if capacities is not None:
+            capacity = designs["battery_manufacturing_capacity"]
+            capacity_scale = _capacity_ratio(capacities, capacity)
+            rates = {k: v[:, None] * capacity_scale for k, v in design_process_rates.items()}
+            aging = {"py_cell_aging": designs["py_cell_aging"][:, None]}
+            sweep_packs_per_year = packs_per_year[:, None] * capacity_scale
+        if capacity_derivative:
+            rates = {k: _Dual(v, v) for k, v in rates.items()}
+        design_volume_ratios = production_volume_ratio(
+            parameters["volume_ratio_formulas"], {**manuf_rate_base, **rates}, aging
+        )
+        volume_ratios = np.zeros(sweep_packs_per_year.shape + (len(processes),))
+        volume_ratio_capacity = np.zeros(sweep_packs_per_year.shape + (len(processes),))
+        for idx, process in enumerate(processes):
+            value, derivative = _Dual.split(design_volume_ratios[process])
+            volume_ratios[..., idx] = value
+            volume_ratio_capacity[..., idx] = derivative / value
+
+        # EXCEPTIONS (independent of the manufacturing capacity):
+        exceptions = np.ones((len(designs), len(factors), len(processes)))
         # Capital equipment requirement electrode coating and drying dependent on solvent evaporated:
         cathode_solvent_evaporated_m2 = (
             packs_per_year
-            * design["binder_solvent_ratio"]
-            * (design["cathode_binder_pvdf"] / design["py_am_mixing_total"])
+            * designs["binder_solvent_ratio"]
+            * (designs["cathode_binder_pvdf"] / designs["py_am_mixing_total"])
             / design_process_rates["positive_electrode_area"]
         )
 
         anode_solvent_evaporated_m2 = (
             packs_per_year
-            * design["binder_solvent_ratio"]
-            * ((design["anode_binder_additive_sbr"] + design["anode_binder_cmc"]) / design["py_am_mixing_total"])
+            * designs["binder_solvent_ratio"]
+            * ((designs["anode_binder_additive_sbr"] + designs["anode_binder_cmc"]) / designs["py_am_mixing_total"])
             / design_process_rates["negative_electrode_area"]
         )
 
-        factor_requirement_df.loc["capital", "cathode coating and drying"] *= (
+        exceptions[:, factor["capital"], column["cathode coating and drying"]] *= (
             cathode_solvent_evaporated_m2 / manuf_rate_base["baseline_pos_solvent_evaporated_m2"]
         ) ** 0.2
-        factor_requirement_df.loc["capital", "anode coating and drying"] *= (
+        exceptions[:, factor["capital"], column["anode coating and drying"]] *= (
             anode_solvent_evaporated_m2 / manuf_rate_base["baseline_neg_solvent_evaporated_m2"]
         ) ** 0.2
 
         # Cell stacking based on cell capacity (baseline 68Ah, p value of 0.95)
-        factor_requirement_df.loc[:, "cell stacking"] = (
-            base_factors["cell stacking"]
-            * (design["cell_capacity_ah"] / 68) ** 0.95
-            * volume_ratios["cell stacking"] ** p_values_process["cell stacking"]
-        )
+        cell_capacity = designs["cell_capacity_ah"]
+        exceptions[:, :, column["cell stacking"]] *= (cell_capacity[:, None] / 68) ** 0.95
 
         # Capital requirement for formation is based on cell capacity (baseline 68 Ah, p value 0.3)
-        factor_requirement_df.loc[:, "cell formation"] *= (design["cell_capacity_ah"] / 68) ** 0.3
+        exceptions[:, :, column["cell formation"]] *= (cell_capacity[:, None] / 68) ** 0.3
 
         # if cell > 80Ah, capital is multiplied by 1.1:
-        if design["cell_capacity_ah"] > 80:
-            factor_requirement_df.loc["capital", "cell formation"] *= 1.1
+        exceptions[:, factor["capital"], column["cell formation"]] *= np.where(cell_capacity > 80, 1.1, 1)
 
         # Labour and capital requirement pack assembly based on modules per pack, default modules per pack is 20, and p_value is 0.3:
-        factor_requirement_df.loc[["capital", "labour"], "pack assembly"] = (
-            factor_requirement_df.loc[["capital", "labour"], "pack assembly"] * (design["modules_per_pack"] / 20) ** 0.3
+        exceptions[:, [factor["capital"], factor["labour"]], column["pack assembly"]] *= (
+            designs["modules_per_pack"][:, None] / 20
+        ) ** 0.3
+
+        # Factor requirement (design*factor*process) is based on baseline production factors, modelled volume ratio and
+        # the p values
+        p_values = parameters["p_values_process"].loc[factors, processes].values.astype(float)
+        if capacities is not None:
+            exceptions = exceptions[:, None]
+        factor_requirement = base_factors.values * volume_ratios[..., None, :] ** p_values * exceptions
+        return {
+            "factor_requirement": factor_requirement,
+            "factors": factors,
+            "processes": processes,
+            "volume_ratios": volume_ratios,
+            "volume_ratio_capacity": volume_ratio_capacity,
+            "p_values": p_values,
+            "packs_per_year": sweep_packs_per_year,
+        }
+
+    def process_aggregation_matrix(self, batpac_processes, aggregated_processes, mapping=None):
+        """Aggregation matrix (BatPaC process*aggregated process) to sum the BatPaC processes to the LCA processes
+
+        Parameters
+        ----------
+        batpac_processes : list
+            BatPaC process order (rows)
+        aggregated_processes : list
+            Aggregated process order (columns), BatPaC processes mapped to other processes are not included
+        mapping : dict, optional
+            BatPaC process and aggregated process, by default the process mapping of the cost parameter file. Processes
+            not in the mapping are not aggregated.
+
+        Returns
+        -------
+        Numpy array
+            Matrix of ones and zeros
+        """
+        if mapping is None:
+            mapping = self.process_mapping
+        column = {process: idx for idx, process in enumerate(aggregated_processes)}
+        matrix = np.zeros((len(batpac_processes), len(aggregated_processes)))
+        for idx, process in enumerate(batpac_processes):
+            aggregated_process = mapping.get(process, process)
+            if aggregated_process in column:
+                matrix[idx, column[aggregated_process]] = 1
+        return matrix
+
+
+class MaterialCostQuantities:
+    """Price independent quantities of the nested material cost matrix, C = overhead * (mass * mass price + unit
+    quantities * unit prices). The quantities include the technology matrix and the scales with the manufacturing
+    capacity, so repricing all designs is a single contraction with the prices. Created by
+    CostModel.material_cost_quantities.
+
+    Args:
+        mass (Numpy array): mass price quantity (design*material*process)
+        unit (Numpy array): unit price quantity (design*unit price entry*receiving process)
+        entries (list): unit price entries (material, parameter)
+        unit_material_idx (Numpy array): material rows of the unit cost materials
+        unit_process_idx (Numpy array): process columns of the receiving processes of the unit cost materials
+        material_rows (list): Material/energy index order
+        process_columns (list): Process column order
+        designs (list): design names
+        overhead_multiplier (float): material overhead multiplier
+        unit_missing (Numpy array): unit cost materials without material weight (design*unit cost material), their
+            cost is NaN as in material_cost_matrix. By default None, all unit costs are defined
+    """
+
+    def __init__(
+        self,
+        mass,
+        unit,
+        entries,
+        unit_material_idx,
+        unit_process_idx,
+        material_rows,
+        process_columns,
+        designs,
+        overhead_multiplier,
+        unit_missing=None,
+    ):
+        self.mass = mass
+        self.unit = unit
+        self.entries = entries
+        self.unit_material_idx = np.asarray(unit_material_idx)
+        self.unit_process_idx = np.asarray(unit_process_idx)
+        self.material_rows = material_rows
+        self.process_columns = process_columns
+        self.designs = designs
+        self.overhead_multiplier = overhead_multiplier
+        if unit_missing is None:
+            unit_missing = np.zeros((len(designs), len(self.unit_material_idx)), dtype=bool)
+        self.unit_missing = np.asarray(unit_missing, dtype=bool)
+        # Unit cost material of each price entry (entry*unit cost material):
+        material = {material_rows[idx]: position for position, idx in enumerate(self.unit_material_idx)}
+        self.entry_material = np.zeros((len(entries), len(self.unit_material_idx)))
+        for idx, (m, _) in enumerate(entries):
+            self.entry_material[idx, material[m]] = 1
+
+    def _mass_prices(self, price_material_mass):
+        if isinstance(price_material_mass, pd.DataFrame):
+            return price_material_mass.reindex(columns=self.material_rows).fillna(0).values.astype(float)
+        return price_material_mass.reindex(self.material_rows).fillna(0).values.astype(float)
+
+    def _unit_prices(self, price_material_unit):
+        if isinstance(price_material_unit, pd.DataFrame):
+            return price_material_unit.loc[:, self.entries].values.astype(float)
+        return np.array([price_material_unit[m][parameter] for m, parameter in self.entries], dtype=float)
+
+    def cost_matrix(self, price_material_mass, price_material_unit, overhead_multiplier=None):
+        """Nested material cost matrix (design*material*process) as material_cost_matrix for a set of prices
+
+        Parameters
+        ----------
+        price_material_mass : Series
+            Mass prices of materials/energy
+        price_material_unit : dict
+            Unit prices of materials
+        overhead_multiplier : float, optional
+            Changes the material overhead multiplier, by default None
+
+        Returns
+        -------
+        Numpy array
+            process cost matrix of externally sourced materials (design*material*process), NaN for the unit cost
+            materials of designs without material weight (as material_cost_matrix)
+        """
+        if overhead_multiplier is None:
+            overhead_multiplier = self.overhead_multiplier
+        nested_C_matrix = self.mass * self._mass_prices(price_material_mass)[None, :, None]
+        unit_cost = np.einsum(
+            "djp, j, jm -> dmp", self.unit, self._unit_prices(price_material_unit), self.entry_material
         )
-        if return_aggregated is True:
-            factor_requirement_df.rename(columns=process_mapping, inplace=True)
-            factor_requirement_df = factor_requirement_df.groupby(factor_requirement_df.columns, axis=1).sum()
-            if return_columns != None:
-                column_index = list(set(process_mapping.values()))
-                factor_requirement_df = factor_requirement_df[column_index]
-        if run_multiple == False:
-            return factor_requirement_df.loc[return_index]
+        unit_cost[self.unit_missing] = np.nan
+        nested_C_matrix[np.ix_(np.arange(len(self.designs)), self.unit_material_idx, self.unit_process_idx)] = unit_cost
+        return nested_C_matrix * overhead_multiplier
+
+    def process_cost(self, price_material_mass, price_material_unit, overhead_multiplier=None):
+        """Material cost per unit of process output (sum of the C matrix rows) for one or several price sets
+
+        Parameters
+        ----------
+        price_material_mass : Series or DataFrame
+            Mass prices of materials/energy, or price sets (price set*material) e.g. regions or years
+        price_material_unit : dict or DataFrame
+            Unit prices of materials, or price sets (price set*(material, parameter)) with the same index as the mass
+            prices
+        overhead_multiplier : float, optional
+            Changes the material overhead multiplier, by default None
+
+        Returns
+        -------
+        Numpy array
+            Material cost (design*process), or (design*price set*process) for several price sets. NaN for the
+            receiving processes of the unit cost materials of designs without material weight (as the C matrix rows)
+        """
+        if overhead_multiplier is None:
+            overhead_multiplier = self.overhead_multiplier
+        price_mass = self._mass_prices(price_material_mass)
+        price_unit = self._unit_prices(price_material_unit)
+        price_sets = price_mass.ndim == 2 or price_unit.ndim == 2
+        if price_sets:
+            n_sets = len(price_mass) if price_mass.ndim == 2 else len(price_unit)
+            price_mass = np.broadcast_to(price_mass, (n_sets, len(self.material_rows)))
+            price_unit = np.broadcast_to(price_unit, (n_sets, len(self.entries)))
         else:
+            price_mass, price_unit = price_mass[None], price_unit[None]
+        # Batched matrix products (price set*material) @ (design*material*process):
+        process_cost = np.matmul(price_mass, self.mass)
+        process_cost[:, :, self.unit_process_idx] += np.matmul(price_unit, self.unit)
+        missing = self.unit_missing.any(axis=1)
+        process_cost[np.ix_(missing, np.arange(process_cost.shape[1]), self.unit_process_idx)] = np.nan
+        process_cost *= overhead_multiplier
+        return process_cost if price_sets else process_cost[:, 0]
+
+    def save(self, path):
+        """Saves the quantities as pickle"""
+        with open(path, "wb") as handle:
+            pickle.dump(self, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        """Loads saved quantities"""
+        with open(path, "rb") as handle:
+            return pickle.load(handle)
+
+
+# Cost model of the default parameter file, used by the module level functions:
+default_cost_model = CostModel()
+
+_default_parameters = [
+    "p_values_material",
+    "p_values_process",
+    "manuf_rate_base",
+    "base_factors",
+    "volume_ratio_mapping",
+    "process_mapping",
+    "cost_rates",
+]
+
+
+def __getattr__(name):
+    """Default cost parameters as module attributes (e.g. battery_cost.process_mapping), loaded on first use"""
+    if name in _default_parameters:
+        return getattr(default_cost_model, name)
+    # Special attributes (e.g. __path__ looked up by imports) do not load the parameters:
+    if not name.startswith("__") and name in default_cost_model.cost_rates:
+        return default_cost_model.cost_rates[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-            nested_F_matrix[idx] = factor_requirement_df.loc[return_index]
 
-    return nested_F_matrix
+def material_cost_matrix(
+    technology_matrix,
+    price_material_mass,
+    price_material_unit,
+    system_design_parameters,
+    run_multiple=False,
+    process_columns=None,
+    material_rows=None,
+    disable_tqdm=False,
+    unit_material_to_process_mapping=None,
+    overhead_multiplier=None,
+):
+    """Material cost matrix with the default cost parameters, see CostModel.material_cost_matrix"""
+    return default_cost_model.material_cost_matrix(
+        technology_matrix,
+        price_material_mass,
+        price_material_unit,
+        system_design_parameters,
+        run_multiple=run_multiple,
+        process_columns=process_columns,
+        material_rows=material_rows,
+        disable_tqdm=disable_tqdm,
+        unit_material_to_process_mapping=unit_material_to_process_mapping,
+        overhead_multiplier=overhead_multiplier,
+    )
 
 
-def production_volume_ratio(volume_ratio_mapping, process_rates, parameter_dict):
-    """Calculate the volume ratio of specific battery design as in BatPaC;
-    volume/baseline number
+def factors_battery_production(
+    system_design_parameters,
+    run_multiple=False,
+    return_aggregated=True,
+    return_index=["labour", "capital", "land"],
+    return_columns=None,
+):
+    """Factor requirement matrix F with the default cost parameters, see CostModel.factors_battery_production"""
+    return default_cost_model.factors_battery_production(
+        system_design_parameters,
+        run_multiple=run_multiple,
+        return_aggregated=return_aggregated,
+        return_index=return_index,
+        return_columns=return_columns,
+    )
 
-    Args: volume_ratio_mapping (dict): process_rates (dict)
-        baseline_manuf_rates(dict):
 
-    Returns: dict: p values per process
-    """
-    process_rates["py_cell_aging"] = parameter_dict["py_cell_aging"]
-    return_dict = {}
-    for x in volume_ratio_mapping.keys():
-        return_dict[x] = eval(volume_ratio_mapping[x], process_rates)
-    return return_dict
+def factors_capacity_sweep(
+    system_design_parameters,
+    capacities,
+    return_aggregated=True,
+    return_index=["labour", "capital", "land"],
+    return_columns=None,
+):
+    """Factor requirement for a range of manufacturing capacities, see CostModel.factors_capacity_sweep"""
+    return default_cost_model.factors_capacity_sweep(
+        system_design_parameters, capacities, return_aggregated, return_index, return_columns
+    )
+
+
+def material_cost_capacity_sweep(
+    technology_matrix,
+    price_material_mass,
+    price_material_unit,
+    system_design_parameters,
+    capacities,
+    process_columns,
+    material_rows,
+    scaling_vectors=None,
+    return_nested=False,
+    disable_tqdm=True,
+    unit_material_to_process_mapping=None,
+    overhead_multiplier=None,
+):
+    """Material cost for a range of manufacturing capacities, see CostModel.material_cost_capacity_sweep"""
+    return default_cost_model.material_cost_capacity_sweep(
+        technology_matrix,
+        price_material_mass,
+        price_material_unit,
+        system_design_parameters,
+        capacities,
+        process_columns,
+        material_rows,
+        scaling_vectors=scaling_vectors,
+        return_nested=return_nested,
+        disable_tqdm=disable_tqdm,
+        unit_material_to_process_mapping=unit_material_to_process_mapping,
+        overhead_multiplier=overhead_multiplier,
+    )
+
+
+def cost_sensitivities(
+    technology_matrix,
+    price_material_mass,
+    price_material_unit,
+    system_design_parameters,
+    scaling_vectors,
+    factor_prices,
+    parameters,
+    process_columns,
+    material_rows,
+    unit_material_to_process_mapping=None,
+    disable_tqdm=True,
+):
+    """Pack cost and closed form sensitivities with the default cost parameters, see CostModel.cost_sensitivities"""
+    return default_cost_model.cost_sensitivities(
+        technology_matrix,
+        price_material_mass,
+        price_material_unit,
+        system_design_parameters,
+        scaling_vectors,
+        factor_prices,
+        parameters,
+        process_columns,
+        material_rows,
+        unit_material_to_process_mapping=unit_material_to_process_mapping,
+        disable_tqdm=disable_tqdm,
+    )
+
+
+def material_cost_quantities(
+    technology_matrix,
+    price_material_unit,
+    system_design_parameters,
+    process_columns,
+    material_rows,
+    unit_material_to_process_mapping=None,
+    disable_tqdm=True,
+):
+    """Price independent material cost quantities with the default cost parameters, see
+    CostModel.material_cost_quantities"""
+    return default_cost_model.material_cost_quantities(
+        technology_matrix,
+        price_material_unit,
+        system_design_parameters,
+        process_columns,
+        material_rows,
+        unit_material_to_process_mapping=unit_material_to_process_mapping,
+        disable_tqdm=disable_tqdm,
+    )
+
+
+def cost_quantities(
+    technology_matrix,
+    price_material_unit,
+    system_design_parameters,
+    scaling_vectors,
+    process_columns,
+    material_rows,
+    unit_material_to_process_mapping=None,
+    disable_tqdm=True,
+):
+    """Price independent pack cost quantities with the default cost parameters, see CostModel.cost_quantities"""
+    return default_cost_model.cost_quantities(
+        technology_matrix,
+        price_material_unit,
+        system_design_parameters,
+        scaling_vectors,
+        process_columns,
+        material_rows,
+        unit_material_to_process_mapping=unit_material_to_process_mapping,
+        disable_tqdm=disable_tqdm,
+    )
+
+
+def pack_cost_scenarios(
+    technology_matrix,
+    price_material_mass,
+    price_material_unit,
+    factor_prices,
+    scenario_design_parameters,
+    scaling_vectors,
+    process_columns,
+    material_rows,
+    unit_material_to_process_mapping=None,
+):
+    """Pack cost of all designs and yield/energy scenarios, see CostModel.pack_cost_scenarios"""
+    return default_cost_model.pack_cost_scenarios(
+        technology_matrix,
+        price_material_mass,
+        price_material_unit,
+        factor_prices,
+        scenario_design_parameters,
+        scaling_vectors,
+        process_columns,
+        material_rows,
+        unit_material_to_process_mapping=unit_material_to_process_mapping,
+    )
+
+
+def cost_breakdown(
+    nested_C_matrix,
+    nested_F_matrix,
+    scaling_vectors,
+    packs_per_year,
+    factor_prices,
+    process_columns,
+    material_rows,
+    energy_rows=None,
+    pack_energy=None,
+    designs=None,
+    return_index=["labour", "capital", "land"],
+    chunk_size=1000,
+    drop_zero=True,
+    scale_factors=False,
+):
+    """Tidy cost breakdown by design, process and component, see CostModel.cost_breakdown"""
+    return default_cost_model.cost_breakdown(
+        nested_C_matrix,
+        nested_F_matrix,
+        scaling_vectors,
+        packs_per_year,
+        factor_prices,
+        process_columns,
+        material_rows,
+        energy_rows=energy_rows,
+        pack_energy=pack_energy,
+        designs=designs,
+        return_index=return_index,
+        chunk_size=chunk_size,
+        drop_zero=drop_zero,
+        scale_factors=scale_factors,
+    )
+
+
+def capacity_cost_quantities(
+    technology_matrix,
+    price_material_unit,
+    system_design_parameters,
+    scaling_vectors,
+    capacities,
+    process_columns,
+    material_rows,
+    unit_material_to_process_mapping=None,
+):
+    """Pack cost quantities for a range of manufacturing capacities, see CostModel.capacity_cost_quantities"""
+    return default_cost_model.capacity_cost_quantities(
+        technology_matrix,
+        price_material_unit,
+        system_design_parameters,
+        scaling_vectors,
+        capacities,
+        process_columns,
+        material_rows,
+        unit_material_to_process_mapping=unit_material_to_process_mapping,
+    )
+
+
+def regional_value_added(
+    nested_C_matrix,
+    nested_F_matrix,
+    packs_per_year,
+    factor_prices,
+    energy_prices=None,
+    energy_index=None,
+    technology_matrix=None,
+    return_index=["labour", "capital", "land"],
+    return_components=False,
+):
+    """Process value added in all regions with the default cost parameters, see CostModel.regional_value_added"""
+    return default_cost_model.regional_value_added(
+        nested_C_matrix,
+        nested_F_matrix,
+        packs_per_year,
+        factor_prices,
+        energy_prices=energy_prices,
+        energy_index=energy_index,
+        technology_matrix=technology_matrix,
+        return_index=return_index,
+        return_components=return_components,
+    )
+
+
+def process_aggregation_matrix(batpac_processes, aggregated_processes, mapping=None):
+    """Process aggregation matrix with the default process mapping, see CostModel.process_aggregation_matrix"""
+    return default_cost_model.process_aggregation_matrix(batpac_processes, aggregated_processes, mapping)
+
+
+def labour_overhead_multiplier():
+    """The factor cost overhead multiplier for direct labour. Function and parameters are based on BatPaC V5."""
+    return default_cost_model.labour_overhead_multiplier()
+
+
+def capital_overhead_multiplier():
+    """The factor cost overhead multiplier for capital equipment. Function and parameters are based on BatPaC V5."""
+    return default_cost_model.capital_overhead_multiplier()
+
+
+def land_overhead_multiplier():
+    """The factor cost overhead multiplier for land. Function and parameters are based on BatPaC V5."""
+    return default_cost_model.land_overhead_multiplier()
+
+
+def factor_overhead_multiplier(return_index=["labour", "capital", "land"]):
+    """Returns the factor cost overhead multiplier"""
+    return default_cost_model.factor_overhead_multiplier(return_index)
+
+
+def material_overhead_multiplier():
+    """The overhead multiplier for materials. Function and parameters are based on BatPaC V5."""
+    return default_cost_model.material_overhead_multiplier()
 
 
 def mineral_cost(elemental_content_df, metal_prices, cathode_list):
@@ -584,20 +2415,20 @@ def process_cost_profit_margin_cam(molar_mass_df, cam_prices, metal_prices, retu
     return df.fillna(0)
 
 
-def cam_price(
-    metal_cost,
-    elemental_content_df,
-    pcpm_cam={
-        "cathode active material (LFP)": 5.30,
-        "cathode active material (LMO)": 3.11,
-        "cathode active material (NMC333)": 6.72,
-        "cathode active material (NMC532)": 6.72,
-        "cathode active material (NMC622)": 7.19,
-        "cathode active material (NMC811)": 15.05,
-        "cathode active material (NCA)": 15.05,
-        "cathode active material (50%/50% NMC532/LMO - )": 4.92,
-    },
-):
+# Process cost and profit margin of cathode active materials ($/kg), calculated with the prices of 01-05-2022:
+default_pcpm_cam = {
+    "cathode active material (LFP)": 5.30,
+    "cathode active material (LMO)": 3.11,
+    "cathode active material (NMC333)": 6.72,
+    "cathode active material (NMC532)": 6.72,
+    "cathode active material (NMC622)": 7.19,
+    "cathode active material (NMC811)": 15.05,
+    "cathode active material (NCA)": 15.05,
+    "cathode active material (50%/50% NMC532/LMO - )": 4.92,
+}
+
+
+def cam_price(metal_cost, elemental_content_df, pcpm_cam=default_pcpm_cam):
     """Calculates the cathode active material price based on metal cost and process cost and profit margin
 
     Parameters
@@ -621,3 +2452,33 @@ def cam_price(
     for k in pcpm_cam.keys():
         cam_price_dict[k] = metal_cost[k] + pcpm_cam[k]
     return cam_price_dict
+
+
+def cam_price_series(metal_prices, elemental_content_df, pcpm_cam=default_pcpm_cam):
+    """Cathode active material prices for a metal price history or scenarios, as one matrix product of the metal
+    prices and the elemental content plus the process cost and profit margin
+
+    Parameters
+    ----------
+    metal_prices : DataFrame
+        Metal prices (time*element), e.g. historic_metal_price.csv. Rows can also be price scenarios or (scenario, time)
+    elemental_content_df : DataFrame
+        elemental content of 1 kg cathode active material (cathode*element)
+    pcpm_cam : dict, optional
+        process cost and profit margin for cathode active material, by default the margins of cam_price
+
+    Returns
+    -------
+    DataFrame
+        Cathode active material prices (time*cathode). As 'price:<cathode>' columns (add_prefix) the prices are
+        sampled inputs of the batched pack cost, see cost_uncertainty.PackCostUncertainty.pack_cost
+    """
+    cathodes = list(pcpm_cam.keys())
+    elements = [element for element in elemental_content_df.columns if element != "all"]
+    content = elemental_content_df.loc[cathodes, elements].values.astype(float)
+    metal_cost = metal_prices.loc[:, elements].values.astype(float) @ content.T
+    return pd.DataFrame(
+        metal_cost + np.array([pcpm_cam[cathode] for cathode in cathodes], dtype=float),
+        index=metal_prices.index,
+        columns=cathodes,
+    )
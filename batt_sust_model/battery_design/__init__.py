@@ -1 +1,6 @@
 from .utils import *
+from .surrogate import *
+from .active_learning import *
+from .design_optimisation import *
+from .job_queue import *
+from .workbook_recorder import *
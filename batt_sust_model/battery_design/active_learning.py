@@ -0,0 +1,221 @@
+import numpy as np
+
+from .surrogate import BatpacSurrogate, design_features
+from .utils import solve_batpac_battery_system_multiple
+
+
+def feature_matrix(parameter_dict_all):
+    """Standardised feature matrix of battery designs, including the electrode pair as one-hot feature"""
+    features = []
+    for parameter_dict in parameter_dict_all.values():
+        f = design_features(parameter_dict)
+        f[f"electrode_pair={parameter_dict['electrode_pair']['value']}"] = 1.0
+        features.append(f)
+    feature_names = list(dict.fromkeys(k for f in features for k in f))
+    X = np.array([[f.get(k, 0.0) for k in feature_names] for f in features])
+    std = X.std(axis=0)
+    return (X - X.mean(axis=0)) / np.where(std > 0, std, 1)
+
+
+def space_filling_selection(X, n, selected=None, seed=None):
+    """Selects n rows of the feature matrix by farthest point (maximin) sampling.
+
+    Parameters
+    ----------
+    X : Numpy array
+        Standardised feature matrix (design*feature)
+    n : int
+        Number of designs to select
+    selected : list, optional
+        Index of designs already selected, by default None
+    seed : int, optional
+        Random seed for the first design if none are selected yet, by default None
+
+    Returns
+    -------
+    list
+        Index of the selected designs
+    """
+    selected = [] if selected is None else list(selected)
+    if not selected:
+        selected.append(int(np.random.default_rng(seed).integers(X.shape[0])))
+        n -= 1
+    min_distance = np.min(np.sum((X[:, None, :] - X[None, selected, :]) ** 2, axis=2), axis=1)
+    new = []
+    for _ in range(min(n, X.shape[0] - len(selected))):
+        idx = int(np.argmax(min_distance))
+        new.append(idx)
+        min_distance = np.minimum(min_distance, np.sum((X - X[idx]) ** 2, axis=1))
+    return selected + new
+
+
+def _target_value(result, target):
+    if callable(target):
+        return target(result)
+    return result[target[0]][target[1]]
+
+
+def _check_targets(surrogate, targets):
+    """Raises a ValueError if a target is not an output of all chemistries of the surrogate, e.g. a typo or an output
+    that only some electrode pairs produce"""
+    for chemistry, model in surrogate.models.items():
+        missing = [target for target in targets if tuple(target) not in model.output_names]
+        if missing:
+            raise ValueError(f"The targets {missing} are not outputs of the {chemistry} surrogate")
+
+
+def active_learning_solve(
+    batpac_path,
+    parameter_dict_all,
+    n_seed=20,
+    batch_size=10,
+    max_solves=None,
+    target_accuracy=0.01,
+    targets=[
+        ("general_battery_parameters", "specific_energy_pack_Wh/kg"),
+        ("material_content_pack", "battery pack"),
+    ],
+    objective=None,
+    minimise=True,
+    exploration=0.5,
+    surrogate=None,
+    solver=None,
+    visible=False,
+    seed=None,
+):
+    """Solves a large set of battery designs by solving only the most informative designs in BatPaC.
+
+    The loop starts with a space-filling seed of designs, fits a surrogate and then solves the batch of designs with
+    the highest predicted uncertainty of the target outputs. If an objective is given, part of each batch is chosen
+    on the expected improvement of the objective (lower confidence bound). The loop stops when the cross validated
+    relative error of all targets is below the target accuracy or the solve budget is used. All other designs are
+    predicted by the surrogate.
+
+    Parameters
+    ----------
+    batpac_path : str
+        Path to BatPaC version 5
+    parameter_dict_all : dict
+        Dictionary of all BatPaC user defined design parameters (full grid)
+    n_seed : int, optional
+        Number of space-filling designs solved first, by default 20
+    batch_size : int, optional
+        Number of designs solved per iteration, by default 10
+    max_solves : int, optional
+        Maximum number of designs solved in BatPaC, by default None (no limit)
+    target_accuracy : float, optional
+        Relative cross validated error of the targets to stop the loop, by default 0.01
+    targets : list, optional
+        Outputs (group, parameter name) used for the accuracy and the uncertainty, by default specific energy and
+        pack weight
+    objective : tuple or callable, optional
+        Output (group, parameter name) or function of a result dictionary (e.g. cost per kWh), by default None
+    minimise : bool, optional
+        Minimise (True) or maximise (False) the objective, by default True
+    exploration : float, optional
+        Fraction of each batch chosen on uncertainty if an objective is given, by default 0.5
+    surrogate : BatpacSurrogate, optional
+        Surrogate to train, by default a Gaussian process surrogate
+    solver : callable, optional
+        Function with the arguments of solve_batpac_battery_system_multiple, by default BatPaC
+    visible : bool, optional
+        If True BatPaC Excel is opened and runs in foreground, by default False
+    seed : int, optional
+        Random seed of the space-filling design, by default None
+
+    Returns
+    -------
+    Dict, Dict
+        Nested dictionary of all battery designs (solved or predicted) and a report of the number of solves, the
+        full grid size and the accuracy per iteration
+    """
+    if surrogate is None:
+        surrogate = BatpacSurrogate(method="gp")
+    if solver is None:
+        solver = solve_batpac_battery_system_multiple
+    names = list(parameter_dict_all.keys())
+    if max_solves is None:
+        max_solves = len(names)
+    X = feature_matrix(parameter_dict_all)
+
+    # Space filling seed, at least two designs per chemistry to fit the per chemistry surrogate:
+    chemistry = np.array([parameter_dict_all[name]["electrode_pair"]["value"] for name in names])
+    selected = []
+    for chem in dict.fromkeys(chemistry):
+        chem_idx = np.where(chemistry == chem)[0]
+        n_chem = max(2, int(round(n_seed * len(chem_idx) / len(names))))
+        selected += [int(chem_idx[i]) for i in space_filling_selection(X[chem_idx], n_chem, seed=seed)]
+    selected = selected[:max_solves]
+
+    # Targets of a trained surrogate are checked before any solve, otherwise after the seed designs are solved:
+    _check_targets(surrogate, targets)
+    solved = {}
+    history = []
+    while True:
+        new = [names[i] for i in selected if names[i] not in solved]
+        if new:
+            solved.update(solver(batpac_path, {name: parameter_dict_all[name] for name in new}, visible=visible))
+            surrogate.fit({name: solved[name] for name in new})
+            _check_targets(surrogate, targets)
+
+        accuracy = max(
+            surrogate.error_estimates(chem).loc[targets, "relative_rmse"].max()
+            for chem in surrogate.models
+        )
+        history.append({"solves": len(solved), "relative_error": accuracy})
+        unsolved = [name for name in names if name not in solved]
+        if accuracy <= target_accuracy or len(solved) >= max_solves or not unsolved:
+            break
+
+        predicted = surrogate.predict_multiple({name: parameter_dict_all[name] for name in unsolved})
+        uncertainty = np.zeros(len(unsolved))
+        improvement = np.zeros(len(unsolved))
+        best = None
+        if objective is not None:
+            observed = [_target_value(r, objective) for r in solved.values()]
+            best = min(observed) if minimise else max(observed)
+        for idx, name in enumerate(unsolved):
+            result = predicted[name]
+            if result is None or not result["surrogate"]["in_training_hull"]:
+                uncertainty[idx] = np.inf  # Unknown chemistry or extrapolation
+                improvement[idx] = np.inf
+                continue
+            relative = []
+            for t in targets:
+                value = abs(result[t[0]][t[1]])
+                relative.append(result["surrogate"]["uncertainty"][t] / value if value > 0 else 0)
+            uncertainty[idx] = max(relative)
+            if objective is not None:
+                value = _target_value(result, objective)
+                if callable(objective):
+                    std = abs(value) * result["surrogate"]["max_relative_uncertainty"]
+                else:
+                    std = result["surrogate"]["uncertainty"][objective]
+                # Lower confidence bound (minimise) or upper confidence bound (maximise):
+                improvement[idx] = (best - (value - 2 * std)) if minimise else ((value + 2 * std) - best)
+
+        batch = min(batch_size, max_solves - len(solved))
+        n_explore = batch if objective is None else int(round(batch * exploration))
+        order = [unsolved[i] for i in np.argsort(-uncertainty)[:n_explore]]
+        for i in np.argsort(-improvement):
+            if len(order) == batch:
+                break
+            if unsolved[i] not in order:
+                order.append(unsolved[i])
+        selected += [names.index(name) for name in order]
+
+    output_dictionary = surrogate.predict_multiple({name: parameter_dict_all[name] for name in names if name not in solved})
+    output_dictionary.update(solved)
+    report = {
+        "solves": len(solved),
+        "grid_size": len(names),
+        "solve_fraction": len(solved) / len(names),
+        "relative_error": history[-1]["relative_error"],
+        "target_reached": history[-1]["relative_error"] <= target_accuracy,
+        "history": history,
+    }
+    print(
+        f"Solved {report['solves']} of {report['grid_size']} designs in BatPaC "
+        f"({report['solve_fraction']:.1%}), relative error targets: {report['relative_error']:.4f}"
+    )
+    return {name: output_dictionary[name] for name in names}, report
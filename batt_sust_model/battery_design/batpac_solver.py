@@ -1,4 +1,3 @@
-import xlwings as xw
 import pandas as pd
 from . import vehicle_model
 
@@ -31,6 +30,8 @@ def parameter_to_batpac(batpac_path, parameter_dict, visible=False, wb=None):
     """
     param_dict = parameter_dict
     if wb is None:
+        import xlwings as xw
+
         wb_batpac = xw.App(visible=visible, add_book=False).books.open(batpac_path)  # xlwings opens BatPaC workbook
     else:
         wb_batpac = wb
@@ -2,6 +2,8 @@ import pandas as pd
 from pathlib import Path
 import os
 
+from .. import data_cache
+
 
 class Battery_system:
     """ " A class to establish a electric vehicle battery system based on BatPaC version 4.
@@ -57,7 +59,7 @@ class Battery_system:
         if "df_parameters" not in globals():
             global df_parameters
             df_parameters = pd.concat(
-                pd.read_excel(parameter_file, sheet_name=None), ignore_index=True
+                data_cache.read_excel(parameter_file, sheet_name=None), ignore_index=True
             )
 
         self.check_param_name(
@@ -161,17 +163,10 @@ def print_battery_parameters(parameter_file_path=None):
         parent = Path(__file__).parents[1]
         parameter_file_path = parent / rel_path
 
-    df_parameters = pd.concat(
-        pd.read_excel(parameter_file_path, sheet_name=None), ignore_index=True
-    )
-
-    xl = pd.ExcelFile(parameter_file_path)
+    sheets = data_cache.read_excel(parameter_file_path, sheet_name=None)
 
     df_parameters = pd.concat(
-        pd.read_excel(
-            parameter_file_path,
-            sheet_name=[sheet for sheet in xl.sheet_names if sheet != "Info"],
-        ),
+        [df for sheet, df in sheets.items() if sheet != "Info"],
         ignore_index=True,
     )
     df_parameters = df_parameters.drop(
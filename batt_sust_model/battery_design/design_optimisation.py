@@ -0,0 +1,371 @@
+import os
+import pickle
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from .. import data_cache
+from .battery_system_class import Battery_system
+from .utils import solve_batpac_battery_system_multiple
+
+
+def parameter_range(parameter_name, parameter_file=None):
+    """Returns the value range of a battery design parameter as defined in the parameter Excel file
+
+    Parameters
+    ----------
+    parameter_name : str
+        Name of the parameter as defined in battery_design_parameters.xlsx
+    parameter_file : str, optional
+        Path to the parameter file, by default None and the package file is used
+
+    Returns
+    -------
+    list
+        Allowed parameter values, None if the parameter has no defined range
+    """
+    if parameter_file is None:
+        rel_path = "data/battery_design_parameters.xlsx"
+        parent = Path(__file__).parents[1]
+        parameter_file = parent / rel_path
+    sheets = data_cache.read_excel(parameter_file, sheet_name=None)
+    df_parameters = pd.concat([df for sheet, df in sheets.items() if sheet != "Info"], ignore_index=True).set_index(
+        "Parameter name"
+    )
+    value_range = df_parameters.loc[parameter_name, "Range"]
+    if not isinstance(value_range, str) or value_range == "None":
+        return None
+    value_range = value_range.strip("'").split(",")
+    if value_range[0].isdigit():  # Convert ranges to integer, float or string list (as in Battery_system)
+        return list(map(int, value_range))
+    try:
+        return list(map(float, value_range))
+    except ValueError:
+        return list(map(str, value_range))
+
+
+def pareto_front(values):
+    """Returns a boolean mask of the non-dominated rows of an objective matrix (all objectives minimised)"""
+    values = np.asarray(values, dtype=float)
+    dominated = np.zeros(len(values), dtype=bool)
+    for idx in range(len(values)):
+        better_equal = np.all(values <= values[idx], axis=1)
+        better = np.any(values < values[idx], axis=1)
+        dominated[idx] = np.any(better_equal & better)
+    return ~dominated
+
+
+def non_dominated_rank(values):
+    """Non-dominated sorting rank (0 is the Pareto front) of an objective matrix (all objectives minimised)"""
+    values = np.asarray(values, dtype=float)
+    rank = np.full(len(values), -1)
+    remaining = np.arange(len(values))
+    front = 0
+    while remaining.size:
+        mask = pareto_front(values[remaining])
+        rank[remaining[mask]] = front
+        remaining = remaining[~mask]
+        front += 1
+    return rank
+
+
+def crowding_distance(values):
+    """Crowding distance of the designs within a front, used to keep a diverse Pareto front"""
+    values = np.asarray(values, dtype=float)
+    distance = np.zeros(len(values))
+    if len(values) < 3:
+        return np.full(len(values), np.inf)
+    for col in range(values.shape[1]):
+        order = np.argsort(values[:, col])
+        span = values[order[-1], col] - values[order[0], col]
+        distance[order[[0, -1]]] = np.inf
+        if span > 0:
+            distance[order[1:-1]] += (values[order[2:], col] - values[order[:-2], col]) / span
+    return distance
+
+
+def evaluate_objectives(objectives, result):
+    """Objective values of a solved design, module level function so that it can be used in process pools"""
+    return {name: function(result) for name, function in objectives.items()}
+
+
+class DesignOptimiser:
+    """Black-box optimisation of battery designs within a fixed BatPaC solve budget.
+
+    Designs are Battery_system instances of the fixed parameters and the optimised parameters. Each batch of new
+    candidates is solved with the solver, optionally in parallel chunks of designs, and the objectives (e.g. cost per
+    kWh or GWP based on the cost and emission functions) are evaluated per solved design. All evaluations are memoised.
+    The search is a non-dominated sorting genetic algorithm for mixed categorical and continuous parameters, with a
+    single objective it reduces to an elitist genetic algorithm. Infeasible designs are ranked after all feasible
+    designs by their total constraint violation (constraint-domination).
+
+    Args:
+        design_space (dict): optimised parameter name as key. Value is a list of choices (categorical/discrete), a
+            tuple (low, high) for a continuous parameter or None to use the range of the parameter Excel file
+        objectives (dict): objective name and function of the solved design dictionary returning a float
+        fixed_parameters (dict): Battery_system parameters that are not optimised (e.g. vehicle_type)
+        maximise (list): objectives that are maximised, all others are minimised
+        constraints (dict): (result group, parameter name) as key and (minimum, maximum) as value, e.g.
+            {('general_battery_parameters', 'Vehicle_range_km'): (400, None)}
+        batpac_path (str): path to BatPaC version 5
+        solver (callable): function with the arguments of solve_batpac_battery_system_multiple, by default BatPaC
+        executor (concurrent.futures.Executor): executor to solve chunks of each batch and evaluate the objectives in
+            parallel, by default None. With a ProcessPoolExecutor the solver and objective functions must be picklable
+            (module level functions)
+        cache (dict or str): memoised evaluations or path of a pickle file to load and store the evaluations
+        seed (int): random seed
+        chunk_size (int): number of designs per parallel solve, by default the batch divided over the CPU count
+    """
+
+    def __init__(
+        self,
+        design_space,
+        objectives,
+        fixed_parameters=None,
+        maximise=None,
+        constraints=None,
+        batpac_path=None,
+        solver=None,
+        executor=None,
+        cache=None,
+        parameter_file=None,
+        seed=None,
+        chunk_size=None,
+    ):
+        self.design_space = {}
+        for param, space in design_space.items():
+            if space is None:
+                space = parameter_range(param, parameter_file)
+                if space is None:
+                    raise ValueError(f"{param} has no range in the parameter file, define a list or (low, high) tuple")
+            self.design_space[param] = space
+        self.objectives = objectives
+        self.fixed_parameters = {} if fixed_parameters is None else fixed_parameters
+        self.maximise = [] if maximise is None else maximise
+        self.constraints = {} if constraints is None else constraints
+        self.batpac_path = batpac_path
+        self.solver = solve_batpac_battery_system_multiple if solver is None else solver
+        self.executor = executor
+        self.chunk_size = chunk_size
+        self.parameter_file = parameter_file
+        self.cache_path = cache if isinstance(cache, (str, Path)) else None
+        if self.cache_path is not None and Path(self.cache_path).exists():
+            with open(self.cache_path, "rb") as handle:
+                self.cache = pickle.load(handle)
+        else:
+            self.cache = {} if cache is None or self.cache_path is not None else cache
+        self.rng = np.random.default_rng(seed)
+        self.solves = 0
+
+    @staticmethod
+    def design_key(design):
+        """Hashable key of a design used for memoisation"""
+        return tuple(sorted(design.items()))
+
+    def random_design(self):
+        design = {}
+        for param, space in self.design_space.items():
+            if isinstance(space, tuple):
+                design[param] = float(self.rng.uniform(space[0], space[1]))
+            else:
+                design[param] = space[self.rng.integers(len(space))]
+        return design
+
+    def mutate(self, design, rate=None):
+        """Mutates each parameter with probability rate; continuous parameters by a Gaussian step"""
+        if rate is None:
+            rate = 1 / len(self.design_space)
+        new = dict(design)
+        for param, space in self.design_space.items():
+            if self.rng.random() > rate:
+                continue
+            if isinstance(space, tuple):
+                step = self.rng.normal(0, 0.1 * (space[1] - space[0]))
+                new[param] = float(np.clip(design[param] + step, space[0], space[1]))
+            else:
+                new[param] = space[self.rng.integers(len(space))]
+        return new
+
+    def crossover(self, design_a, design_b):
+        """Uniform crossover of two parent designs"""
+        return {param: (design_a if self.rng.random() < 0.5 else design_b)[param] for param in self.design_space}
+
+    def parameter_dictionary(self, design):
+        """BatPaC parameter dictionary of a design"""
+        battery = Battery_system(parameter_file=self.parameter_file, **{**self.fixed_parameters, **design})
+        return battery.parameter_dictionary()
+
+    def constraint_violation(self, result):
+        """Total constraint violation of a solved design, each violation is relative to its bound. Zero if feasible"""
+        violation = 0.0
+        for (group, param), (minimum, maximum) in self.constraints.items():
+            value = result[group][param]
+            if minimum is not None and value < minimum:
+                violation += (minimum - value) / (abs(minimum) or 1)
+            if maximum is not None and value > maximum:
+                violation += (value - maximum) / (abs(maximum) or 1)
+        return violation
+
+    def feasible(self, result):
+        """Checks the constraints of a solved design"""
+        return self.constraint_violation(result) == 0
+
+    def evaluate(self, designs, max_solves=None):
+        """Solves and evaluates a batch of designs. Memoised designs are not solved again.
+
+        Parameters
+        ----------
+        designs : list
+            List of design dictionaries (optimised parameter and value)
+        max_solves : int, optional
+            Maximum number of new designs solved, by default None
+
+        Returns
+        -------
+        list
+            Evaluation (objectives, feasibility and constraint violation) of each design, None if not solved due to the
+            budget
+        """
+        new = {}
+        for design in designs:
+            key = self.design_key(design)
+            if key not in self.cache and key not in new:
+                if max_solves is not None and len(new) >= max_solves:
+                    continue
+                new[key] = design
+        if new:
+            keys = list(new.keys())
+            parameter_dict_all = {idx: self.parameter_dictionary(new[key]) for idx, key in enumerate(keys)}
+            if self.executor is not None:
+                # The BatPaC solves of the batch are divided in chunks that are solved in parallel:
+                chunk_size = self.chunk_size or -(-len(keys) // (os.cpu_count() or 1))
+                futures = [
+                    self.executor.submit(
+                        self.solver,
+                        self.batpac_path,
+                        {idx: parameter_dict_all[idx] for idx in range(start, min(start + chunk_size, len(keys)))},
+                    )
+                    for start in range(0, len(keys), chunk_size)
+                ]
+                solved = {}
+                for future in futures:
+                    solved.update(future.result())
+            else:
+                solved = self.solver(self.batpac_path, parameter_dict_all)
+            self.solves += len(new)
+            results = [solved[idx] for idx in range(len(keys))]
+            if self.executor is not None:
+                evaluations = list(self.executor.map(evaluate_objectives, [self.objectives] * len(results), results))
+            else:
+                evaluations = [evaluate_objectives(self.objectives, result) for result in results]
+            for key, result, evaluation in zip(keys, results, evaluations):
+                violation = self.constraint_violation(result)
+                self.cache[key] = {
+                    "design": new[key],
+                    "objectives": evaluation,
+                    "feasible": violation == 0,
+                    "violation": violation,
+                }
+            if self.cache_path is not None:
+                with open(self.cache_path, "wb") as handle:
+                    pickle.dump(self.cache, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        return [self.cache.get(self.design_key(design)) for design in designs]
+
+    def _minimised(self, evaluations):
+        """Objective matrix with all objectives minimised"""
+        values = np.array([[e["objectives"][name] for name in self.objectives] for e in evaluations], dtype=float)
+        sign = np.array([-1 if name in self.maximise else 1 for name in self.objectives])
+        return values * sign
+
+    def _ranked(self, evaluations):
+        """Objective matrix (all objectives minimised) and constraint-domination rank of the evaluations. Feasible
+        designs are ranked by non-dominated sorting, infeasible designs are ranked after all feasible designs by their
+        total constraint violation, so that the selection moves an infeasible population towards the constraints"""
+        values = self._minimised(evaluations)
+        feasible = np.array([e["feasible"] for e in evaluations])
+        # Evaluations of caches without the violation are ranked after all other infeasible designs:
+        violation = np.array([e.get("violation", 0.0 if e["feasible"] else np.inf) for e in evaluations])
+        rank = np.zeros(len(evaluations), dtype=int)
+        if feasible.any():
+            rank[feasible] = non_dominated_rank(values[feasible])
+        if (~feasible).any():
+            offset = rank[feasible].max() + 1 if feasible.any() else 0
+            rank[~feasible] = offset + np.unique(violation[~feasible], return_inverse=True)[1]
+        return values, rank
+
+    def run(self, budget=100, batch_size=10, population_size=None, mutation_rate=None):
+        """Runs the optimisation until the solve budget is used.
+
+        Parameters
+        ----------
+        budget : int, optional
+            Maximum number of designs solved in BatPaC, by default 100
+        batch_size : int, optional
+            Number of new candidates solved per batch, by default 10
+        population_size : int, optional
+            Number of parent designs kept, by default two batches
+        mutation_rate : float, optional
+            Mutation probability per parameter, by default one divided by the number of parameters
+
+        Returns
+        -------
+        DataFrame
+            All evaluated designs with their objectives, feasibility and Pareto front membership
+        """
+        if population_size is None:
+            population_size = 2 * batch_size
+        population = list(self.cache.values())
+        attempts = 0
+        while self.solves < budget and attempts < 100:
+            remaining = budget - self.solves
+            if len(population) < 2:
+                candidates = [self.random_design() for _ in range(min(batch_size, remaining))]
+            else:
+                values, rank = self._ranked(population)
+                crowding = np.zeros(len(population))
+                for front in np.unique(rank):
+                    crowding[rank == front] = crowding_distance(values[rank == front])
+                candidates = []
+                tries = 0
+                while len(candidates) < min(batch_size, remaining):
+                    tries += 1
+                    if tries > 50 * batch_size:  # Neighbourhood exhausted, continue with random designs
+                        candidates.append(self.random_design())
+                        continue
+                    # Binary tournament on rank and crowding distance:
+                    parents = []
+                    for _ in range(2):
+                        a, b = self.rng.integers(len(population), size=2)
+                        better = a if (rank[a], -crowding[a]) < (rank[b], -crowding[b]) else b
+                        parents.append(population[better]["design"])
+                    child = self.mutate(self.crossover(*parents), mutation_rate)
+                    if self.design_key(child) not in self.cache and child not in candidates:
+                        candidates.append(child)
+            solves_before = self.solves
+            evaluations = [e for e in self.evaluate(candidates, max_solves=remaining) if e is not None]
+            attempts = attempts + 1 if self.solves == solves_before else 0
+            # Elitist selection of the next population:
+            population = list({self.design_key(e["design"]): e for e in population + evaluations}.values())
+            values, rank = self._ranked(population)
+            order = sorted(range(len(population)), key=lambda i: rank[i])
+            population = [population[i] for i in order[:population_size]]
+        return self.results()
+
+    def results(self):
+        """DataFrame of all evaluated designs, objectives, feasibility and Pareto front membership"""
+        evaluations = list(self.cache.values())
+        df = pd.DataFrame(
+            [{**e["design"], **e["objectives"], "feasible": e["feasible"]} for e in evaluations]
+        )
+        if df.empty:
+            return df
+        values = self._minimised(evaluations)
+        feasible = df["feasible"].values.astype(bool)
+        df["pareto_front"] = False
+        df.loc[feasible, "pareto_front"] = pareto_front(values[feasible])
+        return df
+
+    def pareto_designs(self):
+        """Feasible non-dominated designs"""
+        df = self.results()
+        return df[df["pareto_front"]].sort_values(by=list(self.objectives)[0])
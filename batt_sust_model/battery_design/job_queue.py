@@ -0,0 +1,437 @@
+import multiprocessing
+import os
+import pickle
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+import zlib
+
+from .utils import solve_batpac_battery_system
+
+
+class DesignJobQueue:
+    """Durable queue of battery designs to be solved, stored in a local SQLite file.
+
+    Workers lease pending designs for a limited time, solve them and write the results back. Designs of workers that
+    stop without completing their lease are leased again after the lease expires. Failed designs are retried and moved
+    to the dead-letter state after max_attempts.
+
+    The queue uses the SQLite rollback journal and file locks. Workers on other machines can only share a queue file on
+    a network file system with reliable (POSIX/SMB) byte-range locking, many NFS setups do not provide this and the
+    queue can be corrupted. Keep the queue file on a local disk if in doubt.
+
+    Args:
+        path (str): path of the SQLite queue file
+        max_attempts (int): maximum number of solve attempts per design
+    """
+
+    def __init__(self, path, max_attempts=3):
+        self.path = str(path)
+        self.max_attempts = max_attempts
+        with self._connect() as con:
+            con.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name BLOB UNIQUE,
+                    parameter_dict BLOB,
+                    status TEXT DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    worker TEXT,
+                    lease_expires REAL,
+                    result BLOB,
+                    error TEXT,
+                    updated REAL
+                )"""
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS idx_status ON jobs (status, lease_expires)")
+
+    def _connect(self):
+        # No WAL journal, it requires shared memory of all clients on the same host:
+        con = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        return _Transaction(con)
+
+    def submit(self, parameter_dict_all, overwrite=False):
+        """Adds battery designs to the queue. Designs already in the queue are skipped unless overwrite is True.
+
+        Parameters
+        ----------
+        parameter_dict_all : dict
+            Dictionary of all BatPaC user defined design parameters by design name
+        overwrite : bool, optional
+            Resets designs already present in the queue to pending, by default False
+
+        Returns
+        -------
+        int
+            Number of designs added
+        """
+        rows = [(pickle.dumps(name), pickle.dumps(p), time.time()) for name, p in parameter_dict_all.items()]
+        verb = "INSERT OR REPLACE" if overwrite else "INSERT OR IGNORE"
+        with self._connect() as con:
+            before = con.total_changes
+            con.executemany(f"{verb} INTO jobs (name, parameter_dict, updated) VALUES (?, ?, ?)", rows)
+            return con.total_changes - before
+
+    def lease(self, worker_id, lease_timeout=600):
+        """Leases the next pending design (or a design of which the lease expired) to a worker.
+
+        Returns
+        -------
+        tuple
+            Job id, design name and parameter dictionary. None if no design is available
+        """
+        now = time.time()
+        with self._connect() as con:
+            # Designs of which the worker stopped max_attempts times are moved to the dead letters:
+            con.execute(
+                "UPDATE jobs SET status = 'dead', error = 'lease expired', updated = ? "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            row = con.execute(
+                "SELECT id, name, parameter_dict FROM jobs WHERE status = 'pending' "
+                "OR (status = 'leased' AND lease_expires < ?) ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            con.execute(
+                "UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated = ? WHERE id = ?",
+                (worker_id, now + lease_timeout, now, row[0]),
+            )
+        return row[0], pickle.loads(row[1]), pickle.loads(row[2])
+
+    def heartbeat(self, job_id, worker_id, lease_timeout=600):
+        """Extends the lease of a running design, returns False if the lease was lost"""
+        with self._connect() as con:
+            cur = con.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (time.time() + lease_timeout, job_id, worker_id),
+            )
+            return cur.rowcount == 1
+
+    def complete(self, job_id, worker_id, result):
+        """Stores the result of a solved design"""
+        with self._connect() as con:
+            cur = con.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL), time.time(), job_id, worker_id),
+            )
+            return cur.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Returns a failed design to the queue, or to the dead letters after the maximum attempts"""
+        with self._connect() as con:
+            con.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END, error = ?, "
+                "updated = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (self.max_attempts, str(error), time.time(), job_id, worker_id),
+            )
+
+    def status(self):
+        """Number of designs by status (pending, leased, done, dead)"""
+        with self._connect() as con:
+            rows = con.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        status = {"pending": 0, "leased": 0, "done": 0, "dead": 0}
+        status.update(dict(rows))
+        return status
+
+    def results(self):
+        """Nested dictionary of all solved designs, sorted by design name"""
+        with self._connect() as con:
+            rows = con.execute("SELECT name, result FROM jobs WHERE status = 'done'").fetchall()
+        output_dictionary = {pickle.loads(name): pickle.loads(result) for name, result in rows}
+        return {k: output_dictionary[k] for k in sorted(output_dictionary)}
+
+    def dead_letters(self):
+        """Designs that failed max_attempts times with the last error"""
+        with self._connect() as con:
+            rows = con.execute("SELECT name, error FROM jobs WHERE status = 'dead'").fetchall()
+        return {pickle.loads(name): error for name, error in rows}
+
+    def requeue_dead(self):
+        """Returns all dead-letter designs to the queue with reset attempts"""
+        with self._connect() as con:
+            return con.execute("UPDATE jobs SET status = 'pending', attempts = 0 WHERE status = 'dead'").rowcount
+
+    def is_finished(self):
+        status = self.status()
+        return status["pending"] == 0 and status["leased"] == 0
+
+
+class _Transaction:
+    """Context manager of an immediate (write locked) SQLite transaction, closes the connection on exit"""
+
+    def __init__(self, con):
+        self.con = con
+
+    def __enter__(self):
+        self.con.execute("BEGIN IMMEDIATE")
+        return self.con
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.con.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.con.close()
+
+
+class BatpacWorkbookSolver:
+    """Solves designs in a BatPaC workbook that is kept open by the worker and restarted every restart_iterations"""
+
+    def __init__(self, batpac_path, visible=False, restart_iterations=50):
+        self.batpac_path = batpac_path
+        self.visible = visible
+        self.restart_iterations = restart_iterations
+        self.wb_batpac = None
+        self.pid = None
+        self.counter = 0
+
+    def __call__(self, parameter_dict):
+        import xlwings as xw
+
+        if self.wb_batpac is None or self.counter == self.restart_iterations:
+            self.close()
+            app = xw.App(visible=self.visible, add_book=False)
+            self.pid = app.pid
+            self.wb_batpac = app.books.open(self.batpac_path)
+            self.counter = 0
+        self.counter += 1
+        return solve_batpac_battery_system(
+            self.batpac_path, parameter_dict, visible=False, open_workbook=self.wb_batpac
+        )
+
+    def abort(self):
+        """Kills the workbook app of a hung solve (called by the heartbeat thread at max_solve_time), the solve fails
+        and the next solve opens a new workbook"""
+        if self.pid is not None:
+            try:
+                os.kill(self.pid, signal.SIGTERM)
+            except OSError:
+                pass
+            self.counter = self.restart_iterations
+
+    def close(self):
+        if self.wb_batpac is not None:
+            try:
+                self.wb_batpac.app.kill()
+            except Exception:
+                pass
+            self.wb_batpac = None
+            self.pid = None
+
+
+class FormulaSolver:
+    """Deterministic stand-in of BatPaC to test the queue and workers without Excel (e.g. on Linux).
+
+    Returns the structure of solve_batpac_battery_system (material_content_pack, general_battery_parameters and
+    batpac_input) with values of simple formulas of the input parameters. The values are not physically meaningful.
+
+    Args:
+        solve_time (float): seconds per solve, e.g. to test lease renewal of slow solves
+    """
+
+    def __init__(self, solve_time=0):
+        self.solve_time = solve_time
+
+    def __call__(self, parameter_dict):
+        if self.solve_time:
+            time.sleep(self.solve_time)
+        input_param = {k: v["value"] for k, v in parameter_dict.items() if v["value"] is not None}
+        numeric = sum(float(v) for v in input_param.values() if isinstance(v, (int, float)) and not isinstance(v, bool))
+        # Text parameters (e.g. electrode pair) change the values by a stable checksum:
+        text = zlib.crc32(repr(sorted((k, v) for k, v in input_param.items() if isinstance(v, str))).encode())
+        scale = 1 + 0.01 * (numeric % 100) + 0.1 * text / 2**32
+        cells_per_module = float(input_param.get("cells_per_module", 12))
+        modules_per_pack = float(input_param.get("modules_per_pack", 20))
+        cell_capacity = 50 * scale
+        pack_energy = cells_per_module * modules_per_pack * cell_capacity * 3.7 / 1000
+        material_content_pack = {
+            "anode active material": 1.0 * pack_energy,
+            "cathode active material": 1.6 * pack_energy,
+            "copper": 0.6 * pack_energy,
+            "electrolyte": 0.8 * pack_energy,
+            "separator": 0.1 * pack_energy,
+            "wrought aluminium": 1.5 * pack_energy,
+        }
+        general_param = {
+            "cell_capacity_ah": cell_capacity,
+            "cell_nominal_voltage": 3.7,
+            "cells_per_module": cells_per_module,
+            "modules_per_pack": modules_per_pack,
+            "cells_per_pack": cells_per_module * modules_per_pack,
+            "pack_energy_kWh": pack_energy,
+            "pack_usable_energy_kWh": 0.9 * pack_energy,
+            "battery_system_weight": sum(material_content_pack.values()) * 1.4,
+            **input_param,
+        }
+        return {
+            "material_content_pack": material_content_pack,
+            "general_battery_parameters": general_param,
+            "batpac_input": parameter_dict,
+        }
+
+
+def _solve_with_heartbeat(queue, job_id, worker_id, lease_timeout, max_solve_time, solver, parameter_dict):
+    """Solves a design and renews its lease every third of the lease timeout while the solver runs.
+
+    The lease is not renewed after max_solve_time, so the lease of a hung solve expires and the design is leased again
+    or moved to the dead letters. Solvers with an abort method (e.g. BatpacWorkbookSolver) are aborted at that time.
+    """
+    stop = threading.Event()
+    deadline = time.monotonic() + max_solve_time
+
+    def renew():
+        while not stop.wait(max(min(lease_timeout / 3, deadline - time.monotonic()), 0)):
+            if time.monotonic() >= deadline:
+                if hasattr(solver, "abort"):
+                    solver.abort()
+                return
+            if not queue.heartbeat(job_id, worker_id, lease_timeout):
+                return
+
+    thread = threading.Thread(target=renew, daemon=True)
+    thread.start()
+    try:
+        return solver(parameter_dict)
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_worker(
+    queue_path,
+    solver=None,
+    batpac_path=None,
+    worker_id=None,
+    lease_timeout=600,
+    poll_interval=1,
+    max_jobs=None,
+    stop_when_empty=True,
+    max_attempts=3,
+    max_solve_time=None,
+):
+    """Leases and solves designs from the queue until the queue is empty.
+
+    Parameters
+    ----------
+    queue_path : str
+        Path of the SQLite queue file
+    solver : callable, optional
+        Function of a parameter dictionary returning the solved design dictionary (e.g. FormulaSolver or the predict
+        method of a BatpacSurrogate as stand-in backend), by default a BatPaC workbook of batpac_path
+    batpac_path : str, optional
+        Path to BatPaC version 5, only used if no solver is given
+    worker_id : str, optional
+        Unique worker name, by default host name and process id
+    lease_timeout : int, optional
+        Seconds before the design of an unresponsive worker is leased again, by default 600. The lease of a running
+        solve is renewed up to max_solve_time, so slow solves are not leased again
+    poll_interval : int, optional
+        Seconds between polls of an empty queue with leased designs, by default 1
+    max_jobs : int, optional
+        Maximum number of designs solved by the worker, by default None
+    stop_when_empty : bool, optional
+        Stop if no designs are pending or leased, otherwise keep polling for new designs, by default True
+    max_attempts : int, optional
+        Maximum number of solve attempts per design, by default 3
+    max_solve_time : int, optional
+        Seconds after which the lease of a running solve is no longer renewed and the BatPaC workbook is killed, the
+        design is then leased again or moved to the dead letters. By default 3 times the lease_timeout
+
+    Returns
+    -------
+    int
+        Number of designs solved by the worker
+    """
+    queue = DesignJobQueue(queue_path, max_attempts=max_attempts)
+    if worker_id is None:
+        worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    if solver is None:
+        solver = BatpacWorkbookSolver(batpac_path)
+    if max_solve_time is None:
+        max_solve_time = 3 * lease_timeout
+    solved = 0
+    try:
+        while max_jobs is None or solved < max_jobs:
+            job = queue.lease(worker_id, lease_timeout)
+            if job is None:
+                if stop_when_empty and queue.is_finished():
+                    break
+                time.sleep(poll_interval)
+                continue
+            job_id, name, parameter_dict = job
+            try:
+                result = _solve_with_heartbeat(
+                    queue, job_id, worker_id, lease_timeout, max_solve_time, solver, parameter_dict
+                )
+            except Exception:
+                queue.fail(job_id, worker_id, traceback.format_exc())
+                continue
+            if queue.complete(job_id, worker_id, result):
+                solved += 1
+    finally:
+        if isinstance(solver, BatpacWorkbookSolver):
+            solver.close()
+    return solved
+
+
+def start_workers(queue_path, n_workers, solver=None, batpac_path=None, **kwargs):
+    """Starts worker processes on this machine. The solver must be picklable. Returns the started processes"""
+    processes = []
+    # Unique per call, workers of several start_workers calls on one host must not share leases:
+    run_id = uuid.uuid4().hex[:8]
+    for idx in range(n_workers):
+        worker_id = f"{socket.gethostname()}-{run_id}-worker-{idx}"
+        process = multiprocessing.Process(
+            target=run_worker,
+            args=(queue_path, solver, batpac_path, worker_id),
+            kwargs=kwargs,
+        )
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def solve_batpac_battery_system_queue(queue_path, parameter_dict_all, n_workers=1, solver=None, batpac_path=None, **kwargs):
+    """Solves multiple battery systems with local worker processes through the job queue.
+
+    Designs already solved in the queue file are not solved again, so an interrupted run can be restarted with the
+    same queue_path. Workers on other machines can join by calling run_worker on the same queue file only if it is on a
+    network file system with reliable file locking (see DesignJobQueue).
+
+    Parameters
+    ----------
+    queue_path : str
+        Path of the SQLite queue file
+    parameter_dict_all : dict
+        Dictionary of all BatPaC user defined design parameters
+    n_workers : int, optional
+        Number of local worker processes, by default 1
+    solver : callable, optional
+        Picklable function of a parameter dictionary returning the solved design (e.g. FormulaSolver for tests without
+        BatPaC), by default BatPaC
+    batpac_path : str, optional
+        Path to BatPaC version 5
+
+    Returns
+    -------
+    Dict
+        Nested dictionary of solved battery design parameters
+    """
+    queue = DesignJobQueue(queue_path, max_attempts=kwargs.get("max_attempts", 3))
+    queue.submit(parameter_dict_all)
+    processes = start_workers(queue_path, n_workers, solver=solver, batpac_path=batpac_path, **kwargs)
+    for process in processes:
+        process.join()
+    dead = queue.dead_letters()
+    if dead:
+        print(f"{len(dead)} designs could not be solved, see DesignJobQueue.dead_letters()")
+    results = queue.results()
+    return {name: results[name] for name in parameter_dict_all if name in results}
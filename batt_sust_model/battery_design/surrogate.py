@@ -0,0 +1,397 @@
+import pickle
+import numpy as np
+import pandas as pd
+
+from .utils import solve_batpac_battery_system, solve_batpac_battery_system_multiple
+
+
+def design_features(parameter_dict):
+    """Encodes the user defined BatPaC input parameters of a battery design as numerical features.
+
+    Numerical parameter values are used directly. String values and parameters without a value (BatPaC default) are
+    one-hot encoded as '<parameter>=<value>'. The electrode pair is not included as the surrogate is trained per
+    chemistry.
+
+    Parameters
+    ----------
+    parameter_dict : dict
+        Parameter dictionary of battery system based on Battery_system class
+
+    Returns
+    -------
+    dict
+        Feature name and value
+    """
+    features = {}
+    for param, v in parameter_dict.items():
+        if param == "electrode_pair":
+            continue
+        value = v["value"]
+        if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+            features[param] = float(value)
+        else:
+            features[f"{param}={value}"] = 1.0
+    return features
+
+
+def design_outputs(result_dict):
+    """Returns the numerical BatPaC outputs of a solved battery design.
+
+    Parameters
+    ----------
+    result_dict : dict
+        Solved battery design, output of solve_batpac_battery_system
+
+    Returns
+    -------
+    dict
+        Output value by (result group, parameter name)
+    """
+    outputs = {}
+    input_param = result_dict["batpac_input"]
+    for group in ["material_content_pack", "general_battery_parameters"]:
+        for param, value in result_dict[group].items():
+            if param in input_param:  # Input parameters are copied from the design, not predicted
+                continue
+            if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+                outputs[(group, param)] = float(value)
+    return outputs
+
+
+def load_solved_designs(path):
+    """Loads solved battery designs saved by solve_batpac_battery_system_multiple (e.g. result_all.pickle)"""
+    with open(path, "rb") as handle:
+        return pickle.load(handle)
+
+
+def polynomial_features(x, degree=2):
+    """Polynomial expansion (constant, linear, squared and pairwise interaction terms) of a feature matrix"""
+    x = np.atleast_2d(x)
+    columns = [np.ones((x.shape[0], 1)), x]
+    if degree >= 2:
+        i, j = np.triu_indices(x.shape[1])
+        columns.append(x[:, i] * x[:, j])
+    return np.hstack(columns)
+
+
+class _ChemistryModel:
+    """Surrogate of all BatPaC outputs for a single electrode pair"""
+
+    def __init__(self, method, degree, ridge, kernel_noise):
+        self.method = method
+        self.degree = degree
+        self.ridge = ridge
+        self.kernel_noise = kernel_noise
+
+    def fit(self, feature_names, X, output_names, Y):
+        self.feature_names = feature_names
+        self.output_names = output_names
+        self.n_train = X.shape[0]
+        # Features without variation in the training set are fixed; a different value is outside the training hull:
+        self.x_mean = X.mean(axis=0)
+        x_std = X.std(axis=0)
+        self.varying = x_std > 0
+        self.x_std = np.where(self.varying, x_std, 1)
+        self.X_train = self._scale(X)
+        self.y_mean = Y.mean(axis=0)
+        y_std = Y.std(axis=0)
+        self.y_std = np.where(y_std > 0, y_std, 1)
+        Y_scaled = (Y - self.y_mean) / self.y_std
+
+        if self.method == "polynomial":
+            phi = polynomial_features(self.X_train, self.degree)
+            u, s, vt = np.linalg.svd(phi, full_matrices=False)
+            self.lam = self.ridge * max(s[0] ** 2, 1e-12)
+            shrink = s / (s**2 + self.lam)
+            self.vt, self.s = vt, s
+            self.coef = vt.T @ (shrink[:, None] * (u.T @ Y_scaled))
+            hat_diag = np.sum(u**2 * (s**2 / (s**2 + self.lam)), axis=1)
+            residual = Y_scaled - phi @ self.coef
+            loo_residual = residual / np.clip(1 - hat_diag, 1e-6, None)[:, None]
+        elif self.method == "gp":
+            d2 = self._squared_distance(self.X_train, self.X_train)
+            positive = d2[d2 > 0]
+            self.length_scale = np.sqrt(np.median(positive)) if positive.size else 1.0
+            K = np.exp(-0.5 * d2 / self.length_scale**2) + self.kernel_noise * np.eye(self.n_train)
+            self.K_inv = np.linalg.inv(K)
+            self.alpha = self.K_inv @ Y_scaled
+            loo_residual = self.alpha / np.diag(self.K_inv)[:, None]
+        elif self.method == "gradient_boosting":
+            try:
+                from sklearn.ensemble import GradientBoostingRegressor
+                from sklearn.model_selection import cross_val_predict
+            except ImportError:
+                raise ImportError("scikit-learn is required for the 'gradient_boosting' surrogate method")
+            self.models = []
+            loo_residual = np.zeros_like(Y_scaled)
+            folds = min(5, self.n_train)
+            for idx in range(Y_scaled.shape[1]):
+                model = GradientBoostingRegressor()
+                if y_std[idx] > 0:
+                    cv_prediction = cross_val_predict(model, self.X_train, Y_scaled[:, idx], cv=folds)
+                    loo_residual[:, idx] = Y_scaled[:, idx] - cv_prediction
+                    model.fit(self.X_train, Y_scaled[:, idx])
+                else:
+                    model = None
+                self.models.append(model)
+        else:
+            raise ValueError(f"Surrogate method {self.method} not defined. Use 'polynomial', 'gp' or 'gradient_boosting'")
+        # Cross validated error estimate per output in original units:
+        self.rmse = np.sqrt(np.mean(loo_residual**2, axis=0)) * np.where(y_std > 0, self.y_std, 0)
+        return self
+
+    def _scale(self, X):
+        return (X - self.x_mean) / self.x_std
+
+    @staticmethod
+    def _squared_distance(a, b):
+        return np.sum(a**2, axis=1)[:, None] + np.sum(b**2, axis=1)[None, :] - 2 * a @ b.T
+
+    def predict(self, X):
+        """Returns the prediction and the standard deviation of all outputs"""
+        x = self._scale(X)
+        if self.method == "polynomial":
+            phi = polynomial_features(x, self.degree)
+            y_scaled = phi @ self.coef
+            # Leverage of the query point, extrapolation is flagged separately by the training hull check:
+            projection = phi @ self.vt.T
+            leverage = np.sum(projection**2 / (self.s**2 + self.lam), axis=1)
+            std = self.rmse[None, :] * np.sqrt(1 + leverage)[:, None]
+        elif self.method == "gp":
+            k = np.exp(-0.5 * self._squared_distance(x, self.X_train) / self.length_scale**2)
+            y_scaled = k @ self.alpha
+            variance = np.clip(1 + self.kernel_noise - np.sum((k @ self.K_inv) * k, axis=1), 0, None)
+            std = np.sqrt(variance)[:, None] * self.y_std[None, :]
+            std = np.where(self.rmse > 0, np.maximum(std, self.rmse), 0)
+        else:
+            y_scaled = np.column_stack(
+                [m.predict(x) if m is not None else np.zeros(x.shape[0]) for m in self.models]
+            )
+            std = np.repeat(self.rmse[None, :], x.shape[0], axis=0)
+        return y_scaled * self.y_std + self.y_mean, std
+
+    def in_hull(self, X):
+        """Checks if designs are a convex combination of the training designs (linear programming feasibility)"""
+        from scipy.optimize import linprog
+
+        x = self._scale(X)
+        in_hull = np.all(np.isclose(x[:, ~self.varying], 0), axis=1)
+        X_train = self.X_train[:, self.varying]
+        A_eq = np.vstack([X_train.T, np.ones(self.n_train)])
+        for idx in np.where(in_hull)[0]:
+            b_eq = np.append(x[idx, self.varying], 1)
+            result = linprog(np.zeros(self.n_train), A_eq=A_eq, b_eq=b_eq, bounds=(0, None), method="highs")
+            in_hull[idx] = result.status == 0
+        return in_hull
+
+
+class BatpacSurrogate:
+    """Emulator of the BatPaC battery design model trained on solved battery designs.
+
+    One model is fitted per electrode pair, predicting all numerical values of the material content and the general
+    battery parameters based on the BatPaC input parameters. The class can be used in place of the solve functions;
+    designs with a high predicted uncertainty or outside of the training hull are solved in BatPaC instead.
+
+    Args:
+        method (str): 'polynomial' (ridge regression), 'gp' (Gaussian process) or 'gradient_boosting' (scikit-learn)
+        degree (int): polynomial degree (1 or 2), only used for the polynomial method
+        max_uncertainty (float): maximum relative uncertainty of any output before BatPaC is used instead
+        ridge (float): relative ridge regularisation of the polynomial method
+        kernel_noise (float): noise (nugget) of the Gaussian process kernel
+    """
+
+    def __init__(self, method="polynomial", degree=2, max_uncertainty=0.02, ridge=1e-8, kernel_noise=1e-6):
+        if degree not in (1, 2):
+            raise ValueError(f"Polynomial degree {degree} not supported. Use 1 or 2")
+        self.method = method
+        self.degree = degree
+        self.max_uncertainty = max_uncertainty
+        self.ridge = ridge
+        self.kernel_noise = kernel_noise
+        self.models = {}
+        self.training_designs = {}
+
+    def fit(self, solved_designs):
+        """Trains the surrogate on solved battery designs.
+
+        Parameters
+        ----------
+        solved_designs : dict
+            Nested dictionary of solved designs (output of solve_batpac_battery_system_multiple) or path to pickle
+
+        Returns
+        -------
+        BatpacSurrogate
+            Fitted surrogate
+        """
+        if isinstance(solved_designs, str):
+            solved_designs = load_solved_designs(solved_designs)
+        self.training_designs.update(solved_designs)
+        by_chemistry = {}
+        for result in self.training_designs.values():
+            chemistry = result["batpac_input"]["electrode_pair"]["value"]
+            by_chemistry.setdefault(chemistry, []).append(result)
+
+        self.models = {}
+        for chemistry, results in by_chemistry.items():
+            features = [design_features(r["batpac_input"]) for r in results]
+            outputs = [design_outputs(r) for r in results]
+            feature_names = list(dict.fromkeys(k for f in features for k in f))
+            output_names = list(dict.fromkeys(k for o in outputs for k in o))
+            X = np.array([[f.get(k, 0.0) for k in feature_names] for f in features])
+            Y = np.array([[o.get(k, 0.0) for k in output_names] for o in outputs])
+            model = _ChemistryModel(self.method, self.degree, self.ridge, self.kernel_noise)
+            self.models[chemistry] = model.fit(feature_names, X, output_names, Y)
+        return self
+
+    def error_estimates(self, chemistry):
+        """Returns the cross validated error (RMSE) and relative error of each output of a chemistry"""
+        model = self.models[chemistry]
+        df = pd.DataFrame(
+            {"rmse": model.rmse, "mean": model.y_mean},
+            index=pd.MultiIndex.from_tuples(model.output_names, names=["group", "parameter"]),
+        )
+        df["relative_rmse"] = df["rmse"] / df["mean"].abs().replace(0, np.nan)
+        return df.fillna(0)
+
+    def predict_multiple(self, parameter_dict_all):
+        """Predicts the BatPaC output of several battery designs.
+
+        Parameters
+        ----------
+        parameter_dict_all : dict
+            Dictionary of all BatPaC user defined design parameters by design name
+
+        Returns
+        -------
+        Dict
+            Nested dictionary of predicted battery designs in the same format as solve_batpac_battery_system. The
+            'surrogate' key contains the chemistry, training hull check, uncertainty per output and the maximum
+            relative uncertainty. Designs of unknown chemistries are None.
+        """
+        output_dict = {name: None for name in parameter_dict_all}
+        by_chemistry = {}
+        for name, parameter_dict in parameter_dict_all.items():
+            chemistry = parameter_dict["electrode_pair"]["value"]
+            if chemistry in self.models:
+                by_chemistry.setdefault(chemistry, []).append(name)
+
+        for chemistry, names in by_chemistry.items():
+            model = self.models[chemistry]
+            features = [design_features(parameter_dict_all[name]) for name in names]
+            X = np.array([[f.get(k, 0.0) for k in model.feature_names] for f in features])
+            unknown_features = np.array([any(k not in model.feature_names for k in f) for f in features])
+            prediction, std = model.predict(X)
+            in_hull = model.in_hull(X) & ~unknown_features
+            scale = np.abs(model.y_mean)
+            relative = np.divide(std, scale[None, :], out=np.zeros_like(std), where=scale[None, :] > 0)
+            for idx, name in enumerate(names):
+                output_dict[name] = self._result_dict(
+                    parameter_dict_all[name], model, prediction[idx], std[idx], in_hull[idx], relative[idx].max()
+                )
+        return output_dict
+
+    def predict(self, parameter_dict):
+        """Predicts the BatPaC output of a single battery design, see predict_multiple"""
+        return self.predict_multiple({0: parameter_dict})[0]
+
+    def _result_dict(self, parameter_dict, model, prediction, std, in_hull, max_relative_uncertainty):
+        result = {"material_content_pack": {}, "general_battery_parameters": {}}
+        uncertainty = {}
+        for idx, (group, param) in enumerate(model.output_names):
+            result[group][param] = prediction[idx]
+            uncertainty[(group, param)] = std[idx]
+        input_param = {k: v["value"] for k, v in parameter_dict.items() if v["value"] is not None}
+        result["general_battery_parameters"].update(input_param)
+        result["material_content_pack"] = dict(sorted(result["material_content_pack"].items()))
+        result["batpac_input"] = parameter_dict
+        result["surrogate"] = {
+            "chemistry": parameter_dict["electrode_pair"]["value"],
+            "in_training_hull": bool(in_hull),
+            "uncertainty": uncertainty,
+            "max_relative_uncertainty": float(max_relative_uncertainty),
+        }
+        return result
+
+    def is_reliable(self, result, max_uncertainty=None):
+        """Returns True if a predicted design is within the training hull and below the uncertainty threshold"""
+        if max_uncertainty is None:
+            max_uncertainty = self.max_uncertainty
+        if result is None:
+            return False
+        return result["surrogate"]["in_training_hull"] and result["surrogate"]["max_relative_uncertainty"] <= max_uncertainty
+
+    def solve_batpac_battery_system(
+        self, batpac_path, parameter_dict, visible=False, open_workbook=None, max_uncertainty=None, update=True
+    ):
+        """Drop-in replacement of solve_batpac_battery_system using the surrogate when the prediction is reliable.
+
+        Parameters
+        ----------
+        batpac_path : str
+            Local path to BatPaC version 5 Excel file, used for designs that are solved in BatPaC
+        parameter_dict : dict
+            Parameter dictionary of battery system based on Battery_system class
+        visible : bool, optional
+            If True BatPaC Excel is opened and runs in foreground, by default False
+        open_workbook : xlwings workbook, optional
+            Open BatPaC xlwings workbook, by default None
+        max_uncertainty : float, optional
+            Maximum relative uncertainty, by default the value of the class instance
+        update : bool, optional
+            Adds designs solved in BatPaC to the training set and refits the surrogate, by default True
+
+        Returns
+        -------
+        Dict
+            Nested dictionary of all values of the battery system parameters
+        """
+        result = self.predict(parameter_dict)
+        if self.is_reliable(result, max_uncertainty):
+            return result
+        result = solve_batpac_battery_system(batpac_path, parameter_dict, visible=visible, open_workbook=open_workbook)
+        if update is True:
+            # The design has no name, the input parameters are the training key (a design solved again replaces
+            # the same design):
+            self.fit({repr(sorted((k, v["value"]) for k, v in parameter_dict.items())): result})
+        return result
+
+    def solve_batpac_battery_system_multiple(
+        self, batpac_path, parameter_dict_all, visible=False, save=False, max_uncertainty=None, update=True
+    ):
+        """Drop-in replacement of solve_batpac_battery_system_multiple. Only designs with an unreliable prediction
+        are solved in BatPaC.
+
+        Parameters
+        ----------
+        batpac_path : str
+            Path to BatPaC version 5
+        parameter_dict_all : dict
+            Dictionary of all BatPaC user defined design parameters
+        visible : bool, optional
+            If True BatPaC Excel is opened and runs in foreground, by default False
+        save : bool, optional
+            Saves the designs solved in BatPaC in the local directory, by default False
+        max_uncertainty : float, optional
+            Maximum relative uncertainty, by default the value of the class instance
+        update : bool, optional
+            Adds designs solved in BatPaC to the training set and refits the surrogate, by default True
+
+        Returns
+        -------
+        Dict
+            Nested dictionary of solved battery design parameters
+        """
+        predicted = self.predict_multiple(parameter_dict_all)
+        to_solve = {
+            name: parameter_dict_all[name]
+            for name, result in predicted.items()
+            if not self.is_reliable(result, max_uncertainty)
+        }
+        if to_solve:
+            print(f"Solving {len(to_solve)} of {len(parameter_dict_all)} designs in BatPaC")
+            solved = solve_batpac_battery_system_multiple(batpac_path, to_solve, visible=visible, save=save)
+            predicted.update(solved)
+            if update is True:
+                self.fit(solved)
+        return {k: predicted[k] for k in sorted(predicted)}
@@ -2,14 +2,13 @@ from .batpac_output import *
 from .battery_system_class import *
 
 import numpy as np
-import matplotlib.pyplot as plt
-from tabulate import tabulate
-import openpyxl as openpyxl
 import pickle
 import os
 from tqdm import tqdm
 import tempfile
 
+from .. import data_cache
+
 
 def solve_batpac_battery_system(
     batpac_path: str,
@@ -74,6 +73,8 @@ def solve_batpac_battery_system_multiple(
     Dict
         Nested dictionary of solved battery design parameters
     """
+    import xlwings as xw
+
     wb_batpac = xw.App(visible=visible, add_book=False).books.open(batpac_path)
     # temporary directory:
     with tempfile.TemporaryDirectory() as dirpath:
@@ -132,6 +133,8 @@ def get_parameter_table(parameter_file=None, tableformat=None):
     Return:
         tabular table format: table of all battery design parameter names and ranges. Default format is psql.
     """
+    from tabulate import tabulate
+
     if parameter_file is None:
         rel_path = "data/battery_design_parameters.xlsx"
         parent = Path(__file__).parents[0]
@@ -140,7 +143,7 @@ def get_parameter_table(parameter_file=None, tableformat=None):
         tableformat = "psql"
 
     df = (
-        pd.concat(pd.read_excel(parameter_file, sheet_name=None), ignore_index=True)
+        pd.concat(data_cache.read_excel(parameter_file, sheet_name=None), ignore_index=True)
         .loc[
             :,
             [
@@ -169,14 +172,16 @@ def plot_circle_diagram(
         name (str): name to save plot
         return_plot (Bool): returns plot as plt
     """
+    import matplotlib.pyplot as plt
+
     if path_comp_type_linkage is None:
         rel_path = "data/component_type_linkage.xlsx"
         parent = Path(__file__).parents[1]
         path_comp_type_linkage = parent / rel_path
-        df_types = pd.read_excel(path_comp_type_linkage, index_col="component")
+        df_types = data_cache.read_excel(path_comp_type_linkage, index_col="component")
 
     else:
-        df_types = pd.read_excel(path_comp_type_linkage, index_col="component")
+        df_types = data_cache.read_excel(path_comp_type_linkage, index_col="component")
 
     result = result_dict["material_content_pack"]
 
@@ -247,14 +252,16 @@ def plot_bar_chart(result_dict, path_comp_type_linkage=None, save=True, name=Non
         result_dict (dict): dictionary of battery design module output by name
         comp_type_linkage (str): Path to Excel sheet with battery components by type. Default location is 1_battery_design_module
     """
+    import matplotlib.pyplot as plt
+
     if path_comp_type_linkage is None:
         rel_path = "data/component_type_linkage.xlsx"
         parent = Path(__file__).parents[1]
         path_comp_type_linkage = parent / rel_path
-        df_types = pd.read_excel(path_comp_type_linkage, index_col="component")
+        df_types = data_cache.read_excel(path_comp_type_linkage, index_col="component")
 
     else:
-        df_types = pd.read_excel(path_comp_type_linkage, index_col="component")
+        df_types = data_cache.read_excel(path_comp_type_linkage, index_col="component")
 
     result = result_dict["material_content_pack"]
 
@@ -346,6 +353,8 @@ def export_to_excel(result_dict, design_name=None, overwrite=False, output_path=
         Excel file: Two Excel files with the battery material content (3_MC_) and battery design parameters (3_PAR_)
 
     """
+    import openpyxl
+
     if output_path is None:
         output_path_mc = "3_MC_battery_pack_material.xlsx"
         output_path_par = "3_PAR_battery_design_parameters.xlsx"
@@ -0,0 +1,353 @@
+import pickle
+import time
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+
+def _options_key(convert, kwargs):
+    """Picklable key of the xlwings range options (e.g. pd.DataFrame with header and index arguments)"""
+    if convert is None and not kwargs:
+        return None
+    name = getattr(convert, "__name__", convert)
+    return (name, tuple(sorted(kwargs.items())))
+
+
+def _equal_values(a, b, rtol=1e-9):
+    if isinstance(a, pd.DataFrame) or isinstance(b, pd.DataFrame):
+        if not (isinstance(a, pd.DataFrame) and isinstance(b, pd.DataFrame)) or a.shape != b.shape:
+            return False
+        return all(_equal_values(x, y, rtol) for x, y in zip(a.values.ravel(), b.values.ravel()))
+    if isinstance(a, (int, float, np.number)) and isinstance(b, (int, float, np.number)):
+        return bool(np.isclose(a, b, rtol=rtol, atol=0) or (np.isnan(a) and np.isnan(b)))
+    return a == b
+
+
+class _Range:
+    """Proxy of an xlwings range that forwards every value access to the backend"""
+
+    def __init__(self, backend, sheet, address, convert=None, kwargs=None):
+        self._backend = backend
+        self._sheet = sheet
+        self._address = address
+        self._convert = convert
+        self._kwargs = {} if kwargs is None else kwargs
+
+    def _key(self, attr):
+        return (self._sheet, self._address, attr, _options_key(self._convert, self._kwargs))
+
+    def options(self, convert=None, **kwargs):
+        return _Range(self._backend, self._sheet, self._address, convert, kwargs)
+
+    @property
+    def value(self):
+        return self._backend.read(self._key("value"), self)
+
+    @value.setter
+    def value(self, value):
+        self._backend.write(self._key("value"), value, self)
+
+    @property
+    def formula(self):
+        return self._backend.read(self._key("formula"), self)
+
+    @formula.setter
+    def formula(self, value):
+        self._backend.write(self._key("formula"), value, self)
+
+    @property
+    def font(self):
+        return _Font(self)
+
+
+class _Font:
+    def __init__(self, rng):
+        self._rng = rng
+
+    @property
+    def bold(self):
+        return self._rng._backend.read(self._rng._key("font.bold"), self._rng)
+
+    @bold.setter
+    def bold(self, value):
+        self._rng._backend.write(self._rng._key("font.bold"), value, self._rng)
+
+
+class _Sheet:
+    def __init__(self, backend, name):
+        self._backend = backend
+        self.name = name
+
+    def range(self, address):
+        return _Range(self._backend, self.name, address)
+
+
+class _Sheets:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def __iter__(self):
+        return iter([_Sheet(self._backend, name) for name in self._backend.sheet_names()])
+
+    def __getitem__(self, name):
+        return _Sheet(self._backend, name)
+
+    def add(self, name):
+        self._backend.add_sheet(name)
+        return _Sheet(self._backend, name)
+
+
+class _App:
+    def __init__(self, backend):
+        object.__setattr__(self, "_backend", backend)
+
+    def __setattr__(self, attr, value):
+        self._backend.app_set(attr, value)
+
+    def kill(self):
+        self._backend.app_call("kill")
+
+
+class _ProxyWorkbook:
+    """Workbook proxy with the xlwings interface used by the battery design module"""
+
+    def __init__(self):
+        self.sheets = _Sheets(self)
+        self.app = _App(self)
+        self.events = []
+
+    def macro(self, name):
+        return lambda: self.run_macro(name)
+
+    def call_counts(self):
+        """Number of workbook (COM) calls by operation"""
+        return dict(Counter(event["op"] for event in self.events))
+
+
+class RecordingWorkbook(_ProxyWorkbook):
+    """Proxy of an open xlwings BatPaC workbook that logs every read, write, macro call and sheet operation.
+
+    Pass the recorder as open workbook to the solve functions (e.g. solve_batpac_battery_system(path, parameter_dict,
+    open_workbook=RecordingWorkbook(wb))) and save the log to replay the solve without Excel.
+
+    Args:
+        book (xlwings Book): open BatPaC workbook
+    """
+
+    def __init__(self, book):
+        self.book = book
+        super().__init__()
+
+    def _log(self, op, start, **kwargs):
+        self.events.append({"op": op, "com_time": time.perf_counter() - start, **kwargs})
+
+    def read(self, key, rng):
+        start = time.perf_counter()
+        real = self.book.sheets[key[0]].range(key[1])
+        if rng._convert is not None or rng._kwargs:
+            real = real.options(rng._convert, **rng._kwargs)
+        for attr in key[2].split("."):
+            real = getattr(real, attr)
+        self._log("read", start, key=key, value=real)
+        return real
+
+    def write(self, key, value, rng):
+        start = time.perf_counter()
+        real = self.book.sheets[key[0]].range(key[1])
+        if key[2] == "font.bold":
+            real.font.bold = value
+        else:
+            setattr(real, key[2], value)
+        self._log("write", start, key=key, value=value)
+
+    def sheet_names(self):
+        start = time.perf_counter()
+        names = [sheet.name for sheet in self.book.sheets]
+        self._log("sheet_names", start, value=names)
+        return names
+
+    def add_sheet(self, name):
+        start = time.perf_counter()
+        self.book.sheets.add(name)
+        self._log("add_sheet", start, value=name)
+
+    def run_macro(self, name):
+        start = time.perf_counter()
+        self.book.macro(name)()
+        self._log("macro", start, value=name)
+
+    def app_set(self, attr, value):
+        start = time.perf_counter()
+        setattr(self.book.app, attr, value)
+        self._log("app_set", start, key=attr, value=value)
+
+    def app_call(self, name):
+        start = time.perf_counter()
+        getattr(self.book.app, name)()
+        self._log("app_call", start, value=name)
+
+    def save(self, path):
+        """Saves the recorded log as pickle"""
+        with open(path, "wb") as handle:
+            pickle.dump(self.events, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def com_time(self):
+        """Total time spent in workbook (COM) calls in seconds"""
+        return sum(event["com_time"] for event in self.events)
+
+
+class ReplayError(Exception):
+    """Raised when a replayed function reads a value that was not recorded or writes a different value"""
+
+
+class ReplayWorkbook(_ProxyWorkbook):
+    """Offline workbook serving the reads of a recorded solve and checking the writes.
+
+    The log is split into segments at each macro call (the BatPaC recalculation). Within a segment, reads are served
+    by range and writes are compared on their final value per range, so changes in the order or number of workbook
+    calls do not fail the replay, while a different written value, a missing or additional write, or a read of a
+    range that was not recorded does.
+
+    Args:
+        events (list or str): recorded events or path to a saved recording
+        strict (bool): raise a ReplayError on the first mismatch, otherwise mismatches are collected
+    """
+
+    def __init__(self, events, strict=True):
+        super().__init__()
+        if isinstance(events, str):
+            with open(events, "rb") as handle:
+                events = pickle.load(handle)
+        self.recorded = events
+        self.strict = strict
+        self.mismatches = []
+        self._segments = [{"reads": {}, "writes": {}, "macro": None}]
+        self._sheets = None
+        for event in events:
+            segment = self._segments[-1]
+            if event["op"] == "read":
+                segment["reads"].setdefault(event["key"], []).append(event["value"])
+            elif event["op"] == "write":
+                segment["writes"][event["key"]] = event["value"]
+            elif event["op"] == "macro":
+                segment["macro"] = event["value"]
+                self._segments.append({"reads": {}, "writes": {}, "macro": None})
+            elif event["op"] == "sheet_names" and self._sheets is None:
+                self._sheets = list(event["value"])
+        if self._sheets is None:
+            self._sheets = []
+        self._segment = 0
+        self._read_count = Counter()
+        self._written = {}
+        self._segment_writes = {}
+
+    def _mismatch(self, message):
+        if self.strict:
+            raise ReplayError(message)
+        self.mismatches.append(message)
+
+    def read(self, key, rng):
+        self.events.append({"op": "read", "key": key})
+        if key in self._segment_writes:
+            return self._segment_writes[key]
+        values = self._segments[self._segment]["reads"].get(key)
+        if values:
+            count = self._read_count[(self._segment, key)]
+            self._read_count[(self._segment, key)] += 1
+            value = values[min(count, len(values) - 1)]
+            return value.copy() if isinstance(value, pd.DataFrame) else value
+        if key in self._written:
+            return self._written[key]
+        for segment in reversed(self._segments[: self._segment]):
+            if key in segment["reads"]:
+                return segment["reads"][key][-1]
+        raise ReplayError(f"Read of {key} was not recorded")
+
+    def write(self, key, value, rng):
+        self.events.append({"op": "write", "key": key, "value": value})
+        self._segment_writes[key] = value
+        self._written[key] = value
+
+    def sheet_names(self):
+        self.events.append({"op": "sheet_names"})
+        return list(self._sheets)
+
+    def add_sheet(self, name):
+        self.events.append({"op": "add_sheet", "value": name})
+        self._sheets.append(name)
+
+    def _check_segment(self):
+        recorded = self._segments[self._segment]["writes"]
+        for key, value in recorded.items():
+            if key not in self._segment_writes:
+                self._mismatch(f"Recorded write of {key} = {value!r} not replayed")
+            elif not _equal_values(value, self._segment_writes[key]):
+                self._mismatch(f"Write of {key}: recorded {value!r}, replayed {self._segment_writes[key]!r}")
+        for key in self._segment_writes:
+            if key not in recorded:
+                self._mismatch(f"Write of {key} = {self._segment_writes[key]!r} was not recorded")
+
+    def run_macro(self, name):
+        self.events.append({"op": "macro", "value": name})
+        expected = self._segments[self._segment]["macro"]
+        if expected != name:
+            self._mismatch(f"Macro {name} called, recorded macro call: {expected}")
+        self._check_segment()
+        self._segment = min(self._segment + 1, len(self._segments) - 1)
+        self._segment_writes = {}
+
+    def app_set(self, attr, value):
+        self.events.append({"op": "app_set", "key": attr, "value": value})
+
+    def app_call(self, name):
+        self.events.append({"op": "app_call", "value": name})
+
+    def verify(self):
+        """Checks the writes after the last macro call and returns all mismatches"""
+        self._check_segment()
+        return self.mismatches
+
+
+def benchmark_replay(function, events, *args, repeat=10, **kwargs):
+    """Measures the Python-side time and workbook call counts of a function on a replayed workbook.
+
+    The replayed workbook is passed as the 'wb' or 'open_workbook' keyword if given (e.g.
+    benchmark_replay(parameter_to_batpac, events, batpac_path, parameter_dict, wb=None)), otherwise as last positional
+    argument (e.g. benchmark_replay(df_batpac_results, events)).
+
+    Parameters
+    ----------
+    function : callable
+        Function interacting with the workbook
+    events : list or str
+        Recorded events or path to a saved recording
+    repeat : int, optional
+        Number of repetitions, by default 10
+
+    Returns
+    -------
+    dict
+        Mean and minimum run time (s), replayed call counts and recorded COM call counts and time
+    """
+    if isinstance(events, str):
+        with open(events, "rb") as handle:
+            events = pickle.load(handle)
+    timings = []
+    for _ in range(repeat):
+        wb = ReplayWorkbook(events)
+        start = time.perf_counter()
+        if "wb" in kwargs or "open_workbook" in kwargs:
+            key = "wb" if "wb" in kwargs else "open_workbook"
+            output = function(*args, **{**kwargs, key: wb})
+        else:
+            output = function(*args, wb, **kwargs)
+        timings.append(time.perf_counter() - start)
+        wb.verify()
+    return {
+        "mean_time": float(np.mean(timings)),
+        "min_time": float(np.min(timings)),
+        "call_counts": wb.call_counts(),
+        "recorded_call_counts": dict(Counter(event["op"] for event in events)),
+        "recorded_com_time": sum(event.get("com_time", 0) for event in events),
+        "output": output,
+    }
@@ -1,20 +1,38 @@
+import functools
 import hashlib
-import brightway2 as bw
 import pandas as pd
 import numpy as np
-from bw2data.parameters import ActivityParameter, ProjectParameter, Group
 from pathlib import Path
-from bw2io.package import BW2Package
-import bw2data
 import re
 
+from . import data_cache
+from .scaling_solver import scaling_vectors
+from .sparse_tensor import SharedSparsityTensor
+
+# Brightway is imported in the functions that use it, so the modular calculations do not import Brightway.
 
-# defined cut-off modules:
 parent = Path(__file__).parents[0]
-df_cut_off_modules = pd.read_csv(parent / "data/cut_off_modules.csv").set_index("process")
 
-# Process formula:
-process_formula = pd.read_csv(parent / "data/process_formulas.csv", index_col=[1, 2]).T.to_dict()
+
+@functools.lru_cache(maxsize=None)
+def _cut_off_modules():
+    """Defined cut-off modules, loaded on first use"""
+    return data_cache.read_csv(parent / "data/cut_off_modules.csv").set_index("process")
+
+
+@functools.lru_cache(maxsize=None)
+def _process_formulas():
+    """Process formulas, loaded on first use"""
+    return data_cache.read_csv(parent / "data/process_formulas.csv", index_col=[1, 2]).T.to_dict()
+
+
+def __getattr__(name):
+    """Module data (df_cut_off_modules and process_formula), loaded on first use"""
+    if name == "df_cut_off_modules":
+        return _cut_off_modules()
+    if name == "process_formula":
+        return _process_formulas()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def import_db_brightway(data_path=None):
@@ -25,6 +43,8 @@ def import_db_brightway(data_path=None):
     data_path : str, optional
         Path to BW2Package battery db, by default None and takes relative path
     """
+    import brightway2 as bw
+    from bw2io.package import BW2Package
 
     if data_path is None:
         rel_path = "data/bw2package"
@@ -67,6 +87,7 @@ def export_brightway_data(project_name, path, ecoinvent_db_name):
         All databases in project except ecoinvent and biosphere
 
     """
+    import brightway2 as bw
     from bw2io.package import BW2Package
 
     project = bw.projects.set_current(project_name)
@@ -79,6 +100,8 @@ def export_brightway_data(project_name, path, ecoinvent_db_name):
 
 def exchange_name(activity_input):
     """Get name of exchange product based on exchange input (e.g. 'exchange_1'['input'])"""
+    import brightway2 as bw
+
     db = bw.Database(activity_input[0])
     activity = db.get(activity_input[1])
     return activity["reference product"]
@@ -97,6 +120,9 @@ def output_excel_activity_browser(scenario_name, dict_output_bw_format, path=Non
     Returns:
         Activity Browser Excel parameter file used for the scenario import function. Default name is 'battery_design_output'
     """
+    import brightway2 as bw
+    from bw2data.parameters import ProjectParameter
+
     bw.projects.set_current("parameterised_battery_lca")
     param_name = [x.name for x in ProjectParameter]
     default_value = [x.amount for x in ProjectParameter]
@@ -122,13 +148,16 @@ def import_project_parameters(path_parameter_file=None):
     path_parameter_file : str, optional
         Path to Brightway project parameter file, by default None
     """
+    import bw2data
+    from bw2data.parameters import ProjectParameter
+
     if path_parameter_file is None:
         rel_path = "data/bw_default_project_parameters.xlsx"
         parent = (Path(__file__)).parents[0]
         bw_db = parent / rel_path
     else:
         bw_db = path_parameter_file
-    df = pd.read_excel(bw_db).fillna(0)
+    df = data_cache.read_excel(bw_db).fillna(0)
     ProjectParameter.drop_table(safe=True, drop_sequences=True)  # delete all project parameters
     ProjectParameter.create_table()  # create a new empty table of project parameters
     output = []
@@ -155,6 +184,8 @@ def import_activity_functions(df_bw_param_functions):
     df_bw_param_functions : Dataframe
         Dataframe with activity, product name and the formula
     """
+    import brightway2 as bw
+    from bw2data.parameters import ProjectParameter
 
     di = df_bw_param_functions.T.to_dict()
     for x in di.keys():
@@ -181,6 +212,8 @@ def add_activity_parameters(database_name):
     database_name : str
         Brightway database name
     """
+    import brightway2 as bw
+
     db = bw.Database(database_name)
     for act in db:
         exc_list = [
@@ -200,6 +233,9 @@ def parameterise_exchanges(key):
     Args:
         key (tuple): activity key
     """
+    import brightway2 as bw
+    from bw2data.parameters import ActivityParameter
+
     group = build_activity_group_name(key)
 
     if not (ActivityParameter.select().where(ActivityParameter.group == group).count()):
@@ -223,6 +259,8 @@ def build_activity_group_name(key, name=None):
         name (str): activity group name
 
     """
+    import brightway2 as bw
+
     simple_hash = hashlib.md5(":".join(key).encode()).hexdigest()
     if name:
         return "{}_{}".format(name, simple_hash)
@@ -265,6 +303,9 @@ def auto_add_parameter(key):
     Args:
        key (tuple): activity key
     """
+    import brightway2 as bw
+    from bw2data.parameters import ActivityParameter
+
     act = bw.get_activity(key)
     prep_name = clean_activity_name(act.get("name"))
     group = build_activity_group_name(key, prep_name)
@@ -288,6 +329,8 @@ def update_param_battery_bw(parameter_dict):
     parameter_dict : dict
         Battery design dictionary.
     """
+    from bw2data.parameters import ActivityParameter, ProjectParameter, Group
+
     bw_project_param = [x.name for x in ProjectParameter.select()]
     for param in parameter_dict.keys():
         if param in bw_project_param:
@@ -331,12 +374,16 @@ def output_as_bw_param(parameter_dict):
 
 
 def get_exc_name(key_tuple):
+    import brightway2 as bw
+
     db = list(key_tuple)[0]
     code = list(key_tuple)[1]
     return bw.Database(db).get(code)["name"]
 
 
 def get_exc_product(key_tuple):
+    import brightway2 as bw
+
     db = list(key_tuple)[0]
     code = list(key_tuple)[1]
     return bw.Database(db).get(code)["reference product"]
@@ -354,6 +401,8 @@ def modules_with_cuts(cut_off_database):
     Input is negative.. ; waste output is positive
 
     """
+    import brightway2 as bw
+
     modules = {}
     cuts_db = bw.Database(cut_off_database)
     for act in cuts_db:
@@ -390,6 +439,8 @@ def modules_with_cuts(cut_off_database):
 
 
 def get_lcia_score(key, amount, impact_category):
+    import brightway2 as bw
+
     activity = bw.get_activity(key)  # get activity by db and code name
     fu = {activity: amount}
     lca = bw.LCA(fu, impact_category)
@@ -420,6 +471,8 @@ def cut_modules_to_zero(modules_dict):
     """Cuts parameterised modules to zero..
 
     Update the module input amounts based on cuts. All cut exchanges are set to zero, rest remains the same"""
+    import brightway2 as bw
+
     for module in modules_dict.keys():
         if modules_dict[module]["cuts"]:
             act = bw.get_activity(modules_dict[module]["key"])
@@ -448,6 +501,8 @@ def lcia_modules(modules_dict, impact_category):
     Returns:
         numpy array
     """
+    import brightway2 as bw
+
     if not isinstance(impact_category, list):
         impact_category = [impact_category]
     list_fu = [{bw.get_activity(modules_dict[act]["key"]): modules_dict[act]["amount"]} for act in modules_dict.keys()]
@@ -500,7 +555,7 @@ def project_parameters_brightway(path_parameter_file=None):
         path = parent / rel_path
     else:
         path = path_parameter_file
-    df = pd.read_excel(path, index_col=0).fillna(0)
+    df = data_cache.read_excel(path, index_col=0).fillna(0)
 
     project_param_dict = df.T.to_dict()
     return project_param_dict
@@ -608,6 +663,8 @@ def update_parameterised_modules(technology_matrix_base, battery_design_dict, ac
     Return:
         df: updated square product-module matrix
     """
+    import brightway2 as bw
+
     updated_act = update_module_formulas(battery_design_dict, activity_functions_dict)
     battery_weight = battery_design_dict["battery_pack"]
     A_matrix = technology_matrix_base.copy(deep=True)  # To make sure the default A dataframe is not modified
@@ -642,7 +699,7 @@ def calculate_modular_A(
     """
 
     A_default = technology_matrix_default
-    updated_act = update_module_formulas(battery_design_dictionary, process_formula)
+    updated_act = update_module_formulas(battery_design_dictionary, _process_formulas())
     A_new = technology_matrix_default.values
     # Establish A frame for battery production. Production processes and process outputs (reference products)
     for k, v in updated_act.items():
@@ -654,37 +711,216 @@ def calculate_modular_A(
     return A_new
 
 
-def get_emissions_modular_matrix(A_base, A_matrix_design, modular_emissions, return_vector=False):
+def _formula_names(formula):
+    """Parameter names used in a Brightway formula"""
+    return set(compile(str(formula), "<formula>", "eval").co_names)
+
+
+def _formula_entries(technology_matrix_default):
+    """Process formula of each (product, process) position of the technology matrix as in calculate_modular_A, the
+    last formula of a position is used"""
+    entries = {}
+    for k in _process_formulas().keys():
+        if k[0] in technology_matrix_default.columns:
+            process_index = technology_matrix_default.columns.get_loc(k[0])
+        if k[1] in technology_matrix_default.index:
+            product_index = technology_matrix_default.index.get_loc(k[1])
+        entries[(product_index, process_index)] = k
+    return entries
+
+
+def calculate_modular_A_tensor(technology_matrix_default, battery_design_dictionaries):
+    """Technology matrices of all designs as SharedSparsityTensor, only the formula entries of calculate_modular_A are
+    stored per design
+
+    Parameters
+    ----------
+    technology_matrix_default : pd DataFrame
+        Default A matrix
+    battery_design_dictionaries : dict
+        Design parameters of all designs (e.g. of parameter_dictionary), project formulas must be solved already
+
+    Returns
+    -------
+    SharedSparsityTensor
+        Technology matrices (design*product*module)
+    """
+    entries = _formula_entries(technology_matrix_default)
+    process_formula = _process_formulas()
+    values = np.zeros((len(battery_design_dictionaries), len(entries)))
+    for idx, design_dict in enumerate(battery_design_dictionaries.values()):
+        updated_act = update_module_formulas(design_dict, process_formula)
+        values[idx] = [updated_act[key] for key in entries.values()]
+    A_tensor = SharedSparsityTensor.from_base(technology_matrix_default.values, list(entries), len(values))
+    A_tensor.set_entries(list(entries), values)
+    return A_tensor
+
+
+def _scenario_parameters(battery_design_dictionary, yield_scenarios, energy_scenarios, project_formulas):
+    """Process yield and energy consumption parameters of all scenarios and the project parameters depending on them
+    as (yield scenario*energy scenario) arrays"""
+    scenario = {}
+    for param, values in yield_scenarios.iterrows():
+        scenario[param] = values.values.astype(float)[:, None]
+    for param, values in energy_scenarios.iterrows():
+        values = values.values.astype(float)[None, :]
+        # Energy consumption is only changed if defined (> 0) in the scenario:
+        scenario[param] = np.where(values > 0, values, battery_design_dictionary.get(param, 0))
+
+    # Project formulas depending (indirectly) on the scenario parameters:
+    formulas = {
+        param: (v["formula"], _formula_names(v["formula"]))
+        for param, v in project_formulas.items()
+        if v["formula"] != 0 and param not in scenario
+    }
+    dependent = set()
+    while True:
+        new = {p for p, (_, names) in formulas.items() if p not in dependent and names & (set(scenario) | dependent)}
+        if not new:
+            break
+        dependent |= new
+    namespace = {**battery_design_dictionary, **scenario}
+    while dependent:
+        ready = [p for p in dependent if not formulas[p][1] & dependent]
+        for param in ready:
+            scenario[param] = eval(formulas[param][0], namespace)
+            namespace[param] = scenario[param]
+        dependent -= set(ready)
+    return scenario
+
+
+def scenario_parameter_dictionaries(
+    battery_design_dictionaries, yield_scenarios, energy_scenarios, project_formulas=None
+):
+    """Design parameters of all designs for each process yield and energy consumption scenario
+
+    Parameters
+    ----------
+    battery_design_dictionaries : dict
+        Design parameters of all designs (e.g. of parameter_dictionary), project formulas must be solved already
+    yield_scenarios : DataFrame
+        Process yield parameters (parameter*yield scenario), e.g. of 4_PY_battery_manufacturing
+    energy_scenarios : DataFrame
+        Energy consumption parameters (parameter*energy scenario), e.g. of 4_PAR_energy_consumption. Only
+        consumptions larger than 0 are changed
+    project_formulas : dict, optional
+        Project parameter amounts and formulas, by default the Brightway project parameter file
+
+    Returns
+    -------
+    dict
+        Design parameters of each (design, yield scenario, energy scenario)
+    """
+    if project_formulas is None:
+        project_formulas = project_parameters_brightway()
+    output = {}
+    for design, design_dict in battery_design_dictionaries.items():
+        scenario = _scenario_parameters(design_dict, yield_scenarios, energy_scenarios, project_formulas)
+        scenario = {
+            k: np.broadcast_to(v, (len(yield_scenarios.columns), len(energy_scenarios.columns)))
+            for k, v in scenario.items()
+        }
+        for y_idx, y in enumerate(yield_scenarios.columns):
+            for e_idx, e in enumerate(energy_scenarios.columns):
+                output[(design, y, e)] = {
+                    **design_dict,
+                    **{k: float(v[y_idx, e_idx]) for k, v in scenario.items()},
+                }
+    return output
+
+
+def calculate_modular_A_scenarios(
+    technology_matrix_default,
+    battery_design_dictionaries,
+    yield_scenarios,
+    energy_scenarios,
+    project_formulas=None,
+    tensor=False,
+):
+    """Technology matrices of all designs for each process yield and energy consumption scenario.
+
+    The process formulas are evaluated once per design, only the formulas depending on the scenario parameters are
+    evaluated for all scenarios at once.
+
+    Parameters
+    ----------
+    technology_matrix_default : pd DataFrame
+        Default A matrix
+    battery_design_dictionaries : dict
+        Design parameters of all designs (e.g. of parameter_dictionary), project formulas must be solved already
+    yield_scenarios : DataFrame
+        Process yield parameters (parameter*yield scenario), e.g. of 4_PY_battery_manufacturing
+    energy_scenarios : DataFrame
+        Energy consumption parameters (parameter*energy scenario), e.g. of 4_PAR_energy_consumption. Only
+        consumptions larger than 0 are changed
+    project_formulas : dict, optional
+        Project parameter amounts and formulas, by default the Brightway project parameter file
+    tensor : bool, optional
+        Returns a SharedSparsityTensor of which only the formula entries are stored per matrix, by default False
+
+    Returns
+    -------
+    Numpy array or SharedSparsityTensor
+        Technology matrices (design*yield scenario*energy scenario*product*module), the tensor has the matrices of all
+        (design, yield scenario, energy scenario) in this order as first axis
+    """
+    if project_formulas is None:
+        project_formulas = project_parameters_brightway()
+    entries = _formula_entries(technology_matrix_default)
+    process_formula = _process_formulas()
+    stack_shape = (len(battery_design_dictionaries), len(yield_scenarios.columns), len(energy_scenarios.columns))
+    # Values of the formula entries, all other entries are equal to the default matrix:
+    values = np.zeros(stack_shape + (len(entries),))
+    for idx, design_dict in enumerate(battery_design_dictionaries.values()):
+        updated_act = update_module_formulas(design_dict, process_formula)
+        values[idx] = [updated_act[key] for key in entries.values()]
+        scenario = _scenario_parameters(design_dict, yield_scenarios, energy_scenarios, project_formulas)
+        namespace = {**design_dict, **scenario}
+        for position, key in enumerate(entries.values()):
+            if not _formula_names(process_formula[key]["formula"]) & set(scenario):
+                continue
+            amount = eval(process_formula[key]["formula"], namespace)
+            if process_formula[key]["material_group"] != "reference product":
+                amount = -amount
+            values[idx, :, :, position] = amount
+    if tensor:
+        A_tensor = SharedSparsityTensor.from_base(technology_matrix_default.values, list(entries), values[..., 0].size)
+        A_tensor.set_entries(list(entries), values.reshape(-1, len(entries)))
+        return A_tensor
+    A_scenarios = np.repeat(technology_matrix_default.values.astype(float)[None], values[..., 0].size, axis=0)
+    A_scenarios = A_scenarios.reshape(stack_shape + technology_matrix_default.shape)
+    product_index, process_index = np.array(list(entries)).T
+    A_scenarios[..., product_index, process_index] = values
+    return A_scenarios
+
+
+def get_emissions_modular_matrix(
+    A_base, A_matrix_design, modular_emissions, return_vector=False, processes=None, method="lu"
+):
     """Emissions of modular numpy matrix
 
     Parameters
     ----------
     A_default : Dataframe
         Default technology matrix
-    A_matrix_design : Numpy array
-        Technology matrix of specific battery design (product*module)
+    A_matrix_design : Numpy array or SharedSparsityTensor
+        Technology matrix of specific battery design (product*module), or a stack of technology matrices (e.g.
+        design*yield scenario*energy scenario*product*module of calculate_modular_A_scenarios)
     modular_emissions : Numpy array
         Vector of module emissions (impact category*module)
     return_vector : bool, optional
         Returns emissions in matrix format (product*module), by default False
+    processes : list, optional
+        Positions of the selected modules (e.g. one region specific energy module), by default all modules
+    method : str, optional
+        Solver of the scaling vector, see scaling_solver.scaling_vectors, by default 'lu'
 
     Returns
     -------
     float
-        Emission of system
+        Emission of system, array of the stacked technology matrices
     """
-    pack_idx = A_base.index.get_loc("battery pack")
-    assembly_idx = A_base.columns.get_loc("module and pack assembly")
-    pack_weight = A_matrix_design[pack_idx, assembly_idx]
-    # Inverse the A' matrix:
-    A_inv = np.linalg.pinv(A_matrix_design)
-
-    # Establish final product demand vector for 1 battery based on pack weight
-    y_prime = np.zeros(len(A_base.index))
-    y_prime[pack_idx] = pack_weight
-
-    # Calculate scaling vector:
-    s_prime = A_inv.dot(y_prime)
+    s_prime = modular_scaling_vector(A_base, A_matrix_design, processes=processes, method=method)
 
     if return_vector is False:
         h = s_prime.dot(modular_emissions)
@@ -693,6 +929,50 @@ def get_emissions_modular_matrix(A_base, A_matrix_design, modular_emissions, ret
     return h
 
 
+def modular_scaling_vector(A_base, A_matrix_design, processes=None, method="lu", return_diagnostics=False):
+    """Scaling vector of one battery pack (pack weight as final demand of battery pack)
+
+    Parameters
+    ----------
+    A_base : Dataframe
+        Default technology matrix
+    A_matrix_design : Numpy array or SharedSparsityTensor
+        Technology matrix of specific battery design (product*module), or a stack of technology matrices
+    processes : list, optional
+        Positions of the selected modules, the selection must be square for an exact solve. By default all modules
+        (minimum norm least squares solution as with the pseudo inverse)
+    method : str, optional
+        Solver of the scaling vector, see scaling_solver.scaling_vectors, by default 'lu'. The 'woodbury' method
+        factorises A_base once and updates the columns of the parameterised modules for each design
+    return_diagnostics : bool, optional
+        Returns the condition and residual of the solved systems, by default False
+
+    Returns
+    -------
+    Numpy array, (dict)
+        Scaling vector (module), or (stack*module). Modules that are not selected are zero
+    """
+    pack_idx = A_base.index.get_loc("battery pack")
+    assembly_idx = A_base.columns.get_loc("module and pack assembly")
+    if isinstance(A_matrix_design, SharedSparsityTensor):
+        entry = A_matrix_design.entry_index(pack_idx, assembly_idx)
+        pack_weight = A_matrix_design.values[:, entry] if entry is not None else np.zeros(len(A_matrix_design))
+    else:
+        pack_weight = np.asarray(A_matrix_design[..., pack_idx, assembly_idx])
+
+    # Final product demand vector for 1 battery based on pack weight, only the battery pack is demanded:
+    demand = np.zeros(pack_weight.shape + (len(A_base.index),))
+    demand[..., pack_idx] = pack_weight
+    return scaling_vectors(
+        A_matrix_design,
+        demand,
+        processes=processes,
+        method=method,
+        base_matrix=A_base.values,
+        return_diagnostics=return_diagnostics,
+    )
+
+
 def parameter_dictionary(
     material_content_battery,
     process_parameters,
@@ -710,7 +990,7 @@ def parameter_dictionary(
         rel_path = "data/bw_default_project_parameters.xlsx"
         parent = (Path(__file__)).parents[0]
         path = parent / rel_path
-        df = pd.read_excel(path, index_col=0).fillna(0)
+        df = data_cache.read_excel(path, index_col=0).fillna(0)
         df.T.to_dict()
         project_formulas = project_formulas
     else:
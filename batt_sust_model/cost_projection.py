@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+
+from .battery_cost import default_cost_model
+
+
+def experience_curve(cumulative_production, learning_rate):
+    """Cost multiplier of an experience curve, (cumulative production / first cumulative production) ** b with
+    b = log2(1 - learning rate), i.e. the cost decreases by the learning rate with each doubling of production
+
+    Parameters
+    ----------
+    cumulative_production : Series or DataFrame
+        Cumulative production (e.g. GWh) by year, or (year*component)
+    learning_rate : float or Series
+        Cost reduction per doubling of the cumulative production, or per component
+
+    Returns
+    -------
+    Series or DataFrame
+        Cost multiplier relative to the first year
+    """
+    return (cumulative_production / cumulative_production.iloc[0]) ** np.log2(1 - learning_rate)
+
+
+def project_pack_cost(
+    technology_matrix,
+    price_material_mass,
+    price_material_unit,
+    factor_prices,
+    system_design_parameters,
+    scaling_vectors,
+    process_columns,
+    material_rows,
+    cumulative_production,
+    learning_rates,
+    capacity_growth=None,
+    material_classes=None,
+    unit_material_to_process_mapping=None,
+    cost_model=None,
+):
+    """Projects the pack cost of all designs over the deployment years with experience curves and plant scale growth.
+
+    The material prices of each material class and the factor prices follow experience curves of the cumulative
+    production. The manufacturing capacity of each design grows with capacity_growth, which changes the material and
+    factor requirement per pack with the power laws of the P values (see CostModel.capacity_cost_quantities). All
+    designs and years are calculated in one pass.
+
+    Parameters
+    ----------
+    technology_matrix : Numpy array
+        Nested technology matrix (design*material*process)
+    price_material_mass : Series
+        Mass prices of materials/energy in the first year
+    price_material_unit : dict
+        Unit prices of materials in the first year
+    factor_prices : dict
+        Price of labour, capital and land in the first year
+    system_design_parameters : dict
+        Battery design parameters of all designs, including the manufacturing capacity in the first year
+    scaling_vectors : Numpy array
+        Scaling vector (design*process) of one battery pack per design
+    process_columns : list
+        Process column order
+    material_rows : list
+        Material/energy index order
+    cumulative_production : Series or DataFrame
+        Cumulative production by year (e.g. GWh), or (year*component) for component specific experience
+    learning_rates : dict
+        Learning rate (cost reduction per doubling of the cumulative production) of material classes and factors,
+        components without learning rate keep their first year prices
+    capacity_growth : Series, optional
+        Manufacturing capacity by year relative to the design capacity, by default constant capacity
+    material_classes : dict, optional
+        Material class and list of materials, materials without class are 'other materials'. By default one class
+        'material' of all materials
+    unit_material_to_process_mapping : dict, optional
+        Receiving process of the unit cost materials, by default None and based on the first technology matrix
+    cost_model : CostModel, optional
+        Cost parameters, by default the default cost parameters
+
+    Returns
+    -------
+    list, Numpy array
+        Cost components (material classes and factors) and the pack cost (design*year*component), years in the order
+        of cumulative_production
+    """
+    if cost_model is None:
+        cost_model = default_cost_model
+    if material_classes is None:
+        material_classes = {"material": list(material_rows)}
+    years = cumulative_production.index
+    if capacity_growth is None:
+        capacity_growth = pd.Series(1.0, index=years)
+    capacity = np.array([design["battery_manufacturing_capacity"] for design in system_design_parameters.values()])
+    capacities = capacity[:, None] * capacity_growth.reindex(years).values.astype(float)[None, :]
+    quantities = cost_model.capacity_cost_quantities(
+        technology_matrix,
+        price_material_unit,
+        system_design_parameters,
+        scaling_vectors,
+        capacities,
+        process_columns,
+        material_rows,
+        unit_material_to_process_mapping=unit_material_to_process_mapping,
+    )
+
+    # Material class of each material row (material*class):
+    classes = list(material_classes)
+    material_class = pd.DataFrame(0.0, index=material_rows, columns=classes)
+    for material_class_name, materials in material_classes.items():
+        material_class.loc[materials, material_class_name] = 1
+    unassigned = material_class.sum(axis=1) == 0
+    if unassigned.any():
+        classes.append("other materials")
+        material_class["other materials"] = unassigned.astype(float)
+    material_class = material_class.values
+    row = {material: idx for idx, material in enumerate(material_rows)}
+    entry_class = material_class[[row[m] for m, _ in quantities["entries"]]]
+
+    # Pack cost by component in the first year prices (design*year*component):
+    price_mass = price_material_mass.reindex(material_rows).fillna(0).values.astype(float)
+    price_unit = np.array([price_material_unit[m][parameter] for m, parameter in quantities["entries"]], dtype=float)
+    material_cost = np.einsum("dtg, gc -> dtc", quantities["material"] * price_mass, material_class)
+    material_cost += np.einsum("dtj, jc -> dtc", quantities["unit"] * price_unit, entry_class)
+    factors = quantities["factors"]
+    factor_overhead = cost_model.factor_overhead_multiplier(factors)
+    factor_weights = np.array([factor_prices[f] * factor_overhead[f] for f in factors], dtype=float)
+    cost = np.concatenate(
+        [material_cost * cost_model.material_overhead_multiplier(), quantities["factor"] * factor_weights], axis=2
+    )
+
+    # Experience curve of each component (year*component):
+    components = classes + factors
+    if isinstance(cumulative_production, pd.DataFrame):
+        cumulative_production = cumulative_production.reindex(columns=components)
+    else:
+        cumulative_production = pd.DataFrame({c: cumulative_production for c in components})
+    rates = pd.Series({c: learning_rates.get(c, 0) for c in components}, dtype=float)
+    multiplier = experience_curve(cumulative_production, rates).fillna(1).values
+    return components, cost * multiplier[None]
@@ -0,0 +1,212 @@
+import numpy as np
+import pandas as pd
+
+from .battery_cost import default_cost_model, overhead_multipliers
+
+
+def sample_inputs(distributions, n_samples, seed=None, latin_hypercube=False):
+    """Samples the uncertain cost inputs from their distributions
+
+    Parameters
+    ----------
+    distributions : dict
+        Input name and distribution with an inverse cumulative distribution function 'ppf' (e.g. a frozen
+        scipy.stats distribution). Names as in PackCostUncertainty: 'price:<material>',
+        'unit_price:<material>:<parameter>', 'factor_price:<factor>' or the name of a cost rate
+    n_samples : int
+        Number of samples
+    seed : int, optional
+        Random seed, by default None
+    latin_hypercube : bool, optional
+        Latin hypercube sampling (one sample per equal probability interval of each input), by default False
+
+    Returns
+    -------
+    DataFrame
+        Sampled inputs (sample*input)
+    """
+    rng = np.random.default_rng(seed)
+    names = list(distributions)
+    if latin_hypercube:
+        strata = np.array([rng.permutation(n_samples) for _ in names]).T
+        probabilities = (strata + rng.random((n_samples, len(names)))) / n_samples
+    else:
+        probabilities = rng.random((n_samples, len(names)))
+    return pd.DataFrame(
+        {name: distributions[name].ppf(probabilities[:, idx]) for idx, name in enumerate(names)},
+        index=range(n_samples),
+        columns=names,
+    )
+
+
+class PackCostUncertainty:
+    """Monte Carlo pack cost of many designs for uncertain material prices, unit prices, factor prices and cost rates.
+
+    The pack cost is linear in the prices (see CostModel.cost_quantities), so the cost of a chunk of designs for all
+    samples is one matrix product of the price independent quantities and the sampled prices. Designs are evaluated
+    in chunks and only the summary statistics are kept, the memory is bounded by max_chunk_elements.
+
+    Args:
+        quantities (dict): price independent quantities of all designs, output of CostModel.cost_quantities
+        price_material_mass (Series): base mass prices of materials/energy
+        price_material_unit (dict): base unit prices of materials
+        factor_prices (dict): base price of labour, capital and land
+        cost_model (CostModel): model of the base cost rates, by default the default cost parameters
+    """
+
+    def __init__(self, quantities, price_material_mass, price_material_unit, factor_prices, cost_model=None):
+        if cost_model is None:
+            cost_model = default_cost_model
+        self.designs = quantities["material"].index
+        self.materials = quantities["material"].columns.to_list()
+        self.unit_entries = quantities["unit"].columns.to_list()
+        self.factors = quantities["factor"].columns.to_list()
+        self.material_quantity = quantities["material"].values
+        self.unit_quantity = quantities["unit"].values
+        self.factor_quantity = quantities["factor"].values
+        self.price_material_mass = price_material_mass.reindex(self.materials).fillna(0).values.astype(float)
+        self.price_material_unit = np.array(
+            [price_material_unit[material][parameter] for material, parameter in self.unit_entries], dtype=float
+        )
+        self.factor_prices = np.array([factor_prices[f] for f in self.factors], dtype=float)
+        self.cost_rates = dict(cost_model.cost_rates)
+        # Material cost of all designs at the base prices, without overhead:
+        self.base_material_cost = (
+            self.material_quantity @ self.price_material_mass + self.unit_quantity @ self.price_material_unit
+        )
+
+    def _columns(self, samples):
+        """Sampled mass price and unit price columns and the factor prices, cost rates of all samples"""
+        mass, unit = [], []
+        factor_prices = np.repeat(self.factor_prices[None], len(samples), axis=0)
+        cost_rates = dict(self.cost_rates)
+        material = {m: idx for idx, m in enumerate(self.materials)}
+        entry = {e: idx for idx, e in enumerate(self.unit_entries)}
+        for name in samples.columns:
+            values = samples[name].values.astype(float)
+            if name.startswith("price:") and name[6:] in material:
+                mass.append((material[name[6:]], values))
+            elif name.startswith("unit_price:") and tuple(name[11:].rsplit(":", 1)) in entry:
+                unit.append((entry[tuple(name[11:].rsplit(":", 1))], values))
+            elif name.startswith("factor_price:") and name[13:] in self.factors:
+                factor_prices[:, self.factors.index(name[13:])] = values
+            elif name in cost_rates:
+                cost_rates[name] = values
+            else:
+                raise ValueError(f"Input {name} is not defined")
+        return mass, unit, factor_prices, cost_rates
+
+    def iter_cost(self, samples, chunk_size=None, max_chunk_elements=10**7):
+        """Pack cost of chunks of designs for all samples
+
+        Parameters
+        ----------
+        samples : DataFrame
+            Sampled inputs (sample*input), e.g. of sample_inputs
+        chunk_size : int, optional
+            Number of designs per chunk, by default based on max_chunk_elements
+        max_chunk_elements : int, optional
+            Maximum number of design*sample costs per chunk, by default 10**7
+
+        Yields
+        ------
+        slice, Numpy array
+            Design positions and pack cost (design*sample) of the chunk
+        """
+        mass, unit, factor_prices, cost_rates = self._columns(samples)
+        multipliers = overhead_multipliers(cost_rates)
+        material_overhead = np.broadcast_to(multipliers["material"], (len(samples),))
+        factor_weights = factor_prices * np.column_stack(
+            [np.broadcast_to(multipliers[f], (len(samples),)) for f in self.factors]
+        )
+        # Change of the sampled prices relative to the base prices:
+        mass_idx = [idx for idx, _ in mass]
+        unit_idx = [idx for idx, _ in unit]
+        mass_change = np.zeros((len(mass), len(samples)))
+        for row, (idx, values) in enumerate(mass):
+            mass_change[row] = values - self.price_material_mass[idx]
+        unit_change = np.zeros((len(unit), len(samples)))
+        for row, (idx, values) in enumerate(unit):
+            unit_change[row] = values - self.price_material_unit[idx]
+        if chunk_size is None:
+            chunk_size = max(1, max_chunk_elements // max(len(samples), 1))
+        for start in range(0, len(self.designs), chunk_size):
+            chunk = slice(start, min(start + chunk_size, len(self.designs)))
+            material_cost = self.base_material_cost[chunk, None] + (
+                self.material_quantity[chunk][:, mass_idx] @ mass_change
+                + self.unit_quantity[chunk][:, unit_idx] @ unit_change
+            )
+            yield chunk, material_cost * material_overhead + self.factor_quantity[chunk] @ factor_weights.T
+
+    def pack_cost(self, samples, chunk_size=None, max_chunk_elements=10**7):
+        """Pack cost of all designs for each sample, e.g. a price time series
+
+        Parameters
+        ----------
+        samples : DataFrame
+            Inputs (sample*input), e.g. cam_price_series(...).add_prefix('price:') for the pack cost of each month
+        chunk_size : int, optional
+            Number of designs per chunk, by default based on max_chunk_elements
+        max_chunk_elements : int, optional
+            Maximum number of design*sample costs per chunk, by default 10**7
+
+        Returns
+        -------
+        DataFrame
+            Pack cost (sample*design)
+        """
+        cost = np.zeros((len(samples), len(self.designs)))
+        for chunk, chunk_cost in self.iter_cost(samples, chunk_size, max_chunk_elements):
+            cost[:, chunk] = chunk_cost.T
+        return pd.DataFrame(cost, index=samples.index, columns=self.designs)
+
+    def summary(self, samples, quantiles=(0.05, 0.5, 0.95), chunk_size=None, max_chunk_elements=10**7):
+        """Mean, standard deviation and quantiles of the pack cost of each design
+
+        Parameters
+        ----------
+        samples : DataFrame
+            Sampled inputs (sample*input), e.g. of sample_inputs
+        quantiles : tuple, optional
+            Quantiles of the pack cost, by default 5%, 50% and 95%
+        chunk_size : int, optional
+            Number of designs per chunk, by default based on max_chunk_elements
+        max_chunk_elements : int, optional
+            Maximum number of design*sample costs per chunk, by default 10**7
+
+        Returns
+        -------
+        DataFrame
+            Pack cost statistics per design
+        """
+        statistics = np.zeros((len(self.designs), 2 + len(quantiles)))
+        for chunk, cost in self.iter_cost(samples, chunk_size, max_chunk_elements):
+            statistics[chunk, 0] = cost.mean(axis=1)
+            statistics[chunk, 1] = cost.std(axis=1, ddof=1) if cost.shape[1] > 1 else 0
+            statistics[chunk, 2:] = np.quantile(cost, quantiles, axis=1).T
+        return pd.DataFrame(statistics, index=self.designs, columns=["mean", "std"] + [f"q{q:g}" for q in quantiles])
+
+
+def monte_carlo_pack_cost(
+    quantities,
+    price_material_mass,
+    price_material_unit,
+    factor_prices,
+    distributions,
+    n_samples,
+    seed=None,
+    latin_hypercube=False,
+    quantiles=(0.05, 0.5, 0.95),
+    cost_model=None,
+    max_chunk_elements=10**7,
+):
+    """Samples the uncertain inputs and returns the pack cost statistics of all designs, see PackCostUncertainty
+
+    Returns
+    -------
+    DataFrame
+        Mean, standard deviation and quantiles of the pack cost per design
+    """
+    samples = sample_inputs(distributions, n_samples, seed=seed, latin_hypercube=latin_hypercube)
+    uncertainty = PackCostUncertainty(quantities, price_material_mass, price_material_unit, factor_prices, cost_model)
+    return uncertainty.summary(samples, quantiles=quantiles, max_chunk_elements=max_chunk_elements)
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from pathlib import Path
+import pandas as pd
+
+# Version of the cache file layout, cache files of other versions are not used:
+cache_version = 1
+
+
+def cache_directory():
+    """Directory of the cached data files, BATT_SUST_MODEL_CACHE_DIR or the user cache directory of the platform"""
+    if os.environ.get("BATT_SUST_MODEL_CACHE_DIR"):
+        return Path(os.environ["BATT_SUST_MODEL_CACHE_DIR"])
+    if sys.platform == "win32":
+        base = Path(os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local"))
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Caches"
+    else:
+        base = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    return base / "batt_sust_model"
+
+
+def _file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _cache_file(reader, path, kwargs):
+    """Cache file of a source file and the reader arguments"""
+    key = repr((cache_version, pd.__version__, reader, str(path), sorted((k, repr(v)) for k, v in kwargs.items())))
+    return cache_directory() / f"{path.stem}-{hashlib.sha256(key.encode()).hexdigest()[:16]}.pkl"
+
+
+def _write(cache_file, metadata, data):
+    """Writes the metadata and data to the cache file, replaced at once so that parallel processes read complete files"""
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=cache_file.parent, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            pickle.dump(metadata, file, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, cache_file)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def cached_read(reader, path, **kwargs):
+    """Reads a data file with a pandas reader and caches the result as binary (pickle) file in the cache directory.
+
+    The cache is fresh if the modification time and size of the source file are unchanged, or if the source file has
+    the same SHA-256 hash as the cached file (e.g. after a checkout). Otherwise the source file is parsed again. If
+    the cache directory is not writable the source file is parsed without cache.
+
+    Parameters
+    ----------
+    reader : str
+        Pandas reader, 'read_excel' or 'read_csv'
+    path : str or Path
+        Path to the source file
+    kwargs :
+        Arguments of the pandas reader
+
+    Returns
+    -------
+    DataFrame or dict
+        Output of the pandas reader
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    cache_file = _cache_file(reader, path, kwargs)
+    file_hash = None
+    try:
+        with open(cache_file, "rb") as file:
+            metadata = pickle.load(file)
+            fresh = (metadata["mtime_ns"], metadata["size"]) == (stat.st_mtime_ns, stat.st_size)
+            if not fresh:
+                file_hash = _file_hash(path)
+                fresh = metadata["sha256"] == file_hash
+            if fresh:
+                data = pickle.load(file)
+        if fresh:
+            if file_hash is not None:
+                # Same content with a new modification time, only the metadata is updated:
+                _write(cache_file, dict(metadata, mtime_ns=stat.st_mtime_ns, size=stat.st_size), data)
+            return data
+    except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+        pass
+    data = getattr(pd, reader)(path, **kwargs)
+    metadata = {"source": str(path), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    metadata["sha256"] = file_hash if file_hash is not None else _file_hash(path)
+    try:
+        _write(cache_file, metadata, data)
+    except OSError:
+        pass
+    return data
+
+
+def read_excel(path, **kwargs):
+    """pd.read_excel of a file with binary cache, see cached_read"""
+    return cached_read("read_excel", path, **kwargs)
+
+
+def read_csv(path, **kwargs):
+    """pd.read_csv of a file with binary cache, see cached_read"""
+    return cached_read("read_csv", path, **kwargs)
+
+
+def clear_cache():
+    """Removes all cached data files"""
+    for cache_file in cache_directory().glob("*.pkl"):
+        cache_file.unlink()
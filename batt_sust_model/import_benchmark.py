@@ -0,0 +1,87 @@
+import json
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+
+default_modules = [
+    "batt_sust_model",
+    "batt_sust_model.battery_cost",
+    "batt_sust_model.cost_uncertainty",
+    "batt_sust_model.cost_projection",
+    "batt_sust_model.sparse_tensor",
+    "batt_sust_model.battery_emissions",
+    "batt_sust_model.battery_design",
+]
+
+# Dependencies that should only be imported by the functions that use them:
+heavy_dependencies = ["brightway2", "bw2data", "bw2io", "xlwings", "matplotlib", "openpyxl", "tabulate", "scipy.optimize"]
+
+_script = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+import_time = time.perf_counter() - start
+print(json.dumps({{"time": import_time, "modules": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def import_time(module, repeat=5):
+    """Import time of a module in new Python interpreters
+
+    Parameters
+    ----------
+    module : str
+        Module name, e.g. 'batt_sust_model.battery_cost'
+    repeat : int, optional
+        Number of interpreters, by default 5
+
+    Returns
+    -------
+    dict
+        Import times (s) and the heavy dependencies imported with the module
+    """
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _script.format(module=module, heavy=heavy_dependencies)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        times.append(result["time"])
+    return {"times": times, "heavy_dependencies": result["modules"]}
+
+
+def benchmark_imports(modules=None, repeat=5):
+    """Import time of the package modules, each measured in new Python interpreters (the time includes numpy and
+    pandas, which every module imports)
+
+    Parameters
+    ----------
+    modules : list, optional
+        Module names, by default the package modules
+    repeat : int, optional
+        Number of interpreters per module, by default 5
+
+    Returns
+    -------
+    DataFrame
+        Mean and minimum import time (ms) and heavy dependencies imported per module
+    """
+    if modules is None:
+        modules = default_modules
+    rows = {}
+    for module in modules:
+        result = import_time(module, repeat=repeat)
+        rows[module] = {
+            "mean_ms": 1000 * float(np.mean(result["times"])),
+            "min_ms": 1000 * float(np.min(result["times"])),
+            "heavy_dependencies": ", ".join(result["heavy_dependencies"]),
+        }
+    return pd.DataFrame(rows).T
+
+
+if __name__ == "__main__":
+    print(benchmark_imports().to_string())
@@ -0,0 +1,362 @@
+import warnings
+from graphlib import TopologicalSorter
+import numpy as np
+import scipy.sparse as sp
+from scipy.linalg import LinAlgWarning, lu_factor, lu_solve
+from scipy.sparse.csgraph import connected_components, maximum_bipartite_matching
+from scipy.sparse.linalg import splu
+
+from .sparse_tensor import SharedSparsityTensor
+
+methods = ["lu", "sparse_lu", "woodbury", "topological", "pinv"]
+
+
+def _least_squares(matrices, demand):
+    """Minimum norm least squares solutions of stacked systems (as with np.linalg.pinv)"""
+    return np.einsum("npg, ng -> np", np.linalg.pinv(matrices), demand)
+
+
+def _lu(matrices, demand):
+    """Batched dense LU solve, singular systems are marked and not solved"""
+    singular = np.zeros(len(matrices), dtype=bool)
+    try:
+        solution = np.linalg.solve(matrices, demand[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        # At least one singular system, the systems are solved one by one:
+        solution = np.zeros(demand.shape[:1] + matrices.shape[2:])
+        for idx in range(len(matrices)):
+            try:
+                solution[idx] = np.linalg.solve(matrices[idx], demand[idx])
+            except np.linalg.LinAlgError:
+                singular[idx] = True
+    singular |= ~np.isfinite(solution).all(axis=1)
+    return solution, singular
+
+
+def _sparse_lu(matrices, demand):
+    """Sparse LU solve of each (csc) system, singular systems are marked and not solved"""
+    singular = np.zeros(len(matrices), dtype=bool)
+    solution = np.zeros((len(matrices), matrices[0].shape[1]))
+    for idx, matrix in enumerate(matrices):
+        try:
+            solution[idx] = splu(matrix).solve(demand[idx])
+        except RuntimeError:
+            singular[idx] = True
+    singular |= ~np.isfinite(solution).all(axis=1)
+    return solution, singular
+
+
+def _factorise(base_matrix):
+    """LU factorisation of the base matrix of the woodbury method, None if the base matrix is singular"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", LinAlgWarning)
+        lu = lu_factor(base_matrix)
+    return lu if np.all(np.diag(lu[0])) else None
+
+
+def _woodbury(matrices, demand, base_matrix, lu):
+    """Solve of matrices that differ from the base matrix in a few columns. The base matrix is factorised once and
+    the changed columns are a low-rank update of each system (Sherman-Morrison-Woodbury):
+
+    (B + U E^T)^-1 y = x0 - B^-1 U (I + E^T B^-1 U)^-1 E^T x0, with x0 = B^-1 y
+
+    U are the differences of the changed columns and E selects the changed columns. The solve of each system is a
+    (column*column) system instead of the (product*product) system. Singular systems are marked and not solved
+    """
+    if lu is None:
+        # Singular base matrix, no low-rank update:
+        return _lu(matrices, demand)
+    x0 = lu_solve(lu, demand.T).T
+    difference = matrices != base_matrix
+    columns = np.flatnonzero(difference.any(axis=(0, 1)))
+    rows = np.flatnonzero(difference.any(axis=(0, 2)))
+    if not columns.size:
+        return x0, ~np.isfinite(x0).all(axis=1)
+    # Changed columns of each matrix, only the rows with changes (design*row*column):
+    update = matrices[:, rows[:, None], columns] - base_matrix[rows[:, None], columns]
+    # Rows of the changed columns of the base inverse (E^T B^-1):
+    selection = np.zeros((len(base_matrix), len(columns)))
+    selection[columns, np.arange(len(columns))] = 1
+    inverse_rows = lu_solve(lu, selection, trans=1).T[:, rows]
+    capacitance = np.eye(len(columns)) + np.einsum("kr, nrj -> nkj", inverse_rows, update, optimize=True)
+    correction, singular = _lu(capacitance, x0[:, columns])
+    low_rank = np.zeros((len(base_matrix), len(matrices)))
+    low_rank[rows] = np.einsum("nrk, nk -> rn", update, correction)
+    solution = x0 - lu_solve(lu, low_rank).T
+    singular |= ~np.isfinite(solution).all(axis=1)
+    return solution, singular
+
+
+def block_triangular_order(pattern):
+    """Block triangular form of a square sparsity pattern (product*process), e.g. of a technology matrix that is
+    mostly acyclic (materials -> components -> cell -> module -> pack).
+
+    Each product is matched to a producing process (nonzero diagonal), the strongly connected components of the
+    matched system are the blocks (feedback loops) and the blocks are ordered topologically, so that each block only
+    depends on blocks before it
+
+    Parameters
+    ----------
+    pattern : Numpy array or sparse matrix
+        Square (product*process) sparsity pattern
+
+    Returns
+    -------
+    Numpy array, list
+        Matched process of each product and the blocks (product positions) in solve order. None if the pattern is
+        structurally singular (no matching of all products)
+    """
+    pattern = sp.csr_matrix(pattern, dtype=bool)
+    match = maximum_bipartite_matching(pattern, perm_type="column")
+    if (match < 0).any():
+        return None
+    # Product i depends on the products of the (nonzero) processes of row i:
+    matched = pattern[:, match].tocoo()
+    n_blocks, labels = connected_components(matched, directed=True, connection="strong")
+    dependencies = {block: set() for block in range(n_blocks)}
+    edges = labels[matched.row] != labels[matched.col]
+    for block, dependency in zip(labels[matched.row][edges], labels[matched.col][edges]):
+        dependencies[block].add(dependency)
+    blocks = [np.flatnonzero(labels == block) for block in TopologicalSorter(dependencies).static_order()]
+    return match, blocks
+
+
+def _block_entries(rows, columns, order):
+    """Nonzero entries (row, column) of the diagonal block and the off-diagonal entries of each block of the block
+    triangular order, as positions in the nonzero entries"""
+    match, blocks = order
+    product = np.argsort(match)  # Product matched to each process
+    entries = []
+    for block in blocks:
+        in_rows = np.isin(rows, block)
+        in_block = in_rows & np.isin(columns, match[block])
+        diagonal = np.flatnonzero(in_block)
+        off_diagonal = np.flatnonzero(in_rows & ~in_block)
+        off_row = np.searchsorted(block, rows[off_diagonal])
+        entries.append(
+            {
+                "products": block,
+                "diagonal": diagonal,
+                "diagonal_row": np.searchsorted(block, rows[diagonal]),
+                "diagonal_column": np.searchsorted(block, product[columns[diagonal]]),
+                "off_diagonal": off_diagonal,
+                "off_diagonal_product": product[columns[off_diagonal]],
+                # Sum of the off-diagonal entries per block row (block row*entry):
+                "off_diagonal_rows": sp.csr_matrix(
+                    (np.ones(len(off_diagonal)), (off_row, np.arange(len(off_diagonal)))),
+                    shape=(len(block), len(off_diagonal)),
+                ),
+            }
+        )
+    return entries
+
+
+def _topological(values, demand, match, block_entries):
+    """Block back-substitution of the block triangular form (see block_triangular_order) with the values (system*nnz)
+    of the nonzero entries only. Singular systems are marked and not solved"""
+    # Solution of each product (the scaling of its matched process):
+    solution = np.zeros(demand.shape)
+    singular = np.zeros(len(values), dtype=bool)
+    for entries in block_entries:
+        products = entries["products"]
+        rhs = demand[:, products]
+        if entries["off_diagonal"].size:
+            # Products of the processes that the block depends on are solved already:
+            contribution = values[:, entries["off_diagonal"]] * solution[:, entries["off_diagonal_product"]]
+            rhs = rhs - (entries["off_diagonal_rows"] @ contribution.T).T
+        block = np.zeros((len(values), len(products), len(products)))
+        block[:, entries["diagonal_row"], entries["diagonal_column"]] = values[:, entries["diagonal"]]
+        if len(products) == 1:
+            diagonal = block[:, 0, 0]
+            singular |= diagonal == 0
+            solution[:, products[0]] = rhs[:, 0] / np.where(diagonal == 0, 1, diagonal)
+        else:
+            solution[:, products], block_singular = _lu(block, rhs)
+            singular |= block_singular
+    # Scaling vector in the process order:
+    scaling = np.zeros(solution.shape)
+    scaling[:, match] = solution
+    singular |= ~np.isfinite(scaling).all(axis=1)
+    return scaling, singular
+
+
+def _dense(technology_matrices, systems, processes):
+    """Dense matrices (system*product*selected process) of a slice or positions of the systems"""
+    matrices = technology_matrices[systems]
+    if isinstance(matrices, SharedSparsityTensor):
+        matrices = matrices.todense()
+    return matrices if len(processes) == matrices.shape[2] else matrices[:, :, processes]
+
+
+def _sparse(technology_matrices, systems, processes):
+    """Sparse (csc) matrices of the selected processes of a slice of the systems"""
+    if isinstance(technology_matrices, SharedSparsityTensor):
+        systems = range(len(technology_matrices))[systems]
+        return [technology_matrices.design_matrix(idx, "csc")[:, processes] for idx in systems]
+    return [sp.csc_matrix(matrix[:, processes]) for matrix in technology_matrices[systems]]
+
+
+def _product(technology_matrices, systems, processes, solution):
+    """A s of a slice of the systems, only the nonzero entries of a SharedSparsityTensor are used"""
+    scaling = np.zeros((len(solution), technology_matrices.shape[-1]))
+    scaling[:, processes] = solution
+    if isinstance(technology_matrices, SharedSparsityTensor):
+        return technology_matrices[systems].einsum("dgp, dp -> dg", scaling)
+    return np.einsum("ngp, np -> ng", technology_matrices[systems], scaling)
+
+
+def _matrix_norm(technology_matrices, systems, processes):
+    """1-norm (maximum absolute column sum) of the selected processes of a slice of the systems"""
+    if isinstance(technology_matrices, SharedSparsityTensor):
+        matrices = technology_matrices[systems]
+        absolute = SharedSparsityTensor(matrices.rows, matrices.columns, np.abs(matrices.values), matrices.matrix_shape)
+        return absolute.sum(axis=1)[:, processes].max(axis=1)
+    return np.abs(technology_matrices[systems]).sum(axis=1)[:, processes].max(axis=1)
+
+
+def _unreliable(technology_matrices, systems, processes, solution, demand, condition_limit):
+    """Systems of which the exact solve is not reliable: the relative residual |A s - demand| / |demand| is above the
+    square root of the machine precision, or the condition estimate |A| |s| / |demand| (a lower bound of the condition
+    number) is above the limit, e.g. a nearly singular matrix of which the LU solve did not fail"""
+    demand_norm = np.abs(demand).sum(axis=1)
+    residual = np.abs(_product(technology_matrices, systems, processes, solution) - demand).sum(axis=1)
+    estimate = _matrix_norm(technology_matrices, systems, processes) * np.abs(solution).sum(axis=1)
+    return ~(residual <= np.sqrt(np.finfo(float).eps) * demand_norm) | ~(estimate <= condition_limit * demand_norm)
+
+
+def scaling_vectors(
+    technology_matrices,
+    demand,
+    processes=None,
+    method="lu",
+    base_matrix=None,
+    condition_limit=1e12,
+    chunk_size=1000,
+    return_diagnostics=False,
+):
+    """Scaling vectors of stacked technology matrices (e.g. the nested A matrix of all designs) in one call.
+
+    The selected processes must give square systems (one producing process per product), which are solved exactly.
+    Singular and nearly singular systems (residual or condition estimate check) and non-square selections are solved
+    as minimum norm least squares problem, which is the result of np.linalg.pinv. The systems are solved in chunks, a
+    SharedSparsityTensor is only made dense per chunk (or not at all for the 'sparse_lu' and 'topological' methods).
+
+    Parameters
+    ----------
+    technology_matrices : Numpy array or SharedSparsityTensor
+        Technology matrices (...*product*process), e.g. (design*product*process)
+    demand : Numpy array
+        Final demand (product) of all matrices, or (...*product)
+    processes : list, optional
+        Positions (or boolean mask) of the selected processes, e.g. one region specific energy process. By default
+        all processes
+    method : str, optional
+        'lu' batched dense LU solve, 'sparse_lu' sparse LU decomposition of each matrix, 'woodbury' low-rank update
+        of the factorised base matrix in the columns that differ from the base matrix, 'topological' block
+        back-substitution of the block triangular form (see block_triangular_order) or 'pinv' pseudo inverse of all
+        matrices, by default 'lu'
+    base_matrix : Numpy array, optional
+        Base technology matrix (product*process) of the 'woodbury' method, by default the first matrix
+    condition_limit : float, optional
+        Systems with a condition estimate above the limit are solved as least squares problem, by default 1e12
+    chunk_size : int, optional
+        Number of systems solved at once, by default 1000
+    return_diagnostics : bool, optional
+        Returns the condition number (1-norm, 2-norm for non-square systems), the relative residual
+        |A s - demand| / |demand| and the systems solved as least squares problem, by default False
+
+    Returns
+    -------
+    Numpy array, (dict)
+        Scaling vectors (...*process), processes that are not selected are zero. Diagnostics of each matrix (...)
+    """
+    if method not in methods:
+        raise ValueError(f"Method {method} is not defined, choose from {methods}")
+    sparse = isinstance(technology_matrices, SharedSparsityTensor)
+    stack_shape = technology_matrices.shape[:-2]
+    n_products, n_processes = technology_matrices.shape[-2:]
+    processes = np.arange(n_processes) if processes is None else np.arange(n_processes)[processes]
+    n_systems = int(np.prod(stack_shape))
+    demand = np.broadcast_to(np.asarray(demand, dtype=float), stack_shape + (n_products,)).reshape(n_systems, -1)
+    if not sparse:
+        technology_matrices = np.asarray(technology_matrices, dtype=float).reshape(n_systems, n_products, n_processes)
+    exact = n_products == len(processes) and method != "pinv"
+    chunks = [slice(start, min(start + chunk_size, n_systems)) for start in range(0, n_systems, chunk_size)]
+
+    # Preparation shared by all chunks:
+    if exact and method == "woodbury":
+        if base_matrix is None:
+            base_matrix = _dense(technology_matrices, slice(0, 1), processes)[0]
+        else:
+            base_matrix = np.asarray(base_matrix, dtype=float)[:, processes]
+        lu = _factorise(base_matrix)
+    block_entries = None
+    if exact and method == "topological":
+        if sparse:
+            position = np.full(n_processes, -1)
+            position[processes] = np.arange(len(processes))
+            selected = position[technology_matrices.columns] >= 0
+            entries = np.flatnonzero(selected & (technology_matrices.values != 0).any(axis=0))
+            rows, columns = technology_matrices.rows[entries], position[technology_matrices.columns[entries]]
+        else:
+            pattern = np.zeros((n_products, len(processes)), dtype=bool)
+            for chunk in chunks:
+                pattern |= (_dense(technology_matrices, chunk, processes) != 0).any(axis=0)
+            rows, columns = np.nonzero(pattern)
+        order = block_triangular_order(
+            sp.csr_matrix((np.ones(len(rows), dtype=bool), (rows, columns)), shape=(n_products, len(processes)))
+        )
+        if order is not None:
+            match = order[0]
+            block_entries = _block_entries(rows, columns, order)
+
+    s = np.zeros((n_systems, n_processes))
+    least_squares = np.zeros(n_systems, dtype=bool)
+    if return_diagnostics:
+        condition, relative_residual = np.zeros(n_systems), np.zeros(n_systems)
+    for chunk in chunks:
+        y = demand[chunk]
+        if not exact:
+            solution, chunk_least_squares = np.zeros((len(y), len(processes))), np.ones(len(y), dtype=bool)
+        elif method == "sparse_lu":
+            solution, chunk_least_squares = _sparse_lu(_sparse(technology_matrices, chunk, processes), y)
+        elif method == "topological" and block_entries is not None:
+            if sparse:
+                values = technology_matrices.values[chunk][:, entries]
+            else:
+                values = technology_matrices[chunk][:, rows, processes[columns]]
+            solution, chunk_least_squares = _topological(values, y, match, block_entries)
+        elif method == "woodbury":
+            solution, chunk_least_squares = _woodbury(_dense(technology_matrices, chunk, processes), y, base_matrix, lu)
+        else:
+            # 'lu', and 'topological' of a structurally singular pattern (all systems are marked singular):
+            solution, chunk_least_squares = _lu(_dense(technology_matrices, chunk, processes), y)
+        if exact:
+            solution[chunk_least_squares] = 0
+            chunk_least_squares |= _unreliable(technology_matrices, chunk, processes, solution, y, condition_limit)
+        if chunk_least_squares.any():
+            # Only the least squares systems are made dense:
+            positions = np.arange(chunk.start, chunk.stop)[chunk_least_squares]
+            solution[chunk_least_squares] = _least_squares(
+                _dense(technology_matrices, positions, processes), y[chunk_least_squares]
+            )
+        s[chunk, processes] = solution
+        least_squares[chunk] = chunk_least_squares
+        if return_diagnostics:
+            residual = _product(technology_matrices, chunk, processes, solution) - y
+            relative_residual[chunk] = np.linalg.norm(residual, axis=1) / np.maximum(
+                np.linalg.norm(y, axis=1), np.finfo(float).tiny
+            )
+            condition[chunk] = np.linalg.cond(
+                _dense(technology_matrices, chunk, processes), 1 if n_products == len(processes) else None
+            )
+
+    s = s.reshape(stack_shape + (n_processes,))
+    if not return_diagnostics:
+        return s
+    diagnostics = {
+        "condition": condition.reshape(stack_shape),
+        "residual": relative_residual.reshape(stack_shape),
+        "least_squares": least_squares.reshape(stack_shape),
+    }
+    return s, diagnostics
@@ -0,0 +1,269 @@
+import string
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu
+
+
+class SharedSparsityTensor:
+    """Nested (design*row*column) matrices with the same sparsity pattern for all designs, e.g. the nested technology
+    matrix A, the cost matrix C or the factor matrix F.
+
+    The nonzero pattern (rows and columns of the nnz entries) is stored once and the values as (design*nnz) array, so
+    the memory is proportional to the number of nonzero entries instead of the dense matrix size. The technology
+    matrices are built by battery_emissions.calculate_modular_A_tensor (or calculate_modular_A_scenarios with
+    tensor=True) and accepted by scaling_solver.scaling_vectors, CostModel.material_cost_matrix (which returns the C
+    matrix as tensor) and CostModel.cost_breakdown.
+
+    Args:
+        rows (Numpy array): row index of each nonzero entry
+        columns (Numpy array): column index of each nonzero entry
+        values (Numpy array): values (design*nnz)
+        shape (tuple): matrix shape (rows, columns) of one design
+    """
+
+    def __init__(self, rows, columns, values, shape):
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.columns = np.asarray(columns, dtype=np.int64)
+        self.values = np.asarray(values, dtype=float)
+        if self.values.ndim == 1:
+            self.values = self.values[None]
+        if self.values.shape[1] != len(self.rows) or len(self.rows) != len(self.columns):
+            raise ValueError("The number of values and pattern entries are not equal")
+        self.matrix_shape = tuple(shape)
+        self._indicators = None
+
+    @classmethod
+    def from_dense(cls, nested_matrix, pattern=None):
+        """Shared sparsity tensor of a dense nested array (design*row*column)
+
+        Parameters
+        ----------
+        nested_matrix : Numpy array
+            Nested matrices (design*row*column)
+        pattern : Numpy array, optional
+            Boolean (row*column) sparsity pattern, by default all entries that are nonzero in any design
+
+        Returns
+        -------
+        SharedSparsityTensor
+        """
+        nested_matrix = np.asarray(nested_matrix, dtype=float)
+        if pattern is None:
+            pattern = (nested_matrix != 0).any(axis=0)
+        rows, columns = np.nonzero(pattern)
+        return cls(rows, columns, nested_matrix[:, rows, columns], nested_matrix.shape[1:])
+
+    @classmethod
+    def from_base(cls, base_matrix, entries, n_designs):
+        """Shared sparsity tensor of a base matrix of which a set of entries differs per design (e.g. the formula
+        entries of calculate_modular_A). The values of the entries are set with set_entries.
+
+        Parameters
+        ----------
+        base_matrix : Numpy array or DataFrame
+            Base matrix (row*column), shared by all designs
+        entries : list
+            (row index, column index) of the design specific entries
+        n_designs : int
+            Number of designs
+
+        Returns
+        -------
+        SharedSparsityTensor
+        """
+        base_matrix = np.asarray(base_matrix, dtype=float)
+        pattern = base_matrix != 0
+        for row, column in entries:
+            pattern[row, column] = True
+        rows, columns = np.nonzero(pattern)
+        values = np.repeat(base_matrix[rows, columns][None], n_designs, axis=0)
+        return cls(rows, columns, values, base_matrix.shape)
+
+    @property
+    def shape(self):
+        return (len(self.values),) + self.matrix_shape
+
+    @property
+    def nnz(self):
+        """Number of nonzero entries per design"""
+        return len(self.rows)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.rows.nbytes + self.columns.nbytes
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return f"SharedSparsityTensor(shape={self.shape}, nnz={self.nnz})"
+
+    def entry_index(self, row, column):
+        """Position of the (row, column) entry in the nonzero entries, None if the entry is not in the pattern"""
+        position = np.flatnonzero((self.rows == row) & (self.columns == column))
+        return int(position[0]) if position.size else None
+
+    def set_entries(self, entries, values):
+        """Sets design specific values (design*entry) of pattern entries (row index, column index)"""
+        positions = [self.entry_index(row, column) for row, column in entries]
+        if None in positions:
+            raise ValueError("Entries are not in the sparsity pattern")
+        self.values[:, positions] = values
+
+    def __getitem__(self, designs):
+        """Sparse matrix (csr) of one design, or the tensor of a selection (slice, list or mask) of designs"""
+        if isinstance(designs, (int, np.integer)):
+            return self.design_matrix(designs)
+        return SharedSparsityTensor(self.rows, self.columns, self.values[designs], self.matrix_shape)
+
+    def design_matrix(self, design, format="csr"):
+        """Scipy sparse matrix of a design"""
+        matrix = sp.coo_matrix((self.values[design], (self.rows, self.columns)), shape=self.matrix_shape)
+        return matrix.asformat(format)
+
+    def todense(self, designs=slice(None)):
+        """Dense nested array (design*row*column)"""
+        values = self.values[designs]
+        dense = np.zeros((len(values),) + self.matrix_shape)
+        dense[:, self.rows, self.columns] = values
+        return dense
+
+    def _indicator(self, axis):
+        """Indicator matrix (nnz*row) or (nnz*column) to sum the nonzero entries per row or column"""
+        if self._indicators is None:
+            ones = np.ones(self.nnz)
+            entries = np.arange(self.nnz)
+            self._indicators = (
+                sp.csr_matrix((ones, (entries, self.rows)), shape=(self.nnz, self.matrix_shape[0])),
+                sp.csr_matrix((ones, (entries, self.columns)), shape=(self.nnz, self.matrix_shape[1])),
+            )
+        return self._indicators[axis]
+
+    def _with_values(self, values):
+        return SharedSparsityTensor(self.rows, self.columns, values, self.matrix_shape)
+
+    def _pattern_values(self, other):
+        """Values (design*nnz) of a tensor with the same pattern, a scalar or a dense array broadcastable to the
+        nested shape"""
+        if isinstance(other, SharedSparsityTensor):
+            if not (np.array_equal(other.rows, self.rows) and np.array_equal(other.columns, self.columns)):
+                raise ValueError("The sparsity patterns are not equal")
+            return other.values
+        other = np.asarray(other, dtype=float)
+        if other.ndim == 0:
+            return other
+        return np.broadcast_to(other, self.shape)[:, self.rows, self.columns]
+
+    def __mul__(self, other):
+        return self._with_values(self.values * self._pattern_values(other))
+
+    __rmul__ = __mul__
+
+    def __add__(self, other):
+        return self._with_values(self.values + self._pattern_values(other))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return self._with_values(self.values - self._pattern_values(other))
+
+    def __neg__(self):
+        return self._with_values(-self.values)
+
+    def __truediv__(self, other):
+        return self._with_values(self.values / self._pattern_values(other))
+
+    def sum(self, axis=None):
+        """Sum over the rows (axis=1, design*column), columns (axis=2, design*row) or all entries of each design"""
+        if axis is None:
+            return self.values.sum(axis=1)
+        if axis in (1, -2):
+            return np.asarray(self._indicator(1).T.dot(self.values.T).T)
+        if axis in (2, -1):
+            return np.asarray(self._indicator(0).T.dot(self.values.T).T)
+        raise ValueError(f"Axis {axis} is not supported")
+
+    def einsum(self, subscripts, *operands):
+        """Contraction of the tensor (first operand) with dense operands, as np.einsum on the dense tensor. The
+        contraction is evaluated on the nonzero entries only.
+
+        Parameters
+        ----------
+        subscripts : str
+            Einsum subscripts with explicit output, e.g. 'dgp, dp -> dg' (product with the scaling vectors) or
+            'dgp, dg -> dp'. The tensor subscripts are design, row and column
+        operands : Numpy array
+            Dense operands
+
+        Returns
+        -------
+        Numpy array or SharedSparsityTensor
+            Dense result, or a SharedSparsityTensor if the output subscripts are the tensor subscripts
+        """
+        inputs, output = subscripts.replace(" ", "").split("->")
+        inputs = inputs.split(",")
+        if len(inputs) != len(operands) + 1 or len(inputs[0]) != 3:
+            raise ValueError("The first operand must be the (design*row*column) tensor")
+        design, row, column = inputs[0]
+        entry = next(letter for letter in string.ascii_letters if letter not in subscripts)
+
+        # Dense operands are evaluated at the nonzero entries (rows and columns replaced by the entry axis):
+        entry_inputs = [design + entry]
+        entry_operands = [self.values]
+        for labels, operand in zip(inputs[1:], operands):
+            operand = np.asarray(operand)
+            if row in labels and column in labels:
+                operand = np.moveaxis(operand, [labels.index(row), labels.index(column)], [-2, -1])
+                labels = "".join(x for x in labels if x not in (row, column))
+                operand = operand[..., self.rows, self.columns]
+                labels += entry
+            elif row in labels or column in labels:
+                label, index = (row, self.rows) if row in labels else (column, self.columns)
+                operand = np.take(operand, index, axis=labels.index(label))
+                labels = labels.replace(label, entry)
+            entry_inputs.append(labels)
+            entry_operands.append(operand)
+
+        if output == inputs[0]:
+            return self._with_values(np.einsum(",".join(entry_inputs) + "->" + design + entry, *entry_operands))
+        if row in output and column in output:
+            raise ValueError("Outputs with rows and columns are only supported as tensor (design*row*column)")
+        if row in output or column in output:
+            label, axis = (row, 0) if row in output else (column, 1)
+            entry_output = output.replace(label, entry)
+            result = np.einsum(",".join(entry_inputs) + "->" + entry_output, *entry_operands)
+            # Sum of the entries per row or column:
+            result = np.moveaxis(result, entry_output.index(entry), -1)
+            reduced = self._indicator(axis).T.dot(result.reshape(-1, self.nnz).T).T
+            reduced = np.asarray(reduced).reshape(result.shape[:-1] + (self.matrix_shape[axis],))
+            return np.moveaxis(reduced, -1, output.index(label))
+        return np.einsum(",".join(entry_inputs) + "->" + output, *entry_operands)
+
+    def solve(self, demand, designs=None):
+        """Solves A x = demand for each design with a sparse LU decomposition. Non-square matrices are solved as minimum
+        norm least squares problem, as with the pseudo inverse of get_emissions_modular_matrix
+
+        Parameters
+        ----------
+        demand : Numpy array
+            Demand vector (row) of all designs, or (design*row)
+        designs : list, optional
+            Designs positions, by default all designs
+
+        Returns
+        -------
+        Numpy array
+            Solution (design*column)
+        """
+        if designs is None:
+            designs = range(len(self))
+        designs = list(designs)
+        demand = np.broadcast_to(np.asarray(demand, dtype=float), (len(designs), self.matrix_shape[0]))
+        solution = np.zeros((len(designs), self.matrix_shape[1]))
+        square = self.matrix_shape[0] == self.matrix_shape[1]
+        for idx, design in enumerate(designs):
+            if square:
+                solution[idx] = splu(self.design_matrix(design, "csc")).solve(demand[idx])
+            else:
+                solution[idx] = np.linalg.lstsq(self.design_matrix(design).toarray(), demand[idx], rcond=1e-15)[0]
+        return solution